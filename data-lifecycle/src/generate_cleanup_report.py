@@ -8,6 +8,7 @@ import csv
 import hashlib
 import html
 import json
+import os
 from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
@@ -71,6 +72,11 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--report-url", help="Authenticated browser URL included in report summaries")
     parser.add_argument("--data-explorer-url", default="https://data-explorer.braingeneers.gi.ucsc.edu")
     parser.add_argument("--as-of", help="UTC date/time for reproducible reports")
+    parser.add_argument(
+        "--inventory-cache-dir",
+        default=os.getenv("INVENTORY_CACHE_DIR") or None,
+        help="Canonical Parquet inventory cache shared with Stage 3",
+    )
     return parser.parse_args()
 
 
@@ -632,7 +638,11 @@ def main(args: argparse.Namespace) -> None:
     if generated_at.tzinfo is None:
         generated_at = generated_at.replace(tzinfo=timezone.utc)
 
-    local, glacier, _bad_keys = load_inventories(args.local_inventory, args.glacier_inventory)
+    local, glacier, _bad_keys = load_inventories(
+        args.local_inventory,
+        args.glacier_inventory,
+        cache_dir=args.inventory_cache_dir,
+    )
     local = apply_last_modified_updates(local, config)
     glacier = apply_last_modified_updates(
         glacier,
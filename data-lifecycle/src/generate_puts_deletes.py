@@ -1,27 +1,78 @@
 import argparse
 import json
-import math
+import multiprocessing
 import os
 import re
 import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import yaml
 from badkeys import make_badkey_record, write_badkeys_tsv
 from datetime import datetime, timedelta, timezone
-from stage4_keys import normalize_bucket_object_key
+from inventory_cache import (
+    inventory_cache_available,
+    inventory_cache_path,
+    read_inventory_cache,
+    source_content_hash,
+    write_inventory_cache,
+)
+from inventory_diff import diff_inventories
+from stage3_artifacts import write_csv_artifact
+from stage3_profile import PHASE_CAPTURE_MODES, PhaseCapture, PhaseProfile, write_stage3_profile
+from stage3_rollups import PREFIX_ROLLUP_TIMESTAMP_COLUMNS, build_prefix_rollups
+from stage3_shards import (
+    ShardResult,
+    ShardTask,
+    merge_key_counts,
+    scatter_column,
+    scatter_masks,
+    shard_rows,
+)
+from stage4_keys import RCLONE_DOT_SEGMENT, normalize_bucket_object_key
 from lifecycle_controls import (
+    AtomicDirectoryIndex,
     apply_effective_last_modified,
     is_retention_marker,
     lifecycle_control_mask,
     marker_upload_mask,
-    normalize_atomic_directories,
-    scientific_inventory,
 )
 from urllib.parse import unquote
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - the runtime image ships pyarrow
+    pa = None
+    pc = None
+
 CONTROL_CHAR_PATTERN = re.compile(r'[\x00-\x1F\x7F\u2400-\u2426]')
+MULTIPLE_SLASHES = re.compile(r'/{2,}')
+FOLDER_GROUP_PATTERNS = {}
 DEFAULT_PROGRESS_INTERVAL_SECONDS = 60
+DEFAULT_CHUNK_ROWS = 0
+DEFAULT_PROCESSES = 1
+NO_BACKUP_REPORT_PREFIXES = 20
+NANOSECONDS_PER_DAY = 86400 * 10**9
+CLEANUP_WINDOW_SORT_COLUMNS = ['CleanupPhase', 'ScheduledCleanupDate', 'BucketKey']
+CLEANUP_WINDOW_TIMESTAMP_COLUMNS = ('SourceLastModified', 'ScheduledCleanupDate')
+CLEANUP_SUMMARY_TIMESTAMP_COLUMNS = ('EarliestCleanupDate', 'LatestCleanupDate')
+PUTS_MANIFEST_COLUMNS = ['BucketKey', 'Size', 'LastModified', 'AtomicGroup']
+PUTS_MANIFEST_TIMESTAMP_COLUMNS = ('LastModified',)
+NRP_INVENTORY_COLUMNS = ['LastModified', 'BucketKey', 'Size']
+AWS_INVENTORY_COLUMNS = ['Bucket', 'BucketKey', 'Size', 'LastModified', 'StorageClass']
+INVENTORY_CLEANUP_COUNTERS = ('normalized_key_rows', 'prefix_marker_or_empty_rows', 'bad_key_rows')
+# Part of the inventory cache key.  Bump it whenever the loader decodes rows
+# differently (decode_aws_inventory_keys, normalize_bucket_object_key, bad-key
+# splitting, timestamp parsing) so cached canonical inventories are rebuilt.
+INVENTORY_DECODER_VERSION = 1
+# Matches every key key_needs_normalization flags: no slash, a leading slash, a
+# single trailing slash, a whitespace (or other non-printable) first or last
+# character, or text that normalize_bucket_object_key rewrites.
+KEY_NORMALIZATION_CANDIDATE_PATTERN = '|'.join(
+    [r'^/', r'^[^/]*$', r'^[^/]*/$', r'^[^\x21-\x7e]', r'[^\x21-\x7e]$', RCLONE_DOT_SEGMENT, '\r', '\u240d', 's3:/']
+)
 
 
 def read_process_memory_mib():
@@ -39,9 +90,13 @@ def read_process_memory_mib():
 
 
 class Stage3ProgressReporter:
-    def __init__(self, interval_seconds=DEFAULT_PROGRESS_INTERVAL_SECONDS, memory_reader=read_process_memory_mib):
+    def __init__(self,
+                 interval_seconds=DEFAULT_PROGRESS_INTERVAL_SECONDS,
+                 memory_reader=read_process_memory_mib,
+                 capture=None):
         self.interval_seconds = max(0.0, float(interval_seconds))
         self.memory_reader = memory_reader
+        self.profile = PhaseProfile(memory_reader, capture)
         self.started_at = time.monotonic()
         self.phase = 'starting'
         self.stop_event = threading.Event()
@@ -57,10 +112,15 @@ class Stage3ProgressReporter:
     def set_phase(self, phase, **details):
         with self.lock:
             self.phase = phase
+        self.profile.begin(phase, details)
         detail_text = ' '.join(f'{key}={value}' for key, value in details.items())
         suffix = f' {detail_text}' if detail_text else ''
         print(f'[stage3][progress] phase={phase} status=started{suffix}', flush=True)
 
+    def record(self, **details):
+        """Add details (such as row counts known only at the end) to the current phase."""
+        self.profile.record(**details)
+
     def _run(self):
         while not self.stop_event.wait(self.interval_seconds):
             with self.lock:
@@ -79,6 +139,7 @@ class Stage3ProgressReporter:
         self.stop_event.set()
         if self.thread is not None:
             self.thread.join(timeout=max(1.0, self.interval_seconds + 1.0))
+        self.profile.end()
 
 
 def parse_arguments():
@@ -87,6 +148,12 @@ def parse_arguments():
     parser.add_argument('--prp-inventory', type=str, required=True, help='Path to NRP/S3 inventory file')
     parser.add_argument('--aws-inventory', type=str, required=True, help='Path to AWS/Glacier/S3 inventory file')
     parser.add_argument('--puts-output', type=str, default=None, help='Path to output PUTs file')
+    parser.add_argument(
+        '--puts-manifest-output',
+        type=str,
+        default=None,
+        help='Path to output the PUT list with size, effective LastModified and atomic group per key',
+    )
     parser.add_argument('--deletes-output', type=str, default=None, help='Path to output DELETEs file')
     parser.add_argument('--notifications-output', type=str, default=None, help='Path to output notifications file')
     parser.add_argument(
@@ -119,13 +186,64 @@ def parse_arguments():
         default=None,
         help='Path to the machine-readable inventory comparison summary',
     )
+    parser.add_argument(
+        '--prefix-rollups-output',
+        type=str,
+        default=None,
+        help='Path to per-atomic-group and per-folder object count, size and schedule rollups',
+    )
     parser.add_argument(
         '--progress-interval-seconds',
         type=float,
         default=float(os.getenv('STAGE3_PROGRESS_INTERVAL_SECONDS', DEFAULT_PROGRESS_INTERVAL_SECONDS)),
         help='Heartbeat interval while Stage 3 is processing; set to 0 to disable',
     )
-    return parser.parse_args()
+    parser.add_argument(
+        '--chunk-rows',
+        type=int,
+        default=int(os.getenv('STAGE3_CHUNK_ROWS', DEFAULT_CHUNK_ROWS)),
+        help='Stream each inventory in chunks of this many rows while loading; set to 0 to read in one pass',
+    )
+    parser.add_argument(
+        '--inventory-cache-dir',
+        type=str,
+        default=os.getenv('INVENTORY_CACHE_DIR') or None,
+        help='Directory of canonical Parquet inventory caches shared with Stage 1/2 and the report',
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=int(os.getenv('STAGE3_PROCESSES', DEFAULT_PROCESSES)),
+        help='Compare key-partitioned shards in this many processes; 1 runs in-process',
+    )
+    parser.add_argument(
+        '--gzip-artifacts',
+        action='store_true',
+        default=os.getenv('STAGE3_GZIP_ARTIFACTS', '0') == '1',
+        help='Also write a .gz copy of the PUT/DELETE lists and CSV artifacts in the same pass',
+    )
+    parser.add_argument(
+        '--profile-output',
+        type=str,
+        default=os.getenv('STAGE3_PROFILE_OUTPUT') or None,
+        help='Path to per-phase wall/CPU time, RSS and row-count records (stage3-profile.json)',
+    )
+    parser.add_argument(
+        '--profile-phase',
+        type=str,
+        default=os.getenv('STAGE3_PROFILE_PHASE') or None,
+        help='Phase to capture in detail, e.g. load_inventories or compare_inventories',
+    )
+    parser.add_argument(
+        '--profile-mode',
+        choices=PHASE_CAPTURE_MODES,
+        default=os.getenv('STAGE3_PROFILE_MODE', 'cprofile'),
+        help='Capture --profile-phase with cProfile (top functions and a .pstats file) or tracemalloc',
+    )
+    args = parser.parse_args()
+    if args.processes < 1:
+        parser.error('--processes must be >= 1')
+    return args
 
 
 def load_config_file(config_path):
@@ -136,24 +254,36 @@ def load_config_file(config_path):
             print(exc)
 
 
-def load_inventories(prp_inventory_path, aws_inventory_path, stats=None):
-    stats = stats if stats is not None else {}
+def iter_inventory_frames(inventory_path, chunk_rows=None, **read_csv_kwargs):
+    """Yield the inventory CSV as one frame, or as ``chunk_rows``-sized frames."""
+
+    if not chunk_rows or chunk_rows <= 0:
+        yield pd.read_csv(inventory_path, **read_csv_kwargs)
+        return
+    with pd.read_csv(inventory_path, chunksize=int(chunk_rows), **read_csv_kwargs) as reader:
+        yield from reader
+
+
+def iter_nrp_inventory_frames(prp_inventory_path, chunk_rows=None):
     try:
-        prp_inventory_raw = pd.read_csv(
+        for prp_inventory_raw in iter_inventory_frames(
             prp_inventory_path,
+            chunk_rows,
             header=None,
             dtype=str,
             keep_default_na=False,
-        )
+        ):
+            yield parse_nrp_inventory_frame(prp_inventory_raw)
     except pd.errors.EmptyDataError:
-        prp_inventory_raw = pd.DataFrame(columns=['LastModified', 'BucketKey', 'Size'])
-    stats['nrp_input_rows'] = int(len(prp_inventory_raw))
+        yield parse_nrp_inventory_frame(pd.DataFrame(columns=NRP_INVENTORY_COLUMNS))
+
 
+def parse_nrp_inventory_frame(prp_inventory_raw):
     if prp_inventory_raw.shape[1] == 2:
         prp_inventory_raw.columns = ['LastModified', 'BucketKey']
         prp_inventory_raw['Size'] = pd.NA
     elif prp_inventory_raw.shape[1] == 3:
-        prp_inventory_raw.columns = ['LastModified', 'BucketKey', 'Size']
+        prp_inventory_raw.columns = NRP_INVENTORY_COLUMNS
     else:
         raise ValueError(
             f"Unexpected NRP inventory column count ({prp_inventory_raw.shape[1]}). "
@@ -163,92 +293,289 @@ def load_inventories(prp_inventory_path, aws_inventory_path, stats=None):
 
     prp_inventory_raw['LastModified'] = pd.to_datetime(prp_inventory_raw['LastModified'], errors='coerce', utc=True)
     prp_inventory_raw['Size'] = pd.to_numeric(prp_inventory_raw['Size'], errors='coerce').astype('Int64')
-    prp_inventory = prp_inventory_raw
+    return prp_inventory_raw
 
-    aws_inventory = pd.read_csv(
+
+def iter_aws_inventory_frames(aws_inventory_path, chunk_rows=None):
+    for aws_inventory in iter_inventory_frames(
         aws_inventory_path,
-        names=['Bucket', 'BucketKey', 'Size', 'LastModified', 'StorageClass'],
+        chunk_rows,
+        names=AWS_INVENTORY_COLUMNS,
         parse_dates=['LastModified'],
+    ):
+        aws_inventory['LastModified'] = pd.to_datetime(aws_inventory['LastModified'], errors='coerce', utc=True)
+        # AWS inventory keys are URL-encoded for special characters (for example %40, %20, %28).
+        # Decode once so key comparisons with NRP inventory use canonical object-key strings.
+        aws_inventory['BucketKey'] = decode_aws_inventory_keys(aws_inventory['BucketKey'])
+        yield aws_inventory
+
+
+def decode_aws_inventory_keys(bucket_keys):
+    """URL-decode AWS inventory keys, touching only the rows that contain ``%``.
+
+    Each distinct encoded directory is decoded once per frame; the result
+    matches ``unquote`` applied to every key.
+    """
+
+    values = bucket_keys.to_numpy(dtype=object)
+    encoded = np.fromiter(
+        (isinstance(value, str) and '%' in value for value in values),
+        dtype=bool,
+        count=len(values),
     )
-    stats['aws_input_rows'] = int(len(aws_inventory))
-    aws_inventory['LastModified'] = pd.to_datetime(aws_inventory['LastModified'], errors='coerce', utc=True)
-    # AWS inventory keys are URL-encoded for special characters (for example %40, %20, %28).
-    # Decode once so key comparisons with NRP inventory use canonical object-key strings.
-    aws_inventory['BucketKey'] = aws_inventory['BucketKey'].map(
-        lambda value: unquote(value) if isinstance(value, str) else value
+    if not encoded.any():
+        return bucket_keys
+    decoded = values.copy()
+    decoded_directories = {}
+    for position in np.flatnonzero(encoded):
+        decoded[position] = decode_aws_key(values[position], decoded_directories)
+    return pd.Series(decoded, index=bucket_keys.index, name=bucket_keys.name)
+
+
+def decode_aws_key(key, decoded_directories):
+    split = key.rfind('/') + 1
+    directory = key[:split]
+    decoded_directory = decoded_directories.get(directory)
+    if decoded_directory is None:
+        decoded_directory = decoded_directories[directory] = unquote(directory)
+    decoded = decoded_directory + unquote(key[split:])
+    if '\ufffd' in decoded:
+        # An invalid escape sequence spanning the last '/' decodes differently
+        # in two pieces; decode the whole key as before.
+        return unquote(key)
+    return decoded
+
+
+def key_needs_normalization(key):
+    """Whether ``normalize_bucket_object_key`` may return anything but ``key`` itself.
+
+    Stripped ``bucket/object`` keys without rclone dot segments, carriage
+    returns or embedded ``s3:/`` text are already canonical.
+    """
+    slash = key.find('/')
+    return (
+        slash <= 0
+        or slash == len(key) - 1
+        or key[0].isspace()
+        or key[-1].isspace()
+        or RCLONE_DOT_SEGMENT in key
+        or '\r' in key
+        or '\u240d' in key
+        or 's3:/' in key
     )
 
-    def normalize_inventory_keys(df, inventory_name):
-        filtered = df.copy()
-        original_bucket_keys = filtered['BucketKey'].astype('string')
-        stripped_bucket_keys = original_bucket_keys.str.strip()
-        normalized_bucket_keys = stripped_bucket_keys.map(
-            lambda value: normalize_bucket_object_key(value) if isinstance(value, str) and value else value
+
+def normalization_candidates(values):
+    """Flag the keys ``key_needs_normalization`` would flag, plus possibly a few more.
+
+    With pyarrow this is one vectorized regex pass; the end-character test
+    covers every whitespace character and some other non-printable ones.
+    """
+    if pc is not None:
+        try:
+            keys = pa.array(values, type=pa.string(), from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass
+        else:
+            matches = pc.match_substring_regex(keys, KEY_NORMALIZATION_CANDIDATE_PATTERN)
+            return pc.fill_null(matches, False).to_numpy(zero_copy_only=False)
+    return np.fromiter(
+        (isinstance(value, str) and key_needs_normalization(value) for value in values),
+        dtype=bool,
+        count=len(values),
+    )
+
+
+def normalize_inventory_keys(bucket_keys):
+    """Apply ``normalize_bucket_object_key`` to keys, calling it only where it can change them.
+
+    Equivalent to mapping it over every non-empty string; missing and empty
+    values pass through unchanged.
+    """
+
+    values = bucket_keys.to_numpy(dtype=object)
+    normalized = values.copy()
+    for position in np.flatnonzero(normalization_candidates(values)):
+        value = values[position]
+        if isinstance(value, str) and value:
+            normalized[position] = normalize_bucket_object_key(value)
+    return pd.Series(normalized, index=bucket_keys.index, name=bucket_keys.name, dtype=object)
+
+
+def clean_inventory_frame(df, counts):
+    """Canonicalize keys, then drop prefix markers and control-character keys.
+
+    ``df`` is owned by the loader and is updated in place; only the kept rows
+    are copied.  Row counts are accumulated into ``counts`` so chunked loads
+    report the same totals as a single-pass load.
+    """
+
+    stripped_bucket_keys = df['BucketKey'].astype('string').str.strip()
+    normalized_bucket_keys = normalize_inventory_keys(stripped_bucket_keys)
+    changed_mask = (
+        stripped_bucket_keys.notna() &
+        normalized_bucket_keys.notna() &
+        (stripped_bucket_keys != normalized_bucket_keys)
+    )
+    counts['normalized_key_rows'] += int(changed_mask.sum())
+    del stripped_bucket_keys, changed_mask
+
+    bucket_keys = normalized_bucket_keys.astype('string').str.strip()
+    drop_mask = bucket_keys.isna() | (bucket_keys.str.len() == 0) | bucket_keys.str.endswith('/', na=False)
+    counts['prefix_marker_or_empty_rows'] += int(drop_mask.sum())
+
+    bad_mask = ~drop_mask & bucket_keys.str.contains(CONTROL_CHAR_PATTERN, na=False)
+    bad_rows = pd.DataFrame({'BucketKey': bucket_keys.loc[bad_mask]})
+    bad_rows['Issue'] = 'control_character'
+    bad_rows['BucketKeyEscaped'] = [
+        make_badkey_record('control_character', str(key)).bucket_key_escaped
+        for key in bad_rows['BucketKey'].tolist()
+    ]
+    counts['bad_key_rows'] += int(len(bad_rows))
+
+    df['BucketKey'] = bucket_keys
+    cleaned_df = df.loc[~(drop_mask | bad_mask)].copy()
+    return cleaned_df, bad_rows[['Issue', 'BucketKeyEscaped', 'BucketKey']]
+
+
+def concat_inventory_frames(frames):
+    if len(frames) == 1:
+        return frames[0]
+    non_empty = [frame for frame in frames if not frame.empty]
+    return pd.concat(non_empty or frames[:1])
+
+
+def load_inventory(frames, inventory_name, stats):
+    """Clean each frame from ``frames`` and combine the results.
+
+    Peak memory is bounded by one raw frame plus the cleaned rows kept so far,
+    which is what makes the ``--chunk-rows`` streaming mode cheaper than a
+    single-pass read of a multi-GB inventory.
+    """
+
+    counts = {name: 0 for name in INVENTORY_CLEANUP_COUNTERS}
+    input_rows = 0
+    cleaned_frames = []
+    bad_key_frames = []
+    for frame in frames:
+        input_rows += len(frame)
+        cleaned_frame, bad_key_frame = clean_inventory_frame(frame, counts)
+        cleaned_frames.append(cleaned_frame)
+        bad_key_frames.append(bad_key_frame)
+
+    prefix = inventory_name.lower()
+    stats[f'{prefix}_input_rows'] = int(input_rows)
+    for name, value in counts.items():
+        stats[f'{prefix}_{name}'] = int(value)
+    if counts['normalized_key_rows'] > 0:
+        print(
+            f"Normalized {counts['normalized_key_rows']} {inventory_name} inventory key(s) for canonical comparison "
+            "(rclone dot segments and embedded s3:/ text)."
         )
-        changed_mask = (
-            stripped_bucket_keys.notna() &
-            normalized_bucket_keys.notna() &
-            (stripped_bucket_keys != normalized_bucket_keys)
+    if counts['prefix_marker_or_empty_rows'] > 0:
+        print(
+            f"Skipping {counts['prefix_marker_or_empty_rows']} {inventory_name} inventory row(s) with empty keys "
+            "or prefix-marker keys ending in '/'."
         )
-        changed = int(changed_mask.sum())
-        stats[f'{inventory_name.lower()}_normalized_key_rows'] = changed
-        if changed > 0:
-            print(
-                f"Normalized {changed} {inventory_name} inventory key(s) for canonical comparison "
-                "(rclone dot segments and embedded s3:/ text)."
-            )
-        filtered['BucketKey'] = normalized_bucket_keys.astype('string')
-        return filtered
-
-    prp_inventory = normalize_inventory_keys(prp_inventory, 'NRP')
-    aws_inventory = normalize_inventory_keys(aws_inventory, 'AWS')
-
-    def drop_prefix_marker_rows(df, inventory_name):
-        filtered = df.copy()
-        bucket_keys = filtered['BucketKey'].astype('string')
-        normalized_bucket_keys = bucket_keys.str.strip()
-        drop_empty = normalized_bucket_keys.isna() | (normalized_bucket_keys.str.len() == 0)
-        drop_prefix_markers = normalized_bucket_keys.str.endswith('/', na=False)
-        drop_mask = drop_empty | drop_prefix_markers
-        dropped = int(drop_mask.sum())
-        stats[f'{inventory_name.lower()}_prefix_marker_or_empty_rows'] = dropped
-        if dropped > 0:
-            print(
-                f"Skipping {dropped} {inventory_name} inventory row(s) with empty keys "
-                "or prefix-marker keys ending in '/'."
-            )
-        filtered = filtered.loc[~drop_mask].copy()
-        filtered['BucketKey'] = normalized_bucket_keys.loc[~drop_mask].astype('string')
-        return filtered
-
-    prp_inventory = drop_prefix_marker_rows(prp_inventory, 'NRP')
-    aws_inventory = drop_prefix_marker_rows(aws_inventory, 'AWS')
-
-    def split_bad_keys(df, inventory_name):
-        bucket_keys = df['BucketKey'].astype('string')
-        bad_mask = bucket_keys.str.contains(CONTROL_CHAR_PATTERN, na=False)
-        bad_rows = df.loc[bad_mask, ['BucketKey']].copy()
-        bad_rows['Issue'] = 'control_character'
-        bad_rows['BucketKeyEscaped'] = [
-            make_badkey_record('control_character', str(key)).bucket_key_escaped
-            for key in bad_rows['BucketKey'].tolist()
-        ]
-        if not bad_rows.empty:
-            print(
-                f"Skipping {len(bad_rows)} {inventory_name} inventory row(s) with control-character keys; "
-                "recording them in BADKEYS output."
-            )
-        stats[f'{inventory_name.lower()}_bad_key_rows'] = int(len(bad_rows))
-        cleaned_df = df.loc[~bad_mask].copy()
-        return cleaned_df, bad_rows[['Issue', 'BucketKeyEscaped', 'BucketKey']]
+    if counts['bad_key_rows'] > 0:
+        print(
+            f"Skipping {counts['bad_key_rows']} {inventory_name} inventory row(s) with control-character keys; "
+            "recording them in BADKEYS output."
+        )
+    return concat_inventory_frames(cleaned_frames), concat_inventory_frames(bad_key_frames)
 
-    prp_inventory, prp_bad_keys = split_bad_keys(prp_inventory, 'NRP')
-    aws_inventory, aws_bad_keys = split_bad_keys(aws_inventory, 'AWS')
+
+def load_cached_inventory(inventory_path, inventory_name, stats, frames, cache_dir=None):
+    """Load one inventory through the canonical Parquet cache when enabled.
+
+    A cache hit skips CSV parsing and key decoding entirely.  A miss decodes
+    ``frames()`` as usual and stores the result for later Stage 3 or report
+    runs on the same inventory snapshot.  Cache problems never fail the load.
+    """
+
+    if not cache_dir:
+        return load_inventory(frames(), inventory_name, stats)
+    if not inventory_cache_available():
+        print('WARNING: pyarrow is unavailable; ignoring the inventory cache.', flush=True)
+        return load_inventory(frames(), inventory_name, stats)
+
+    source_hash = source_content_hash(inventory_path)
+    cache_path = inventory_cache_path(cache_dir, inventory_name, source_hash, INVENTORY_DECODER_VERSION)
+    if cache_path.is_file():
+        try:
+            inventory, bad_keys, cached_stats = read_inventory_cache(cache_path, INVENTORY_DECODER_VERSION)
+        except Exception as error:
+            print(f'WARNING: Ignoring unreadable inventory cache {cache_path}: {error}', flush=True)
+        else:
+            stats.update(cached_stats)
+            print(f'Loaded canonical {inventory_name} inventory from cache {cache_path}', flush=True)
+            return inventory, bad_keys
+
+    inventory_stats = {}
+    inventory, bad_keys = load_inventory(frames(), inventory_name, inventory_stats)
+    stats.update(inventory_stats)
+    try:
+        write_inventory_cache(
+            cache_path,
+            inventory,
+            bad_keys,
+            inventory_stats,
+            source_hash=source_hash,
+            decoder_version=INVENTORY_DECODER_VERSION,
+        )
+        print(f'Saved canonical {inventory_name} inventory cache to {cache_path}', flush=True)
+    except Exception as error:
+        print(f'WARNING: Failed to write inventory cache {cache_path}: {error}', flush=True)
+    return inventory, bad_keys
+
+
+def load_nrp_inventory(prp_inventory_path, stats, chunk_rows=None, cache_dir=None):
+    return load_cached_inventory(
+        prp_inventory_path,
+        'NRP',
+        stats,
+        lambda: iter_nrp_inventory_frames(prp_inventory_path, chunk_rows),
+        cache_dir,
+    )
+
+
+def load_aws_inventory(aws_inventory_path, stats, chunk_rows=None, cache_dir=None):
+    return load_cached_inventory(
+        aws_inventory_path,
+        'AWS',
+        stats,
+        lambda: iter_aws_inventory_frames(aws_inventory_path, chunk_rows),
+        cache_dir,
+    )
+
+
+def load_inventories(prp_inventory_path, aws_inventory_path, stats=None, chunk_rows=None, cache_dir=None):
+    stats = stats if stats is not None else {}
+    prp_inventory, prp_bad_keys = load_nrp_inventory(prp_inventory_path, stats, chunk_rows, cache_dir)
+    aws_inventory, aws_bad_keys = load_aws_inventory(aws_inventory_path, stats, chunk_rows, cache_dir)
     bad_keys = pd.concat([prp_bad_keys, aws_bad_keys], ignore_index=True)
 
     return prp_inventory, aws_inventory, bad_keys
 
 
+def comparison_key_counts(prp_inventory, aws_inventory, no_backup_prefixes, diff=None):
+    """Return the distinct-key counts of the comparison summary.
+
+    Counts are additive across key-partitioned shards (see stage3_shards).
+    """
+    if diff is None:
+        diff = diff_inventories(prp_inventory, aws_inventory)
+    diff.check_frames(prp_inventory, aws_inventory)
+    no_backup_cover = diff.local_prefix_cover(no_backup_prefixes)
+    eligible_mask = diff.local_scientific & (no_backup_cover < 0)
+    excluded = no_backup_cover[diff.local_scientific & (no_backup_cover >= 0)]
+    return {
+        'eligible_local_distinct_objects': diff.distinct_local(eligible_mask),
+        'glacier_distinct_objects': diff.distinct_glacier(diff.glacier_scientific),
+        'no_backup_rows_per_prefix': np.bincount(excluded, minlength=len(no_backup_prefixes)).tolist(),
+    }
+
+
 def build_comparison_summary(
     prp_inventory,
     aws_inventory,
@@ -257,12 +584,14 @@ def build_comparison_summary(
     bad_keys,
     no_backup_prefixes,
     inventory_stats=None,
+    diff=None,
+    key_counts=None,
 ):
-    eligible_keys = scientific_inventory(prp_inventory)['BucketKey']
-    if no_backup_prefixes:
-        eligible_keys = eligible_keys[~eligible_keys.str.startswith(tuple(no_backup_prefixes))]
+    no_backup_prefixes = list(no_backup_prefixes or [])
+    if key_counts is None:
+        key_counts = comparison_key_counts(prp_inventory, aws_inventory, no_backup_prefixes, diff)
 
-    eligible_distinct = int(eligible_keys.nunique(dropna=True))
+    eligible_distinct = key_counts['eligible_local_distinct_objects']
     pending_distinct = int(puts.nunique(dropna=True))
     pending_control_mask = puts.astype('string').map(lambda value: is_retention_marker(str(value)))
     pending_data_puts = puts[~pending_control_mask]
@@ -275,9 +604,7 @@ def build_comparison_summary(
         'local_inventory_rows': int(len(prp_inventory)),
         'glacier_inventory_rows': int(len(aws_inventory)),
         'eligible_local_distinct_objects': eligible_distinct,
-        'glacier_distinct_objects': int(
-            scientific_inventory(aws_inventory)['BucketKey'].nunique(dropna=True)
-        ),
+        'glacier_distinct_objects': key_counts['glacier_distinct_objects'],
         'pending_put_rows': int(len(puts)),
         'pending_put_distinct_objects': pending_distinct,
         'pending_data_put_rows': int(len(pending_data_puts)),
@@ -288,10 +615,26 @@ def build_comparison_summary(
         'delete_distinct_objects': int(deletes.nunique(dropna=True)),
         'bad_key_rows': 0 if bad_keys is None else int(len(bad_keys)),
         'pending_upload_fraction': pending_fraction,
+        'no_backup': summarize_no_backup_exclusions(no_backup_prefixes, key_counts['no_backup_rows_per_prefix']),
         'inventory_processing': dict(inventory_stats or {}),
     }
 
 
+def summarize_no_backup_exclusions(no_backup_prefixes, rows_per_prefix):
+    largest = sorted(
+        (position for position in range(len(no_backup_prefixes)) if rows_per_prefix[position]),
+        key=lambda position: (-rows_per_prefix[position], no_backup_prefixes[position]),
+    )[:NO_BACKUP_REPORT_PREFIXES]
+    return {
+        'prefixes': len(no_backup_prefixes),
+        'excluded_local_rows': int(sum(rows_per_prefix)),
+        'largest_prefixes': [
+            {'prefix': no_backup_prefixes[position], 'local_rows': int(rows_per_prefix[position])}
+            for position in largest
+        ],
+    }
+
+
 def write_comparison_summary(output_path, summary):
     with open(output_path, 'w', encoding='utf8') as summary_file:
         json.dump(summary, summary_file, indent=2, sort_keys=True)
@@ -307,22 +650,42 @@ def write_comparison_summary(output_path, summary):
     )
 
 
-def apply_last_modified_updates(prp_inventory, config, *, authoritative_markers=None):
-    atomic_directories = normalize_atomic_directories((config.get('backup') or {}).get('atomic_directories'))
+def apply_last_modified_updates(prp_inventory, config, *, authoritative_markers=None, atomic_index=None):
+    if atomic_index is None:
+        atomic_index = AtomicDirectoryIndex.coerce((config.get('backup') or {}).get('atomic_directories'))
     return apply_effective_last_modified(
         prp_inventory,
-        atomic_directories,
+        atomic_index,
         authoritative_markers=authoritative_markers,
     )
 
 
-def find_no_backup_prefixes(prp_inventory: pd.DataFrame):
+def find_no_backup_prefixes(prp_inventory: pd.DataFrame, diff=None):
+    # With a diff, the marker test and prefix extraction run over its
+    # directory/basename dictionaries instead of every row's string.
+    if diff is not None:
+        if len(prp_inventory) != diff.local_rows:
+            raise ValueError('Inventory diff does not match the supplied local frame.')
+        return diff.local_no_backup_prefixes()
     mask = prp_inventory['BucketKey'].str.endswith('/NOBACKUP')
     prefixes = prp_inventory.loc[mask, 'BucketKey'].str.rsplit('/', n=1).str[0]
     prefixes = [f"{prefix}/" for prefix in prefixes.dropna().unique() if prefix]
     return prefixes
 
 
+def no_backup_row_mask(inventory: pd.DataFrame, no_backup_prefixes, diff=None):
+    """Positional mask of ``inventory`` rows under a NOBACKUP prefix.
+
+    ``diff``, when given, must have been computed with ``inventory`` as its
+    local frame.
+    """
+    if not no_backup_prefixes:
+        return np.zeros(len(inventory), dtype=bool)
+    if diff is not None:
+        return diff.local_under_prefixes(no_backup_prefixes)
+    return inventory['BucketKey'].str.startswith(tuple(no_backup_prefixes), na=False).to_numpy(dtype=bool)
+
+
 def calculate_expire_date(expire_days):
     return datetime.now(timezone.utc) - timedelta(days=expire_days)
 
@@ -344,60 +707,160 @@ def parse_days(value, config_key):
         raise ValueError(f"Expected integer days for '{config_key}', got: {value!r}") from None
 
 
-def generate_put_and_delete_lists(primary_inventory_df: pd.DataFrame,
-                                  glacier_inventory_df: pd.DataFrame,
-                                  expire_date,
-                                  no_backup_prefixes=None,
-                                  atomic_directories=None):
-    # Copy dataframes to not alter the original ones
-    local_inventory = primary_inventory_df.copy()
-    aws_inventory = glacier_inventory_df.copy()
-
-    if no_backup_prefixes:
-        no_backup_mask = local_inventory['BucketKey'].str.startswith(tuple(no_backup_prefixes))
-        local_inventory_for_puts = local_inventory[~no_backup_mask]
-    else:
-        local_inventory_for_puts = local_inventory
+def put_and_glacier_only_masks(primary_inventory_df: pd.DataFrame,
+                               glacier_inventory_df: pd.DataFrame,
+                               no_backup_prefixes=None,
+                               atomic_directories=None,
+                               diff=None):
+    # Membership comes from one shared key encoding (inventory_diff) instead
+    # of per-question hash lookups; all masks below are positional.
+    if diff is None:
+        diff = diff_inventories(primary_inventory_df, glacier_inventory_df)
+    diff.check_frames(primary_inventory_df, glacier_inventory_df)
 
-    scientific_mask = ~lifecycle_control_mask(local_inventory_for_puts['BucketKey'])
-    missing_mask = ~local_inventory_for_puts.BucketKey.isin(aws_inventory.BucketKey)
+    for_puts = ~no_backup_row_mask(primary_inventory_df, no_backup_prefixes, diff)
     # Scientific data remains upload-once. Retention markers are deliberately
     # tiny control objects and must be overwritten when their LastModified is
     # newer so the Glacier copy follows the current Ceph retention decision.
     refresh_marker_mask = marker_upload_mask(
-        local_inventory_for_puts,
-        aws_inventory,
+        primary_inventory_df[for_puts],
+        glacier_inventory_df,
+        atomic_directories,
+        destination_dates=diff.glacier_marker_dates[for_puts],
+    ).to_numpy(dtype=bool)
+    put_mask = for_puts.copy()
+    put_mask[for_puts] = (diff.local_scientific & ~diff.local_in_glacier)[for_puts] | refresh_marker_mask
+    glacier_only_mask = diff.glacier_scientific & ~diff.glacier_in_local_scientific
+    return put_mask, glacier_only_mask
+
+
+def select_puts_and_deletes(primary_inventory_df, glacier_inventory_df, put_mask, glacier_only_mask, expire_date):
+    puts = primary_inventory_df.loc[put_mask, 'BucketKey']
+    delete_mask = glacier_only_mask & (glacier_inventory_df['LastModified'] < expire_date).to_numpy(dtype=bool)
+    deletes = glacier_inventory_df.loc[delete_mask, 'BucketKey']
+    return puts, deletes
+
+
+def build_puts_manifest(primary_inventory_df: pd.DataFrame, put_mask, atomic_directories):
+    """Return the PUT rows, in ``puts.txt`` order, with their size, effective LastModified and atomic group."""
+    manifest = primary_inventory_df.loc[put_mask, ['BucketKey', 'Size', 'LastModified']].reset_index(drop=True)
+    groups, _ = AtomicDirectoryIndex.coerce(atomic_directories).match_series(manifest['BucketKey'])
+    manifest['AtomicGroup'] = groups.fillna('')
+    return manifest[PUTS_MANIFEST_COLUMNS]
+
+
+def generate_put_and_delete_lists(primary_inventory_df: pd.DataFrame,
+                                  glacier_inventory_df: pd.DataFrame,
+                                  expire_date,
+                                  no_backup_prefixes=None,
+                                  atomic_directories=None,
+                                  diff=None):
+    put_mask, glacier_only_mask = put_and_glacier_only_masks(
+        primary_inventory_df,
+        glacier_inventory_df,
+        no_backup_prefixes,
         atomic_directories,
+        diff=diff,
+    )
+    return select_puts_and_deletes(
+        primary_inventory_df,
+        glacier_inventory_df,
+        put_mask,
+        glacier_only_mask,
+        expire_date,
+    )
+
+
+def compare_inventory_shard(task: ShardTask) -> ShardResult:
+    """Run the key-local part of Stage 3 for one shard (see stage3_shards)."""
+    atomic_index = AtomicDirectoryIndex(task.atomic_directories)
+    local = apply_effective_last_modified(task.local, atomic_index)
+    glacier = apply_effective_last_modified(task.glacier, atomic_index, authoritative_markers=local)
+    diff = diff_inventories(local, glacier)
+    put_mask, glacier_only_mask = put_and_glacier_only_masks(
+        local, glacier, task.no_backup_prefixes, atomic_index, diff=diff
+    )
+    cleanup_window = build_cleanup_window_entries(
+        local,
+        glacier,
+        s3_expire_days=task.s3_expire_days,
+        cold_storage_expire_days=task.cold_storage_expire_days,
+        notification_days=task.notification_days,
+        atomic_directories=atomic_index,
+        now_utc=task.now_utc,
+        diff=diff,
+        no_backup_prefixes=task.no_backup_prefixes,
+    )
+    return ShardResult(
+        local_last_modified=local['LastModified'],
+        glacier_last_modified=glacier['LastModified'],
+        put_mask=put_mask,
+        glacier_only_mask=glacier_only_mask,
+        cleanup_window=cleanup_window,
+        key_counts=comparison_key_counts(local, glacier, task.no_backup_prefixes, diff),
     )
-    puts = local_inventory_for_puts[(scientific_mask & missing_mask) | refresh_marker_mask]
-    scientific_aws = scientific_inventory(aws_inventory)
-    scientific_local_keys = scientific_inventory(local_inventory)['BucketKey']
-    deletes = scientific_aws[
-        (~scientific_aws.BucketKey.isin(scientific_local_keys))
-        & (scientific_aws.LastModified < expire_date)
+
+
+def compare_inventories_in_shards(primary_inventory_df: pd.DataFrame,
+                                  glacier_inventory_df: pd.DataFrame,
+                                  *,
+                                  processes,
+                                  atomic_index,
+                                  no_backup_prefixes,
+                                  s3_expire_days,
+                                  cold_storage_expire_days,
+                                  notification_days,
+                                  now_utc):
+    """Compare key-partitioned shards in a process pool and merge them by row position.
+
+    Returns the effective-timestamp frames, ``(put_mask, glacier_only_mask)``,
+    the cleanup window and the summary key counts, each identical to what the
+    single-process path computes.
+    """
+    local_positions, glacier_positions = shard_rows(
+        primary_inventory_df['BucketKey'], glacier_inventory_df['BucketKey'], atomic_index, processes
+    )
+    tasks = [
+        ShardTask(
+            local=primary_inventory_df.iloc[local_rows],
+            glacier=glacier_inventory_df.iloc[glacier_rows],
+            atomic_directories=atomic_index.patterns,
+            no_backup_prefixes=list(no_backup_prefixes),
+            s3_expire_days=s3_expire_days,
+            cold_storage_expire_days=cold_storage_expire_days,
+            notification_days=notification_days,
+            now_utc=now_utc,
+        )
+        for local_rows, glacier_rows in zip(local_positions, glacier_positions)
     ]
-    return puts['BucketKey'], deletes['BucketKey']
+    print(
+        '[stage3][shards] '
+        f'processes={processes} local_rows={[len(rows) for rows in local_positions]} '
+        f'glacier_rows={[len(rows) for rows in glacier_positions]}',
+        flush=True,
+    )
+    # Spawned workers do not inherit the heartbeat thread or parent state.
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(compare_inventory_shard, tasks))
+
+    local = scatter_column(
+        primary_inventory_df, 'LastModified', local_positions, [result.local_last_modified for result in results]
+    )
+    glacier = scatter_column(
+        glacier_inventory_df, 'LastModified', glacier_positions, [result.glacier_last_modified for result in results]
+    )
+    masks = (
+        scatter_masks(len(local), local_positions, [result.put_mask for result in results]),
+        scatter_masks(len(glacier), glacier_positions, [result.glacier_only_mask for result in results]),
+    )
+    cleanup_window = merge_cleanup_windows([result.cleanup_window for result in results])
+    key_counts = merge_key_counts([result.key_counts for result in results])
+    return local, glacier, masks, cleanup_window, key_counts
 
 
 def derive_atomic_group_info(bucket_key, atomic_directories):
-    for pattern in atomic_directories:
-        if pattern.endswith('/*'):
-            base = pattern[:-2].rstrip('/')
-            prefix = f'{base}/'
-            if not bucket_key.startswith(prefix):
-                continue
-            suffix = bucket_key[len(prefix):]
-            group_id = suffix.split('/', 1)[0]
-            if not group_id:
-                continue
-            return f'{prefix}{group_id}/', prefix
-
-        prefix = pattern.rstrip('*')
-        if prefix and not prefix.endswith('/'):
-            prefix = f'{prefix}/'
-        if prefix and bucket_key.startswith(prefix):
-            return prefix, prefix
-    return None, None
+    matched = AtomicDirectoryIndex.coerce(atomic_directories).match(bucket_key)
+    return matched if matched is not None else (None, None)
 
 
 def derive_folder_group(bucket_key, depth=3):
@@ -411,13 +874,46 @@ def derive_folder_group(bucket_key, depth=3):
     return '/'.join(parts[:folder_depth]) + '/'
 
 
+def derive_grouping_columns(bucket_keys, atomic_directories, depth=3):
+    """Return ``(GroupingType, GroupingKey, AtomicRoot)`` lists for ``bucket_keys``.
+
+    Equivalent to ``derive_atomic_group_info`` with a ``derive_folder_group``
+    fallback, but atomic groups come from the index's compiled match and
+    folder groups from one compiled pattern instead of a split per key.
+    """
+    groups, roots = AtomicDirectoryIndex.coerce(atomic_directories).match_series(bucket_keys)
+    folder_match = FOLDER_GROUP_PATTERNS.setdefault(
+        depth, re.compile(rf'((?:[^/]+/){{1,{depth}}})[^/]') if depth > 0 else None
+    )
+    grouping_types = []
+    grouping_keys = []
+    atomic_roots = []
+    for bucket_key, group, root in zip(bucket_keys, groups, roots):
+        if group is not None:
+            grouping_types.append('atomic')
+            grouping_keys.append(group)
+            atomic_roots.append(root)
+            continue
+        # Folder groups are the leading segments once empty segments are dropped.
+        segments = bucket_key.strip('/')
+        if '//' in segments:
+            segments = MULTIPLE_SLASHES.sub('/', segments)
+        folder = folder_match.match(segments) if folder_match is not None else None
+        grouping_types.append('folder')
+        grouping_keys.append(folder.group(1) if folder is not None else bucket_key)
+        atomic_roots.append('')
+    return grouping_types, grouping_keys, atomic_roots
+
+
 def build_cleanup_window_entries(primary_inventory_df: pd.DataFrame,
                                  glacier_inventory_df: pd.DataFrame,
                                  s3_expire_days,
                                  cold_storage_expire_days,
                                  notification_days,
                                  atomic_directories,
-                                 now_utc=None):
+                                 now_utc=None,
+                                 diff=None,
+                                 no_backup_prefixes=None):
     if now_utc is None:
         now_utc = datetime.now(timezone.utc)
 
@@ -427,24 +923,25 @@ def build_cleanup_window_entries(primary_inventory_df: pd.DataFrame,
     else:
         now_ts = now_ts.tz_convert('UTC')
     window_end = now_ts + timedelta(days=notification_days)
-    atomic_directories = normalize_atomic_directories(atomic_directories)
-
-    local_df = scientific_inventory(primary_inventory_df)[['BucketKey', 'LastModified']].dropna(
+    atomic_directories = AtomicDirectoryIndex.coerce(atomic_directories)
+    if diff is None:
+        diff = diff_inventories(primary_inventory_df, glacier_inventory_df)
+    diff.check_frames(primary_inventory_df, glacier_inventory_df)
+
+    if no_backup_prefixes is None:
+        no_backup_prefixes = find_no_backup_prefixes(primary_inventory_df, diff)
+    local_rows = diff.local_scientific & ~no_backup_row_mask(primary_inventory_df, no_backup_prefixes, diff)
+    local_df = primary_inventory_df.loc[local_rows, ['BucketKey', 'LastModified']].dropna(
         subset=['BucketKey', 'LastModified']
     ).copy()
-    no_backup_prefixes = find_no_backup_prefixes(primary_inventory_df)
-    if no_backup_prefixes:
-        local_df = local_df[~local_df['BucketKey'].str.startswith(tuple(no_backup_prefixes))]
     local_df['CleanupPhase'] = 's3'
     local_df['SourceLastModified'] = local_df['LastModified']
     local_df['ScheduledCleanupDate'] = local_df['SourceLastModified'] + timedelta(days=s3_expire_days)
 
-    glacier_df = scientific_inventory(glacier_inventory_df)[['BucketKey', 'LastModified']].dropna(
+    glacier_only_mask = diff.glacier_scientific & ~diff.glacier_in_local_scientific
+    glacier_df = glacier_inventory_df.loc[glacier_only_mask, ['BucketKey', 'LastModified']].dropna(
         subset=['BucketKey', 'LastModified']
     ).copy()
-    primary_scientific_keys = scientific_inventory(primary_inventory_df)['BucketKey']
-    missing_in_primary_mask = ~glacier_df['BucketKey'].isin(primary_scientific_keys)
-    glacier_df = glacier_df[missing_in_primary_mask]
     glacier_df['CleanupPhase'] = 'glacier'
     glacier_df['SourceLastModified'] = glacier_df['LastModified']
     glacier_df['ScheduledCleanupDate'] = glacier_df['SourceLastModified'] + timedelta(days=cold_storage_expire_days)
@@ -467,27 +964,30 @@ def build_cleanup_window_entries(primary_inventory_df: pd.DataFrame,
     if cleanup_df.empty:
         return cleanup_df
 
-    day_delta = cleanup_df['ScheduledCleanupDate'] - now_ts
-    cleanup_df['DaysUntilCleanup'] = day_delta.dt.total_seconds().apply(lambda seconds: max(0, math.ceil(seconds / 86400)))
-
-    grouping_keys = []
-    grouping_types = []
-    atomic_roots = []
-    for bucket_key in cleanup_df['BucketKey']:
-        atomic_group, atomic_root = derive_atomic_group_info(bucket_key, atomic_directories)
-        if atomic_group:
-            grouping_keys.append(atomic_group)
-            grouping_types.append('atomic')
-            atomic_roots.append(atomic_root)
-        else:
-            grouping_keys.append(derive_folder_group(bucket_key))
-            grouping_types.append('folder')
-            atomic_roots.append('')
+    # Ceiling division on whole nanoseconds; window rows are never overdue.
+    day_delta_ns = (cleanup_df['ScheduledCleanupDate'] - now_ts).to_numpy(dtype='timedelta64[ns]').astype(np.int64)
+    cleanup_df['DaysUntilCleanup'] = np.maximum(0, -(-day_delta_ns // NANOSECONDS_PER_DAY))
 
+    grouping_types, grouping_keys, atomic_roots = derive_grouping_columns(
+        cleanup_df['BucketKey'],
+        atomic_directories,
+    )
     cleanup_df['GroupingType'] = grouping_types
     cleanup_df['GroupingKey'] = grouping_keys
     cleanup_df['AtomicRoot'] = atomic_roots
-    cleanup_df.sort_values(['CleanupPhase', 'ScheduledCleanupDate', 'BucketKey'], inplace=True)
+    cleanup_df.sort_values(CLEANUP_WINDOW_SORT_COLUMNS, inplace=True)
+    cleanup_df.reset_index(drop=True, inplace=True)
+    return cleanup_df
+
+
+def merge_cleanup_windows(cleanup_windows):
+    # Rows that tie on every sort column are identical (same key, phase and
+    # timestamps), so the merged order matches a single-process run.
+    non_empty = [cleanup_window for cleanup_window in cleanup_windows if not cleanup_window.empty]
+    if not non_empty:
+        return cleanup_windows[0]
+    cleanup_df = pd.concat(non_empty, ignore_index=True)
+    cleanup_df.sort_values(CLEANUP_WINDOW_SORT_COLUMNS, inplace=True)
     cleanup_df.reset_index(drop=True, inplace=True)
     return cleanup_df
 
@@ -655,16 +1155,36 @@ def output_puts_deletes_and_notifications(puts,
                                           notifications_output_filepath=None,
                                           cleanup_window_output_filepath=None,
                                           cleanup_summary_output_filepath=None,
-                                          cleanup_slack_message_output_filepath=None):
+                                          cleanup_slack_message_output_filepath=None,
+                                          gzip_artifacts=False,
+                                          puts_manifest=None,
+                                          puts_manifest_output_filepath=None):
+    """Write each artifact, or print it when its path is not given.
+
+    ``notifications`` passed as the ``cleanup_window`` frame itself is
+    rendered once for both CSVs.  ``gzip_artifacts`` also writes a ``.gz``
+    copy of the PUT/DELETE lists and CSV artifacts as they are written.
+    ``puts_manifest`` is written only when its path is given.
+    """
     if puts_output_filepath is not None:
-        puts.to_csv(puts_output_filepath, index=False, header=False, encoding='utf8')
+        write_csv_artifact(puts, [puts_output_filepath], gzip_variants=gzip_artifacts, index=False, header=False)
         print(f'Saved PUTs to {puts_output_filepath}')
     else:
         print("PUTs:")
         print(puts)
 
+    if puts_manifest is not None and puts_manifest_output_filepath is not None:
+        write_csv_artifact(
+            puts_manifest,
+            [puts_manifest_output_filepath],
+            timestamp_columns=PUTS_MANIFEST_TIMESTAMP_COLUMNS,
+            gzip_variants=gzip_artifacts,
+            index=False,
+        )
+        print(f'Saved PUT manifest to {puts_manifest_output_filepath}')
+
     if deletes_output_filepath is not None:
-        deletes.to_csv(deletes_output_filepath, index=False, header=False, encoding='utf8')
+        write_csv_artifact(deletes, [deletes_output_filepath], gzip_variants=gzip_artifacts, index=False, header=False)
         print(f'Saved DELETEs to {deletes_output_filepath}')
     else:
         print("\nDELETEs:")
@@ -690,36 +1210,47 @@ def output_puts_deletes_and_notifications(puts,
         else:
             print(bad_keys[['Issue', 'BucketKeyEscaped']])
 
+    schedule_paths = []
     if notifications_output_filepath is not None:
-        notifications_output = notifications.copy()
-        if not notifications_output.empty:
-            if 'SourceLastModified' in notifications_output.columns:
-                notifications_output['SourceLastModified'] = notifications_output['SourceLastModified'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-            if 'ScheduledCleanupDate' in notifications_output.columns:
-                notifications_output['ScheduledCleanupDate'] = notifications_output['ScheduledCleanupDate'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-        notifications_output.to_csv(notifications_output_filepath, index=False, encoding='utf8')
+        if notifications is cleanup_window:
+            schedule_paths.append(notifications_output_filepath)
+        else:
+            write_csv_artifact(
+                notifications,
+                [notifications_output_filepath],
+                timestamp_columns=CLEANUP_WINDOW_TIMESTAMP_COLUMNS,
+                gzip_variants=gzip_artifacts,
+                index=False,
+            )
         print(f'Saved NOTIFICATIONS to {notifications_output_filepath}')
     else:
         print("\nNOTIFICATIONS:")
         print(notifications)
 
     if cleanup_window_output_filepath is not None:
-        cleanup_window_output = cleanup_window.copy()
-        if not cleanup_window_output.empty:
-            cleanup_window_output['SourceLastModified'] = cleanup_window_output['SourceLastModified'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-            cleanup_window_output['ScheduledCleanupDate'] = cleanup_window_output['ScheduledCleanupDate'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-        cleanup_window_output.to_csv(cleanup_window_output_filepath, index=False, encoding='utf8')
+        schedule_paths.append(cleanup_window_output_filepath)
+    if schedule_paths:
+        write_csv_artifact(
+            cleanup_window,
+            schedule_paths,
+            timestamp_columns=CLEANUP_WINDOW_TIMESTAMP_COLUMNS,
+            gzip_variants=gzip_artifacts,
+            index=False,
+        )
+    if cleanup_window_output_filepath is not None:
         print(f'Saved cleanup window entries to {cleanup_window_output_filepath}')
     else:
         print("\nCLEANUP WINDOW ENTRIES:")
         print(cleanup_window)
 
     if cleanup_summary_output_filepath is not None:
-        cleanup_summary_output = cleanup_summary.copy()
-        if not cleanup_summary_output.empty:
-            cleanup_summary_output['EarliestCleanupDate'] = cleanup_summary_output['EarliestCleanupDate'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-            cleanup_summary_output['LatestCleanupDate'] = cleanup_summary_output['LatestCleanupDate'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-        cleanup_summary_output.to_csv(cleanup_summary_output_filepath, index=False, encoding='utf8')
+        write_csv_artifact(
+            cleanup_summary,
+            [cleanup_summary_output_filepath],
+            timestamp_columns=CLEANUP_SUMMARY_TIMESTAMP_COLUMNS,
+            gzip_variants=gzip_artifacts,
+            index=False,
+        )
         print(f'Saved cleanup summary to {cleanup_summary_output_filepath}')
     else:
         print("\nCLEANUP SUMMARY:")
@@ -745,8 +1276,23 @@ def main(config: str,
          cleanup_summary_output: str,
          cleanup_slack_message_output: str,
          comparison_summary_output: str = None,
-         progress_interval_seconds: float = DEFAULT_PROGRESS_INTERVAL_SECONDS):
-    progress = Stage3ProgressReporter(progress_interval_seconds)
+         progress_interval_seconds: float = DEFAULT_PROGRESS_INTERVAL_SECONDS,
+         chunk_rows: int = DEFAULT_CHUNK_ROWS,
+         inventory_cache_dir: str = None,
+         processes: int = DEFAULT_PROCESSES,
+         gzip_artifacts: bool = False,
+         profile_output: str = None,
+         profile_phase: str = None,
+         profile_mode: str = 'cprofile',
+         prefix_rollups_output: str = None,
+         puts_manifest_output: str = None):
+    capture = None
+    if profile_phase:
+        pstats_path = None
+        if profile_output is not None:
+            pstats_path = f'{os.path.splitext(profile_output)[0]}-{profile_phase}.pstats'
+        capture = PhaseCapture(profile_phase, profile_mode, pstats_path)
+    progress = Stage3ProgressReporter(progress_interval_seconds, capture=capture)
     progress.start()
     inventory_stats = {}
     try:
@@ -756,29 +1302,22 @@ def main(config: str,
             'load_inventories',
             local_bytes=os.path.getsize(prp_inventory),
             glacier_bytes=os.path.getsize(aws_inventory),
+            chunk_rows=chunk_rows,
         )
         df_prp_inventory, df_aws_inventory, bad_keys = load_inventories(
             prp_inventory,
             aws_inventory,
             stats=inventory_stats,
+            chunk_rows=chunk_rows,
+            cache_dir=inventory_cache_dir,
         )
-        progress.set_phase(
-            'apply_atomic_timestamps',
+        progress.record(
             local_rows=len(df_prp_inventory),
             glacier_rows=len(df_aws_inventory),
-        )
-        df_prp_inventory = apply_last_modified_updates(df_prp_inventory, config)
-        # The current Ceph marker inventory is authoritative for both phases.
-        # Glacier's own marker copy is recovery evidence, never a renewal
-        # signal, while the newest scientific object still defines each
-        # Glacier-only atomic dataset's baseline activity timestamp.
-        df_aws_inventory = apply_last_modified_updates(
-            df_aws_inventory,
-            config,
-            authoritative_markers=df_prp_inventory,
+            bad_key_rows=0 if bad_keys is None else len(bad_keys),
         )
         backup_config = config.get('backup') or {}
-
+        atomic_index = AtomicDirectoryIndex(backup_config.get('atomic_directories'))
         s3_expire_days = parse_days(
             get_required_config_value(config, 'deletion', 's3_expire_days'),
             'deletion.s3_expire_days',
@@ -792,31 +1331,85 @@ def main(config: str,
             get_required_config_value(config, 'deletion', 'notification_days'),
             'deletion.notification_days',
         )
-        no_backup_prefixes = find_no_backup_prefixes(df_prp_inventory)
+        now_utc = datetime.now(timezone.utc)
+        inventory_diff = None
+        masks = None
+        cleanup_window = None
+        key_counts = None
+        if processes > 1:
+            progress.set_phase(
+                'compare_shards',
+                processes=processes,
+                local_rows=len(df_prp_inventory),
+                glacier_rows=len(df_aws_inventory),
+            )
+            # NOBACKUP markers cover keys in every shard, so they are resolved
+            # over the whole local inventory first.
+            no_backup_prefixes = find_no_backup_prefixes(df_prp_inventory)
+            df_prp_inventory, df_aws_inventory, masks, cleanup_window, key_counts = (
+                compare_inventories_in_shards(
+                    df_prp_inventory,
+                    df_aws_inventory,
+                    processes=processes,
+                    atomic_index=atomic_index,
+                    no_backup_prefixes=no_backup_prefixes,
+                    s3_expire_days=s3_expire_days,
+                    cold_storage_expire_days=cold_storage_expire_days,
+                    notification_days=notification_days,
+                    now_utc=now_utc,
+                )
+            )
+        else:
+            progress.set_phase(
+                'apply_atomic_timestamps',
+                local_rows=len(df_prp_inventory),
+                glacier_rows=len(df_aws_inventory),
+            )
+            df_prp_inventory = apply_last_modified_updates(df_prp_inventory, config, atomic_index=atomic_index)
+            # The current Ceph marker inventory is authoritative for both phases.
+            # Glacier's own marker copy is recovery evidence, never a renewal
+            # signal, while the newest scientific object still defines each
+            # Glacier-only atomic dataset's baseline activity timestamp.
+            df_aws_inventory = apply_last_modified_updates(
+                df_aws_inventory,
+                config,
+                authoritative_markers=df_prp_inventory,
+                atomic_index=atomic_index,
+            )
+            inventory_diff = diff_inventories(df_prp_inventory, df_aws_inventory)
+            no_backup_prefixes = find_no_backup_prefixes(df_prp_inventory, inventory_diff)
+        progress.set_phase('compare_inventories')
         if no_backup_prefixes:
             print(f"Skipping PUTs under {len(no_backup_prefixes)} NOBACKUP prefix(es).", flush=True)
-        progress.set_phase('compare_inventories')
-        puts, deletes = generate_put_and_delete_lists(
+        if masks is None:
+            masks = put_and_glacier_only_masks(
+                df_prp_inventory, df_aws_inventory, no_backup_prefixes, atomic_index, diff=inventory_diff
+            )
+        put_mask, glacier_only_mask = masks
+        progress.record(put_rows=int(put_mask.sum()), glacier_only_rows=int(glacier_only_mask.sum()))
+        puts, deletes = select_puts_and_deletes(
             df_prp_inventory,
             df_aws_inventory,
+            put_mask,
+            glacier_only_mask,
             expire_date,
-            no_backup_prefixes,
-            backup_config.get('atomic_directories') or [],
-        )
-        progress.set_phase('build_cleanup_window', pending_put_rows=len(puts), delete_rows=len(deletes))
-        now_utc = datetime.now(timezone.utc)
-        cleanup_window = build_cleanup_window_entries(
-            df_prp_inventory,
-            df_aws_inventory,
-            s3_expire_days=s3_expire_days,
-            cold_storage_expire_days=cold_storage_expire_days,
-            notification_days=notification_days,
-            atomic_directories=backup_config.get('atomic_directories') or [],
-            now_utc=now_utc,
         )
+        if cleanup_window is None:
+            progress.set_phase('build_cleanup_window', pending_put_rows=len(puts), delete_rows=len(deletes))
+            cleanup_window = build_cleanup_window_entries(
+                df_prp_inventory,
+                df_aws_inventory,
+                s3_expire_days=s3_expire_days,
+                cold_storage_expire_days=cold_storage_expire_days,
+                notification_days=notification_days,
+                atomic_directories=atomic_index,
+                now_utc=now_utc,
+                diff=inventory_diff,
+            )
         # notifications.csv now uses the same schedule rows as cleanup-window output,
-        # preserved as a stable path for downstream machine consumers.
-        notifications = cleanup_window.copy()
+        # preserved as a stable path for downstream machine consumers; both are
+        # written from one rendering.
+        notifications = cleanup_window
         progress.set_phase('build_cleanup_summary', cleanup_rows=len(cleanup_window))
         cleanup_summary = build_cleanup_summary(cleanup_window)
         cleanup_slack_message = build_cleanup_slack_message(
@@ -833,6 +1426,8 @@ def main(config: str,
             bad_keys,
             no_backup_prefixes,
             inventory_stats=inventory_stats,
+            diff=inventory_diff,
+            key_counts=key_counts,
         )
         progress.set_phase('write_outputs')
         output_puts_deletes_and_notifications(
@@ -850,12 +1445,48 @@ def main(config: str,
             cleanup_window_output_filepath=cleanup_window_output,
             cleanup_summary_output_filepath=cleanup_summary_output,
             cleanup_slack_message_output_filepath=cleanup_slack_message_output,
+            gzip_artifacts=gzip_artifacts,
+            puts_manifest=(
+                build_puts_manifest(df_prp_inventory, put_mask, atomic_index)
+                if puts_manifest_output is not None
+                else None
+            ),
+            puts_manifest_output_filepath=puts_manifest_output,
         )
         if comparison_summary_output is not None:
             write_comparison_summary(comparison_summary_output, comparison_summary)
+        if prefix_rollups_output is not None:
+            progress.set_phase('build_prefix_rollups')
+            if inventory_diff is not None:
+                local_scientific = inventory_diff.local_scientific
+            else:
+                local_scientific = ~lifecycle_control_mask(df_prp_inventory['BucketKey']).to_numpy(dtype=bool)
+            prefix_rollups = build_prefix_rollups(
+                df_prp_inventory,
+                df_aws_inventory,
+                local_scientific=local_scientific,
+                put_mask=put_mask,
+                no_backup_mask=no_backup_row_mask(df_prp_inventory, no_backup_prefixes, inventory_diff),
+                glacier_only_mask=glacier_only_mask,
+                atomic_directories=atomic_index,
+                s3_expire_days=s3_expire_days,
+                cold_storage_expire_days=cold_storage_expire_days,
+            )
+            progress.record(rollup_rows=len(prefix_rollups))
+            write_csv_artifact(
+                prefix_rollups,
+                [prefix_rollups_output],
+                timestamp_columns=PREFIX_ROLLUP_TIMESTAMP_COLUMNS,
+                gzip_variants=gzip_artifacts,
+                index=False,
+            )
+            print(f'Saved prefix rollups ({len(prefix_rollups)}) to {prefix_rollups_output}', flush=True)
         progress.set_phase('complete')
     finally:
         progress.stop()
+    if profile_output is not None:
+        write_stage3_profile(profile_output, progress.profile.as_dict())
+        print(f'Saved Stage 3 profile to {profile_output}', flush=True)
 
 
 if __name__ == "__main__":
@@ -873,4 +1504,13 @@ if __name__ == "__main__":
         args.cleanup_slack_message_output,
         args.comparison_summary_output,
         args.progress_interval_seconds,
+        args.chunk_rows,
+        args.inventory_cache_dir,
+        args.processes,
+        args.gzip_artifacts,
+        args.profile_output,
+        args.profile_phase,
+        args.profile_mode,
+        args.prefix_rollups_output,
+        args.puts_manifest_output,
     )
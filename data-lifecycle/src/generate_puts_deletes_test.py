@@ -1,15 +1,22 @@
 import contextlib
+import gzip
+import itertools
 import json
 import os
 import re
 import sys
 import tempfile
+import threading
 import time
 import unittest
 import warnings
+from collections import Counter
+from unittest import mock
 from io import BytesIO, StringIO
 from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
 
+import numpy as np
 import pandas as pd
 from botocore.exceptions import ClientError, SSLError
 
@@ -19,18 +26,49 @@ from generate_puts_deletes import (  # noqa: E402
     Stage3ProgressReporter,
     apply_last_modified_updates,
     build_comparison_summary,
+    build_puts_manifest,
     build_cleanup_slack_message,
     build_cleanup_summary,
     build_cleanup_window_entries,
+    compare_inventories_in_shards,
+    comparison_key_counts,
+    decode_aws_inventory_keys,
+    derive_atomic_group_info,
+    derive_folder_group,
+    derive_grouping_columns,
+    find_no_backup_prefixes,
     generate_put_and_delete_lists,
+    iter_nrp_inventory_frames,
+    load_config_file,
     load_inventories,
     main as generate_inventory_outputs,
+    no_backup_row_mask,
+    normalize_inventory_keys,
     output_puts_deletes_and_notifications,
+    put_and_glacier_only_masks,
+)
+from inventory_cache import inventory_cache_available  # noqa: E402
+from inventory_diff import diff_inventories  # noqa: E402
+from stage3_artifacts import format_utc_timestamps, write_csv_artifact  # noqa: E402
+from stage3_profile import PhaseCapture  # noqa: E402
+from stage3_rollups import build_prefix_rollups  # noqa: E402
+from stage4_put_index import PUT_INDEX_SUFFIX, load_put_index, put_key_hash  # noqa: E402
+from stage4_schedule import load_manifest_sizes, order_by_size  # noqa: E402
+from stage3_benchmark import (  # noqa: E402
+    DEFAULT_CONFIG_PATH as DEFAULT_BENCHMARK_CONFIG_PATH,
+    find_regressions,
+    generate_synthetic_inventories,
 )
 from lifecycle_controls import (  # noqa: E402
     RETENTION_MARKER_NAME,
+    AtomicDirectoryIndex,
+    apply_effective_last_modified,
     atomic_retention_marker,
     file_retention_marker,
+    is_retention_marker,
+    lifecycle_control_mask,
+    marker_upload_mask,
+    retention_marker_target,
     scientific_inventory,
 )
 from badkeys import (  # noqa: E402
@@ -39,15 +77,36 @@ from badkeys import (  # noqa: E402
     make_badkey_record,
     parse_badkeys_tsv_text,
 )
+import stage4_process_puts_deletes  # noqa: E402
 from stage4_process_puts_deletes import (  # noqa: E402
+    ActivityLogger,
     ProgressStats,
     UploadFractionGuardError,
+    abort_stale_multipart_uploads,
     copy_file,
+    parallel_multipart_upload,
+    parallel_part_ranges,
+    process_files,
+    process_files_sharded,
+    read_into,
+    reconcile_open_multipart_uploads,
+    run_put_shard,
     validate_upload_fraction_guard,
 )
+from stage4_concurrency import AdaptiveConcurrency  # noqa: E402
+from stage4_multipart_journal import MULTIPART_JOURNAL_NAME, MultipartJournal  # noqa: E402
+from stage4_shards import ShardProgress, merge_shard_journals, shard_indices, split_multipart_journal  # noqa: E402
+from stage4_resume import completed_put_mask, load_resumable_lineage, save_run_state  # noqa: E402
+from stage4_precheck import (  # noqa: E402
+    DESTINATION_ABSENT,
+    DESTINATION_PRESENT,
+    DESTINATION_UNKNOWN,
+    build_destination_states,
+)
 from stage4_keys import (  # noqa: E402
     build_source_lookup_candidates,
     load_put_keys,
+    normalize_bucket_object_key,
     normalize_put_key,
 )
 
@@ -162,6 +221,126 @@ class TestGeneratePutAndDeleteLists(unittest.TestCase):
         )
         self.assertTrue(bad_keys.empty)
 
+    def test_aws_key_decoding_matches_unquote_on_every_row(self):
+        keys = pd.Series(
+            [
+                'bucket/plain/key.bin',
+                'bucket/run%20a/data%40lab/file%28copy%29.txt',
+                'bucket/run%20a/data%40lab/other.txt',
+                'bucket/a%2Fb/c%2Fd',
+                'bucket/caf%C3%A9/na%C3/%A9ve',
+                'bucket/%E2%80/%8D/bad%zz',
+                None,
+                float('nan'),
+            ],
+            index=[5, 5, 6, 7, 8, 9, 10, 11],
+            name='BucketKey',
+        )
+
+        decoded = decode_aws_inventory_keys(keys)
+
+        expected = keys.map(lambda value: unquote(value) if isinstance(value, str) else value)
+        pd.testing.assert_series_equal(decoded, expected)
+        plain_keys = keys.iloc[:1]
+        self.assertIs(decode_aws_inventory_keys(plain_keys), plain_keys)
+
+    def test_inventory_key_normalization_matches_per_row_normalizer(self):
+        tokens = ['a', '/', '．', '\r', '␍', 's3:/', ' ', '\u3000', '\x1c', 'é']
+        keys = [''.join(combination) for combination in itertools.product(tokens, repeat=3)]
+        keys += ['bucket/plain/key.bin', 'bucket/ephys/s3://bucket/ephys/x', 'bucket/．/．．/x ', None]
+
+        for fallback in (False, True):
+            for dtype in (object, 'string'):
+                with self.subTest(fallback=fallback, dtype=dtype):
+                    bucket_keys = pd.Series(keys, dtype=dtype)
+                    expected = bucket_keys.map(
+                        lambda value: normalize_bucket_object_key(value) if isinstance(value, str) and value else value
+                    )
+                    patch = mock.patch('generate_puts_deletes.pc', None) if fallback else contextlib.nullcontext()
+                    with patch:
+                        normalized = normalize_inventory_keys(bucket_keys)
+                    pd.testing.assert_series_equal(normalized, expected.astype(object))
+
+    def test_chunked_load_inventories_matches_single_pass_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            prp_path = os.path.join(temp_dir, 'local.csv')
+            aws_path = os.path.join(temp_dir, 'glacier.csv')
+            with open(prp_path, 'w', encoding='utf8') as prp_file:
+                prp_file.write('2025-01-01T00:00:00Z,bucket/prefix/,0\n')
+                prp_file.write('2025-01-02T00:00:00Z,bucket/file_a,1\n')
+                prp_file.write('2025-01-03T00:00:00Z,bucket/file_\x01bad,2\n')
+                prp_file.write('2025-01-04T00:00:00Z,   bucket/．/file_b   ,3\n')
+                prp_file.write('2025-01-05T00:00:00Z,,4\n')
+                prp_file.write('not-a-date,bucket/file_c,\n')
+                prp_file.write('2025-01-07T00:00:00Z,bucket/ephys/s3:/bucket/file_d,6\n')
+            with open(aws_path, 'w', encoding='utf8') as aws_file:
+                aws_file.write('bucket,bucket/prefix/,1,2025-01-01T00:00:00Z,GLACIER\n')
+                aws_file.write('bucket,bucket/file%20a,1,2025-01-01T00:00:00Z,GLACIER\n')
+                aws_file.write('bucket,bucket/aws_␍bad,1,2025-01-01T00:00:00Z,GLACIER\n')
+                aws_file.write('bucket,,1,2025-01-01T00:00:00Z,GLACIER\n')
+                aws_file.write('bucket,bucket/file_e,5,2025-01-05T00:00:00Z,DEEP_ARCHIVE\n')
+
+            single_stats = {}
+            expected = load_inventories(prp_path, aws_path, stats=single_stats)
+            for chunk_rows in (1, 2, 3, 100):
+                chunked_stats = {}
+                actual = load_inventories(prp_path, aws_path, stats=chunked_stats, chunk_rows=chunk_rows)
+                for expected_frame, actual_frame in zip(expected, actual):
+                    pd.testing.assert_frame_equal(actual_frame, expected_frame)
+                self.assertEqual(chunked_stats, single_stats)
+
+        self.assertEqual(single_stats['nrp_input_rows'], 7)
+        self.assertEqual(single_stats['nrp_prefix_marker_or_empty_rows'], 2)
+        self.assertEqual(single_stats['nrp_bad_key_rows'], 1)
+        self.assertEqual(single_stats['aws_prefix_marker_or_empty_rows'], 2)
+
+    @unittest.skipUnless(inventory_cache_available(), 'pyarrow is required for the inventory cache')
+    def test_inventory_cache_round_trips_canonical_frames_for_plain_and_gzip_sources(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            prp_path = os.path.join(temp_dir, 'local.csv')
+            aws_path = os.path.join(temp_dir, 'glacier.csv')
+            cache_dir = os.path.join(temp_dir, 'cache')
+            prp_rows = (
+                '2025-01-01T00:00:00Z,bucket/prefix/,0\n'
+                '2025-01-02T00:00:00Z,bucket/dir/file_a,1\n'
+                '2025-01-03T00:00:00Z,bucket/file_\x01bad,2\n'
+                'not-a-date,bucket/dir/file_c,\n'
+            )
+            with open(prp_path, 'w', encoding='utf8') as prp_file:
+                prp_file.write(prp_rows)
+            with open(aws_path, 'w', encoding='utf8') as aws_file:
+                aws_file.write('bucket,bucket/file%20a,1,2025-01-01T00:00:00Z,GLACIER\n')
+                aws_file.write('bucket,bucket/prefix/,1,2025-01-01T00:00:00Z,GLACIER\n')
+            with gzip.open(f'{prp_path}.gz', 'wt', encoding='utf8') as prp_gzip:
+                prp_gzip.write(prp_rows)
+
+            expected_stats = {}
+            expected = load_inventories(prp_path, aws_path, stats=expected_stats)
+            cold_stats = {}
+            cold = load_inventories(prp_path, aws_path, stats=cold_stats, cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+            warm_stats = {}
+            with mock.patch('generate_puts_deletes.iter_nrp_inventory_frames') as nrp_reader:
+                warm = load_inventories(f'{prp_path}.gz', aws_path, stats=warm_stats, cache_dir=cache_dir)
+            nrp_reader.assert_not_called()
+
+            for loaded in (cold, warm):
+                for expected_frame, actual_frame in zip(expected, loaded):
+                    pd.testing.assert_frame_equal(actual_frame, expected_frame)
+            self.assertEqual(cold_stats, expected_stats)
+            self.assertEqual(warm_stats, expected_stats)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            # A new decoder version must not reuse entries decoded by the old one.
+            with mock.patch('generate_puts_deletes.INVENTORY_DECODER_VERSION', 2), mock.patch(
+                'generate_puts_deletes.iter_nrp_inventory_frames', wraps=iter_nrp_inventory_frames
+            ) as nrp_reader:
+                redecoded = load_inventories(prp_path, aws_path, stats={}, cache_dir=cache_dir)
+            nrp_reader.assert_called_once()
+            for expected_frame, actual_frame in zip(expected, redecoded):
+                pd.testing.assert_frame_equal(actual_frame, expected_frame)
+            self.assertEqual(len(os.listdir(cache_dir)), 4)
+
     def test_apply_last_modified_updates_handles_wildcard_atomic_directories(self):
         config = {
             'backup': {
@@ -266,6 +445,95 @@ class TestGeneratePutAndDeleteLists(unittest.TestCase):
         file_date = updated.loc[updated['BucketKey'] == 'bucket/misc/c.bin', 'LastModified'].iloc[0]
         self.assertEqual(file_date, pd.Timestamp('2025-01-01T00:00:00Z'))
 
+    def test_atomic_directory_index_scalar_and_series_lookups_agree(self):
+        index = AtomicDirectoryIndex(
+            ['s3://bucket/ephys/*', 'bucket/ephys/deep/*', 'bucket/fixed', '/bucket/wild*', '*', '']
+        )
+        expected = {
+            'bucket/ephys/run1/data.raw': ('bucket/ephys/run1/', 'bucket/ephys/'),
+            'bucket/ephys/run1': ('bucket/ephys/run1/', 'bucket/ephys/'),
+            # The earlier wildcard wins over the more specific later one.
+            'bucket/ephys/deep/x/y.raw': ('bucket/ephys/deep/', 'bucket/ephys/'),
+            'bucket/ephys//run1/data.raw': None,
+            'bucket/fixed/a/b.raw': ('bucket/fixed/', 'bucket/fixed/'),
+            'bucket/fixedness/b.raw': None,
+            'bucket/wild/file.raw': ('bucket/wild/', 'bucket/wild/'),
+            'bucket/wildcard/file.raw': None,
+            'other/file.raw': None,
+            '': None,
+        }
+
+        groups, roots = index.match_series(pd.Series(list(expected)))
+
+        self.assertEqual(index.patterns, ['bucket/ephys/*', 'bucket/ephys/deep/*', 'bucket/fixed', 'bucket/wild*', '*'])
+        for position, (key, match) in enumerate(expected.items()):
+            self.assertEqual(index.match(key), match, key)
+            self.assertEqual((groups[position], roots[position]), match or (None, None), key)
+        self.assertIs(AtomicDirectoryIndex.coerce(index), index)
+        self.assertEqual(
+            retention_marker_target(atomic_retention_marker('bucket/ephys/run1/'), index),
+            ('atomic', 'bucket/ephys/run1/'),
+        )
+        self.assertIsNone(retention_marker_target('bucket/ephys/run1/raw/' + RETENTION_MARKER_NAME, index))
+
+    def test_effective_last_modified_groups_every_pattern_in_one_pass(self):
+        keys = [
+            'bucket/ephys/run1/a.raw',
+            'bucket/ephys/run1/b.raw',
+            atomic_retention_marker('bucket/ephys/run1/'),
+            'bucket/ephys/run2/a.raw',
+            'bucket/fixed/x.raw',
+            'bucket/fixed/y/z.raw',
+            'bucket/loose.raw',
+            file_retention_marker('bucket/loose.raw'),
+            # Not an atomic group root, so this marker is ignored.
+            atomic_retention_marker('bucket/ephys/run2/raw/'),
+        ]
+        inventory = pd.DataFrame(
+            {
+                'BucketKey': keys,
+                'LastModified': pd.to_datetime(
+                    [
+                        '2026-01-01T00:00:00Z',
+                        '2026-01-05T00:00:00Z',
+                        '2026-03-01T00:00:00Z',
+                        '2026-01-02T00:00:00Z',
+                        '2026-02-01T00:00:00Z',
+                        None,
+                        '2026-01-01T00:00:00Z',
+                        '2026-04-01T00:00:00Z',
+                        '2026-05-01T00:00:00Z',
+                    ],
+                    utc=True,
+                ),
+            },
+            # Chunked loads repeat index labels; updates must stay positional.
+            index=[0, 1, 0, 1, 0, 1, 0, 1, 0],
+        )
+
+        updated = apply_effective_last_modified(inventory, ['bucket/ephys/*', 'bucket/fixed'])
+
+        self.assertEqual(list(updated.index), list(inventory.index))
+        self.assertEqual(
+            list(updated['LastModified']),
+            list(
+                pd.to_datetime(
+                    [
+                        '2026-03-01T00:00:00Z',
+                        '2026-03-01T00:00:00Z',
+                        '2026-03-01T00:00:00Z',
+                        '2026-01-02T00:00:00Z',
+                        '2026-02-01T00:00:00Z',
+                        '2026-02-01T00:00:00Z',
+                        '2026-04-01T00:00:00Z',
+                        '2026-04-01T00:00:00Z',
+                        '2026-05-01T00:00:00Z',
+                    ],
+                    utc=True,
+                )
+            ),
+        )
+
     def test_newer_retention_marker_is_reuploaded_but_scientific_file_is_not(self):
         local = pd.DataFrame(
             {
@@ -288,6 +556,262 @@ class TestGeneratePutAndDeleteLists(unittest.TestCase):
 
         self.assertEqual(puts.tolist(), [f'bucket/file.bin.{RETENTION_MARKER_NAME}'])
 
+    def test_shared_inventory_diff_matches_per_question_membership_masks(self):
+        atomic_directories = ['bucket/ephys/*']
+        local_keys = [
+            'bucket/keep.bin',
+            'bucket/keep.bin',
+            'bucket/new.bin',
+            'bucket/skip/NOBACKUP',
+            'bucket/skip/new.bin',
+            file_retention_marker('bucket/keep.bin'),
+            file_retention_marker('bucket/new.bin'),
+            atomic_retention_marker('bucket/ephys/run-1/'),
+            'bucket/ephys/run-1/data.raw',
+            'bucket/ephys/run-1/nested/' + RETENTION_MARKER_NAME,
+        ]
+        glacier_keys = [
+            'bucket/keep.bin',
+            'bucket/old.bin',
+            'bucket/old.bin',
+            'bucket/recent.bin',
+            'bucket/skip/new.bin',
+            file_retention_marker('bucket/keep.bin'),
+            file_retention_marker('bucket/keep.bin'),
+            atomic_retention_marker('bucket/ephys/run-1/'),
+            file_retention_marker('bucket/gone.bin'),
+        ]
+        # Chunked loads concatenate without renumbering, so labels repeat.
+        local = pd.DataFrame(
+            {
+                'BucketKey': local_keys,
+                'LastModified': pd.date_range('2026-01-01', periods=len(local_keys), freq='D', tz='UTC'),
+            },
+            index=[index % 3 for index in range(len(local_keys))],
+        )
+        glacier = pd.DataFrame(
+            {
+                'BucketKey': glacier_keys,
+                'LastModified': pd.to_datetime(
+                    [
+                        '2020-01-01', '2020-01-01', '2020-06-01', '2026-06-01', '2020-01-01',
+                        '2026-01-01', '2026-03-01', '2027-01-01', '2020-01-01',
+                    ],
+                    utc=True,
+                ),
+            },
+            index=[index % 2 for index in range(len(glacier_keys))],
+        )
+        no_backup_prefixes = ['bucket/skip/']
+
+        puts, deletes = generate_put_and_delete_lists(
+            local, glacier, self.expire_date, no_backup_prefixes, atomic_directories
+        )
+
+        for_puts = local[~local['BucketKey'].str.startswith(tuple(no_backup_prefixes))]
+        expected_puts = for_puts[
+            (~lifecycle_control_mask(for_puts['BucketKey']) & ~for_puts['BucketKey'].isin(glacier['BucketKey']))
+            | marker_upload_mask(for_puts, glacier, atomic_directories)
+        ]['BucketKey']
+        scientific_glacier = scientific_inventory(glacier)
+        expected_deletes = scientific_glacier[
+            ~scientific_glacier['BucketKey'].isin(scientific_inventory(local)['BucketKey'])
+            & (scientific_glacier['LastModified'] < self.expire_date)
+        ]['BucketKey']
+        self.assertEqual(puts.tolist(), expected_puts.tolist())
+        self.assertEqual(puts.index.tolist(), expected_puts.index.tolist())
+        self.assertEqual(deletes.tolist(), expected_deletes.tolist())
+        self.assertEqual(
+            puts.tolist(),
+            ['bucket/new.bin', file_retention_marker('bucket/new.bin'), 'bucket/ephys/run-1/data.raw'],
+        )
+        self.assertEqual(deletes.tolist(), ['bucket/old.bin', 'bucket/old.bin'])
+
+        summary = build_comparison_summary(local, glacier, puts, deletes, None, no_backup_prefixes)
+        self.assertEqual(summary['eligible_local_distinct_objects'], 3)
+        self.assertEqual(summary['glacier_distinct_objects'], 4)
+
+    def test_encoded_nobackup_lookup_matches_row_string_tests(self):
+        local = pd.DataFrame(
+            {
+                'BucketKey': [
+                    'bucket/skip/NOBACKUP',
+                    'bucket/skip/a.bin',
+                    'bucket/skip/deeper/b.bin',
+                    'bucket/skipped/c.bin',
+                    'bucket/other/NOBACKUP',
+                    'bucket/skip/NOBACKUP',
+                    '/NOBACKUP',
+                    'NOBACKUP',
+                    'top-level.bin',
+                    'bucket/other/d.bin',
+                ],
+                'LastModified': pd.Timestamp('2026-01-01', tz='UTC'),
+            },
+            index=[0, 1] * 5,
+        )
+        glacier = local.iloc[:0]
+        diff = diff_inventories(local, glacier)
+
+        prefixes = find_no_backup_prefixes(local, diff)
+
+        self.assertEqual(prefixes, find_no_backup_prefixes(local))
+        self.assertEqual(prefixes, ['bucket/skip/', 'bucket/other/'])
+        for candidate in (prefixes, ['bucket/skip'], ['top'], []):
+            self.assertEqual(
+                no_backup_row_mask(local, candidate, diff).tolist(),
+                no_backup_row_mask(local, candidate).tolist(),
+                candidate,
+            )
+        self.assertEqual(
+            diff.local_scientific.tolist(),
+            (~lifecycle_control_mask(local['BucketKey'])).tolist(),
+        )
+        # The nearest (longest) covering prefix is reported for nested markers.
+        self.assertEqual(
+            diff.local_prefix_cover(['bucket/', 'bucket/skip/', 'top']).tolist(),
+            [1, 1, 1, 0, 0, 1, -1, -1, 2, 0],
+        )
+        summary = build_comparison_summary(
+            local, glacier, pd.Series(dtype=object), pd.Series(dtype=object), None, prefixes, diff=diff
+        )
+        self.assertEqual(
+            summary['no_backup'],
+            {
+                'prefixes': 2,
+                'excluded_local_rows': 3,
+                'largest_prefixes': [
+                    {'prefix': 'bucket/skip/', 'local_rows': 2},
+                    {'prefix': 'bucket/other/', 'local_rows': 1},
+                ],
+            },
+        )
+
+    def test_sharded_comparison_matches_single_process_run(self):
+        # Overlapping patterns: 'bucket/ephys/run-1/*' groups nest inside one run's group.
+        atomic_index = AtomicDirectoryIndex(['bucket/ephys/*', 'bucket/ephys/run-1/*'])
+        now_utc = datetime(2026, 6, 1, tzinfo=timezone.utc)
+        local_rows, glacier_rows = [], []
+        for run in range(12):
+            group = f'bucket/ephys/run-{run}/'
+            local_rows += [(f'{group}data.raw', f'2025-0{1 + run % 9}-01'), (f'{group}meta.json', '2025-01-01')]
+            glacier_rows += [(f'{group}data.raw', '2025-01-01'), (f'archive/old-{run}.bin', '2025-01-01')]
+            if run % 3 == 0:
+                local_rows.append((atomic_retention_marker(group), '2026-01-01'))
+            if run % 2 == 0:
+                local_rows += [(f'misc/file-{run}.bin', '2025-01-01'), (file_retention_marker(f'misc/file-{run}.bin'), '2026-02-01')]
+        local_rows += [
+            ('bucket/ephys/run-1/take-a/x.raw', '2025-11-01'),
+            ('bucket/other/a.bin', '2024-06-01'),
+            ('bucket/ephys/run-5/NOBACKUP', '2025-01-01'),
+        ]
+
+        def inventory(rows):
+            return pd.DataFrame(
+                {
+                    'BucketKey': [key for key, _ in rows],
+                    'LastModified': pd.to_datetime([stamp for _, stamp in rows], utc=True),
+                },
+                index=[position % 4 for position in range(len(rows))],
+            )
+
+        local, glacier = inventory(local_rows), inventory(glacier_rows)
+        no_backup_prefixes = find_no_backup_prefixes(local)
+        serial_local = apply_effective_last_modified(local, atomic_index)
+        serial_glacier = apply_effective_last_modified(glacier, atomic_index, authoritative_markers=serial_local)
+        diff = diff_inventories(serial_local, serial_glacier)
+        expected_masks = put_and_glacier_only_masks(
+            serial_local, serial_glacier, no_backup_prefixes, atomic_index, diff=diff
+        )
+        window = dict(s3_expire_days=400, cold_storage_expire_days=600, notification_days=200, now_utc=now_utc)
+        expected_cleanup = build_cleanup_window_entries(
+            serial_local, serial_glacier, atomic_directories=atomic_index, diff=diff, **window
+        )
+
+        sharded_local, sharded_glacier, masks, cleanup_window, key_counts = compare_inventories_in_shards(
+            local, glacier, processes=2, atomic_index=atomic_index, no_backup_prefixes=no_backup_prefixes, **window
+        )
+
+        pd.testing.assert_frame_equal(sharded_local, serial_local)
+        pd.testing.assert_frame_equal(sharded_glacier, serial_glacier)
+        self.assertEqual(masks[0].tolist(), expected_masks[0].tolist())
+        self.assertEqual(masks[1].tolist(), expected_masks[1].tolist())
+        self.assertFalse(expected_cleanup.empty)
+        pd.testing.assert_frame_equal(cleanup_window, expected_cleanup)
+        self.assertEqual(key_counts, comparison_key_counts(serial_local, serial_glacier, no_backup_prefixes, diff))
+
+    def test_prefix_rollups_total_atomic_groups_and_folder_depths(self):
+        atomic_index = AtomicDirectoryIndex(['bucket/ephys/*'])
+        local = pd.DataFrame(
+            {
+                'BucketKey': [
+                    'bucket/ephys/run-1/take/a.raw',
+                    'bucket/ephys/run-1/b.raw',
+                    atomic_retention_marker('bucket/ephys/run-1/'),
+                    'bucket/ephys/loose.raw',
+                    'bucket/quiet/NOBACKUP',
+                    'bucket/quiet/c.bin',
+                    'top.bin',
+                ],
+                'Size': pd.array([10, 20, 0, 4, 0, 7, 1], dtype='Int64'),
+                'LastModified': pd.to_datetime(
+                    ['2026-01-05', '2026-01-05', '2026-01-05', '2026-01-02', '2026-01-01', '2026-01-03', '2026-01-01'],
+                    utc=True,
+                ),
+            }
+        )
+        glacier = pd.DataFrame(
+            {
+                'BucketKey': ['bucket/ephys/run-0/z.raw', 'bucket/quiet/c.bin'],
+                'Size': pd.array([100, 7], dtype='Int64'),
+                'LastModified': pd.to_datetime(['2025-06-01', '2026-01-03'], utc=True),
+            }
+        )
+
+        rollups = build_prefix_rollups(
+            local,
+            glacier,
+            local_scientific=~lifecycle_control_mask(local['BucketKey']).to_numpy(dtype=bool),
+            put_mask=[True, False, True, True, False, False, False],
+            no_backup_mask=no_backup_row_mask(local, find_no_backup_prefixes(local)),
+            glacier_only_mask=[True, False],
+            atomic_directories=atomic_index,
+            s3_expire_days=30,
+            cold_storage_expire_days=365,
+        )
+
+        rows = {(row.GroupingType, row.GroupingKey): row for row in rollups.itertuples()}
+        self.assertEqual(
+            list(rows),
+            [
+                ('atomic', 'bucket/ephys/loose.raw/'),
+                ('atomic', 'bucket/ephys/run-0/'),
+                ('atomic', 'bucket/ephys/run-1/'),
+                ('folder', 'bucket/'),
+                ('folder', 'bucket/ephys/'),
+                ('folder', 'bucket/quiet/'),
+                ('folder', 'bucket/ephys/run-0/'),
+                ('folder', 'bucket/ephys/run-1/'),
+            ],
+        )
+        for key in ['bucket/ephys/run-1/take/a.raw', 'bucket/quiet/c.bin']:
+            self.assertIn(('folder', derive_folder_group(key)), rows)
+        run = rows[('atomic', 'bucket/ephys/run-1/')]
+        self.assertEqual(
+            (run.Depth, run.ObjectCount, run.TotalBytes, run.PendingPutObjects, run.PendingPutBytes),
+            (3, 2, 30, 1, 10),
+        )
+        self.assertEqual(run.NextS3CleanupDate, pd.Timestamp('2026-02-04', tz='UTC'))
+        bucket = rows[('folder', 'bucket/')]
+        self.assertEqual((bucket.ObjectCount, bucket.TotalBytes, bucket.PendingPutBytes), (4, 41, 14))
+        self.assertEqual(bucket.EarliestLastModified, pd.Timestamp('2026-01-02', tz='UTC'))
+        self.assertEqual(bucket.LatestLastModified, pd.Timestamp('2026-01-05', tz='UTC'))
+        self.assertEqual((bucket.GlacierOnlyObjects, bucket.GlacierOnlyBytes), (1, 100))
+        self.assertEqual(bucket.NextGlacierCleanupDate, pd.Timestamp('2026-06-01', tz='UTC'))
+        quiet = rows[('folder', 'bucket/quiet/')]
+        self.assertEqual(quiet.ObjectCount, 1)
+        self.assertTrue(pd.isna(quiet.NextS3CleanupDate))
+
     def test_stage4_does_not_skip_an_existing_retention_marker(self):
         marker = file_retention_marker('bucket/file.bin')
         stats = ProgressStats(1)
@@ -457,6 +981,64 @@ class TestCleanupWindowArtifacts(unittest.TestCase):
         self.assertTrue((summary['GroupingKey'] == 'bucket/ephys/run1/').any())
         self.assertTrue((summary['GroupingKey'] == 'bucket/ephys/run2/').any())
 
+    def test_compiled_grouping_matches_per_key_derivation(self):
+        atomic_directories = ['bucket/ephys/*', 'bucket/fixed/set', 'bucket/wild*', 'bucket/ephys/deep/*', '*']
+        keys = [
+            'bucket/ephys/run1/data.raw',
+            'bucket/ephys/run1',
+            'bucket/ephys//run1/data.raw',
+            'bucket/ephys/deep/x/y.raw',
+            'bucket/fixed/set/a/b.raw',
+            'bucket/fixed/settle.raw',
+            'bucket/wild/file.raw',
+            'bucket/wildcard/file.raw',
+            'bucket/a/b/c/d/e.raw',
+            '/bucket//a///b/c.raw',
+            'bucket/a/b/',
+            'bucket/file.raw',
+            'top-level.raw',
+            '/',
+        ]
+
+        grouping_types, grouping_keys, atomic_roots = derive_grouping_columns(pd.Series(keys), atomic_directories)
+
+        expected = []
+        for key in keys:
+            group, root = derive_atomic_group_info(key, atomic_directories)
+            if group:
+                expected.append(('atomic', group, root))
+            else:
+                expected.append(('folder', derive_folder_group(key), ''))
+        self.assertEqual(list(zip(grouping_types, grouping_keys, atomic_roots)), expected)
+
+    def test_days_until_cleanup_rounds_partial_days_up(self):
+        now_utc = datetime(2026, 3, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+        local = pd.DataFrame(
+            {
+                'BucketKey': ['bucket/a/exact.bin', 'bucket/a/partial.bin', 'bucket/a/now.bin'],
+                'LastModified': [
+                    now_utc - timedelta(days=28),
+                    now_utc - timedelta(days=28) + timedelta(microseconds=1),
+                    now_utc - timedelta(days=30),
+                ],
+            }
+        )
+
+        cleanup_window = build_cleanup_window_entries(
+            local,
+            pd.DataFrame({'BucketKey': pd.Series(dtype=object), 'LastModified': pd.Series(dtype='datetime64[ns, UTC]')}),
+            s3_expire_days=30,
+            cold_storage_expire_days=365,
+            notification_days=7,
+            atomic_directories=[],
+            now_utc=now_utc,
+        )
+
+        self.assertEqual(
+            dict(zip(cleanup_window['BucketKey'], cleanup_window['DaysUntilCleanup'])),
+            {'bucket/a/exact.bin': 2, 'bucket/a/partial.bin': 3, 'bucket/a/now.bin': 0},
+        )
+
     def test_cleanup_slack_message_contains_counts_and_destination_link(self):
         cleanup_window = build_cleanup_window_entries(
             self.local_inventory_df,
@@ -544,6 +1126,113 @@ class TestCleanupWindowArtifacts(unittest.TestCase):
             os.unlink(notifications_path)
 
 
+    def test_schedule_artifacts_share_one_rendering_with_gzip_copies(self):
+        cleanup_window = build_cleanup_window_entries(
+            self.local_inventory_df,
+            self.glacier_inventory_df,
+            s3_expire_days=30,
+            cold_storage_expire_days=365,
+            notification_days=90,
+            atomic_directories=['bucket/ephys/*'],
+            now_utc=self.now_utc,
+        )
+        self.assertFalse(cleanup_window.empty)
+        summary = build_cleanup_summary(cleanup_window)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            paths = {name: os.path.join(output_dir, name) for name in ['puts', 'notifications', 'window', 'summary']}
+            output_puts_deletes_and_notifications(
+                puts=pd.Series(['bucket/a,b.bin', 'bucket/c.bin']),
+                deletes=pd.Series([], dtype='object'),
+                bad_keys=None,
+                notifications=cleanup_window,
+                cleanup_window=cleanup_window,
+                cleanup_summary=summary,
+                cleanup_slack_message='',
+                puts_output_filepath=paths['puts'],
+                notifications_output_filepath=paths['notifications'],
+                cleanup_window_output_filepath=paths['window'],
+                cleanup_summary_output_filepath=paths['summary'],
+                gzip_artifacts=True,
+            )
+
+            expected_window = cleanup_window.copy()
+            for column in ['SourceLastModified', 'ScheduledCleanupDate']:
+                expected_window[column] = expected_window[column].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+            expected_summary = summary.copy()
+            for column in ['EarliestCleanupDate', 'LatestCleanupDate']:
+                expected_summary[column] = expected_summary[column].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+            expected = {
+                'puts': pd.Series(['bucket/a,b.bin', 'bucket/c.bin']).to_csv(index=False, header=False),
+                'notifications': expected_window.to_csv(index=False),
+                'window': expected_window.to_csv(index=False),
+                'summary': expected_summary.to_csv(index=False),
+            }
+            for name, path in paths.items():
+                with open(path, 'r', encoding='utf8', newline='') as artifact:
+                    self.assertEqual(artifact.read(), expected[name], name)
+                with gzip.open(f'{path}.gz', 'rt', encoding='utf8', newline='') as artifact:
+                    self.assertEqual(artifact.read(), expected[name], name)
+
+    def test_artifact_timestamps_keep_missing_values_empty(self):
+        timestamps = pd.Series(pd.to_datetime(['2026-01-02T03:04:05.9Z', None], utc=True))
+
+        self.assertEqual(list(format_utc_timestamps(timestamps)), ['2026-01-02T03:04:05Z', None])
+
+
+class TestStage3Benchmark(unittest.TestCase):
+    def test_synthetic_inventories_exercise_policy_features(self):
+        config = load_config_file(DEFAULT_BENCHMARK_CONFIG_PATH)
+        anchor = datetime(2026, 10, 18, tzinfo=timezone.utc)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            local_path, glacier_path = generate_synthetic_inventories(
+                output_dir, 50_000, config=config, anchor=anchor, chunk_rows=16_000
+            )
+            with contextlib.redirect_stdout(StringIO()):
+                stats = {}
+                local, glacier, bad_keys = load_inventories(str(local_path), str(glacier_path), stats=stats)
+
+        self.assertEqual(stats['nrp_input_rows'], 50_000)
+        self.assertGreater(stats['nrp_normalized_key_rows'], 0)
+        self.assertGreater(stats['aws_normalized_key_rows'], 0)
+        self.assertGreater(len(bad_keys), 0)
+        self.assertTrue(glacier['BucketKey'].str.contains('@lab (copy)', regex=False).any())
+        self.assertTrue(local['BucketKey'].map(is_retention_marker).any())
+        self.assertTrue(find_no_backup_prefixes(local))
+        atomic_index = AtomicDirectoryIndex(config['backup']['atomic_directories'])
+        self.assertTrue(local['BucketKey'].map(lambda key: atomic_index.group_for_key(key) is not None).any())
+
+    def test_benchmark_regressions_compare_matching_runs(self):
+        def result(processes, load_seconds, short_seconds, peak_rss_mib):
+            return {
+                'environment': {'seed': 0, 'processes': processes, 'chunk_rows': 0, 'version': '38'},
+                'runs': [
+                    {
+                        'rows': 1_000_000,
+                        'peak_rss_mib': peak_rss_mib,
+                        'phases': {
+                            'load_inventories': {'wall_seconds': load_seconds},
+                            'load_config': {'wall_seconds': short_seconds},
+                        },
+                    }
+                ],
+            }
+
+        baseline = result(1, 10.0, 0.01, 1000.0)
+
+        self.assertEqual(find_regressions(result(1, 12.0, 0.5, 1100.0), baseline), [])
+        self.assertEqual(
+            find_regressions(result(1, 13.0, 0.01, 1300.0), baseline),
+            [
+                'rows=1000000 phase=load_inventories wall_seconds 10.00 -> 13.00',
+                'rows=1000000 peak_rss_mib 1000.0 -> 1300.0',
+            ],
+        )
+        with self.assertRaises(ValueError):
+            find_regressions(result(2, 10.0, 0.01, 1000.0), baseline)
+
+
 class TestStage3ProgressAndSummary(unittest.TestCase):
     def test_progress_reporter_emits_phase_and_memory_heartbeat(self):
         output = StringIO()
@@ -563,6 +1252,33 @@ class TestStage3ProgressAndSummary(unittest.TestCase):
         self.assertIn('[stage3][heartbeat] phase=unit_test', rendered)
         self.assertIn('rss_mib=123.5 peak_rss_mib=456.5', rendered)
 
+    def test_progress_reporter_profiles_phases_with_details_and_capture(self):
+        peaks = iter([100.0, 100.0, 150.0, 150.0, 150.0, 170.0])
+        reporter = Stage3ProgressReporter(
+            interval_seconds=0,
+            memory_reader=lambda: {'rss_mib': 90.0, 'peak_rss_mib': next(peaks)},
+            capture=PhaseCapture('compare', 'tracemalloc'),
+        )
+
+        with contextlib.redirect_stdout(StringIO()):
+            reporter.set_phase('load', local_bytes=10)
+            reporter.record(local_rows=3)
+            reporter.set_phase('compare')
+            retained = [bytearray(1024) for _ in range(64)]
+            reporter.stop()
+        profile = reporter.profile.as_dict()
+
+        self.assertEqual([phase['phase'] for phase in profile['phases']], ['load', 'compare'])
+        load, compare = profile['phases']
+        self.assertEqual(load['details'], {'local_bytes': 10, 'local_rows': 3})
+        self.assertEqual(load['peak_rss_growth_mib'], 50.0)
+        self.assertGreaterEqual(load['wall_seconds'], 0.0)
+        self.assertNotIn('capture', load)
+        self.assertEqual(compare['capture']['mode'], 'tracemalloc')
+        self.assertGreater(compare['capture']['peak_traced_mib'], 0.05)
+        self.assertEqual(profile['peak_rss_mib'], 170.0)
+        self.assertEqual(len(retained), 64)
+
     def test_comparison_summary_counts_distinct_eligible_objects(self):
         local_inventory = pd.DataFrame(
             {
@@ -630,6 +1346,8 @@ class TestStage3ProgressAndSummary(unittest.TestCase):
                 'cleanup_summary': 'cleanup-summary.csv',
                 'slack': 'cleanup-slack.txt',
                 'comparison_summary': 'comparison-summary.json',
+                'prefix_rollups': 'prefix-rollups.csv',
+                'puts_manifest': 'puts-manifest.csv',
             }
             output_paths = {name: os.path.join(temp_dir, filename) for name, filename in output_names.items()}
 
@@ -660,6 +1378,8 @@ class TestStage3ProgressAndSummary(unittest.TestCase):
                 output_paths['slack'],
                 output_paths['comparison_summary'],
                 progress_interval_seconds=0,
+                prefix_rollups_output=output_paths['prefix_rollups'],
+                puts_manifest_output=output_paths['puts_manifest'],
             )
 
             with open(output_paths['comparison_summary'], 'r', encoding='utf8') as summary_file:
@@ -668,6 +1388,17 @@ class TestStage3ProgressAndSummary(unittest.TestCase):
             self.assertEqual(summary['pending_put_distinct_objects'], 1)
             self.assertEqual(summary['pending_upload_fraction'], 1.0)
             self.assertEqual(summary['inventory_processing']['nrp_input_rows'], 1)
+            rollups = pd.read_csv(output_paths['prefix_rollups'])
+            self.assertEqual(
+                rollups[['GroupingKey', 'ObjectCount', 'PendingPutBytes', 'GlacierOnlyBytes']].values.tolist(),
+                [['bucket/', 1, 10, 20]],
+            )
+            self.assertEqual(rollups.loc[0, 'NextGlacierCleanupDate'], '2026-01-01T00:00:00Z')
+            with open(output_paths['puts_manifest'], 'r', encoding='utf8') as manifest_file:
+                self.assertEqual(
+                    manifest_file.read(),
+                    'BucketKey,Size,LastModified,AtomicGroup\nbucket/local-only,10,2026-01-01T00:00:00Z,\n',
+                )
             for output_path in output_paths.values():
                 self.assertTrue(os.path.isfile(output_path), output_path)
 
@@ -787,6 +1518,83 @@ class TestStage4PutParsing(unittest.TestCase):
         finally:
             os.unlink(puts_path)
 
+    def test_put_manifest_orders_puts_largest_first_interleaved_with_smallest(self):
+        sizes = {
+            'bucket/a.raw.h5': 900,
+            'bucket/b,c.bin': 5,
+            'bucket/ephys/run/d.raw': 400,
+            'bucket/e.json': 1,
+            'bucket/f.bin': 50,
+        }
+        inventory = pd.DataFrame(
+            {
+                'BucketKey': list(sizes) + ['bucket/stored.bin'],
+                'Size': pd.array(list(sizes.values()) + [7], dtype='Int64'),
+                'LastModified': pd.to_datetime(['2026-01-01'] * (len(sizes) + 1), utc=True),
+            }
+        )
+        put_mask = [True] * len(sizes) + [False]
+        manifest = build_puts_manifest(inventory, put_mask, ['bucket/ephys/*'])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            puts_path = os.path.join(temp_dir, 'puts.txt')
+            manifest_path = os.path.join(temp_dir, 'puts-manifest.csv')
+            write_csv_artifact(inventory.loc[put_mask, 'BucketKey'], [puts_path], index=False, header=False)
+            write_csv_artifact(manifest, [manifest_path], timestamp_columns=['LastModified'], index=False)
+            put_index = load_put_index(puts_path)
+            loaded_sizes = load_manifest_sizes(manifest_path, put_index)
+            ordered = list(put_index.ordered(order_by_size(loaded_sizes, np.random.default_rng(0))))
+            manifest.iloc[1:].to_csv(manifest_path, index=False)
+            with self.assertRaisesRegex(ValueError, 'does not match puts.txt'):
+                load_manifest_sizes(manifest_path, put_index)
+            put_index.close()
+
+        self.assertEqual(manifest['AtomicGroup'].tolist(), ['', '', 'bucket/ephys/run/', '', ''])
+        self.assertEqual(loaded_sizes.tolist(), list(sizes.values()))
+        self.assertEqual(
+            ordered,
+            ['bucket/a.raw.h5', 'bucket/e.json', 'bucket/ephys/run/d.raw', 'bucket/b,c.bin', 'bucket/f.bin'],
+        )
+
+    def test_put_index_matches_load_put_keys_and_is_reused(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            puts_path = os.path.join(temp_dir, 'puts.txt')
+            with open(puts_path, 'w', encoding='utf8', newline='') as puts_file:
+                puts_file.write('"bucket/path/file,with,commas.bin"\r\n')
+                puts_file.write('\n')
+                puts_file.write('s3://bucket/path/normal.bin\n')
+                puts_file.write('bucket/path/normal.bin\n')
+                puts_file.write(f'bucket/path/{RETENTION_MARKER_NAME}\n')
+                puts_file.write('bucket/path/caf\u00e9.bin')
+            keys = load_put_keys(puts_path)
+
+            put_index = load_put_index(puts_path)
+            self.assertEqual(list(put_index.ordered(range(len(put_index)))), keys)
+            self.assertEqual(list(put_index.ordered([3, 0])), [keys[3], keys[0]])
+            self.assertEqual(
+                put_index.put_counts(),
+                {
+                    'rows': 5,
+                    'distinct': 4,
+                    'data_rows': 4,
+                    'data_distinct': 3,
+                    'control_rows': 1,
+                    'control_distinct': 1,
+                },
+            )
+            put_index.close()
+
+            reused = load_put_index(puts_path)
+            self.assertIsInstance(reused.entries, np.memmap)
+            self.assertEqual(list(reused.ordered(range(len(reused)))), keys)
+            reused.close()
+
+            with open(puts_path, 'a', encoding='utf8') as puts_file:
+                puts_file.write('\nbad_key_without_slash\n')
+            with self.assertRaisesRegex(ValueError, 'malformed PUT key'):
+                load_put_index(puts_path)
+            self.assertTrue(os.path.exists(f'{puts_path}{PUT_INDEX_SUFFIX}'))
+
     def test_build_source_lookup_candidates_recovers_rclone_dot_and_scheme_artifacts(self):
         dot_key = 'braingeneersdev/asrobbin/game_spikes/．/exp2_cartpole_long_7_logs.pkl'
         scheme_key = 'braingeneers/ephys/s3:/braingeneersdev/hschweig/20185_baseline.raw.h5'
@@ -872,7 +1680,8 @@ class TestStage4UploadSeam(unittest.TestCase):
                 return False
 
             def write(self, data):
-                writes.append(data)
+                # Writers must copy what they keep: stream_upload reuses its chunk buffer.
+                writes.append(bytes(data))
 
         def destination_opener(url, mode, transport_params):
             self.assertEqual(mode, 'wb')
@@ -1024,6 +1833,727 @@ class TestStage4UploadSeam(unittest.TestCase):
         self.assertEqual(result['status'], 'missing_source')
         self.assertEqual(result['head_visible_source_key'], 'bucket/head-visible-get-missing.bin')
 
+    def _parallel_clients(self, payload, fail_part=None, stored_parts=()):
+        calls = []
+        lock = threading.Lock()
+        self_test = self
+
+        def record(name, **kwargs):
+            with lock:
+                calls.append((name, kwargs))
+
+        class SourceClient:
+            def head_object(self, **kwargs):
+                record('head_object', **kwargs)
+                return {'ContentLength': len(payload), 'ETag': '"v1"'}
+
+            def get_object(self, **kwargs):
+                record('get_object', **kwargs)
+                first_byte, last_byte = map(int, kwargs['Range'][len('bytes='):].split('-'))
+                return {'Body': BytesIO(payload[first_byte:last_byte + 1])}
+
+        class DestinationClient:
+            def create_multipart_upload(self, **kwargs):
+                record('create_multipart_upload', **kwargs)
+                return {'UploadId': 'upload-1'}
+
+            def upload_part(self, **kwargs):
+                # upload_part bodies share a reused part buffer, so keep a copy.
+                record('upload_part', **{**kwargs, 'Body': bytes(kwargs['Body'])})
+                if kwargs['PartNumber'] == fail_part:
+                    raise SSLError(endpoint_url='https://s3.amazonaws.com', error='EOF occurred in violation of protocol')
+                return {'ETag': f'"etag-{kwargs["PartNumber"]}"'}
+
+            def complete_multipart_upload(self, **kwargs):
+                record('complete_multipart_upload', **kwargs)
+
+            def abort_multipart_upload(self, **kwargs):
+                record('abort_multipart_upload', **kwargs)
+
+            def get_paginator(self, operation):
+                self_test.assertEqual(operation, 'list_parts')
+                paginator = mock.Mock()
+                paginator.paginate.return_value = [{'Parts': list(stored_parts)}]
+                return paginator
+
+        return SourceClient(), DestinationClient(), calls
+
+    def test_copy_file_uploads_large_objects_as_parallel_ranged_parts(self):
+        payload = bytes(range(256)) * 5
+        source_client, destination_client, calls = self._parallel_clients(payload)
+        stats = ProgressStats(total_files=1)
+        result = copy_file(
+            source_key='bucket/large-file.raw.h5',
+            glacier_bucket='glacier-bucket',
+            retries=0,
+            retry_base_seconds=0.01,
+            retry_max_seconds=0.01,
+            stats=stats,
+            head_object_func=self._missing_head_object,
+            s3_client=destination_client,
+            source_s3_client=source_client,
+            copy_chunk_bytes=100,
+            source_size=len(payload),
+            parallel_multipart_threshold_bytes=1000,
+            parallel_part_size_bytes=512,
+            parallel_part_concurrency=2,
+        )
+
+        self.assertEqual(result['status'], 'uploaded')
+        self.assertEqual(result['bytes_copied'], len(payload))
+        self.assertEqual(stats.snapshot()['stream_bytes'], len(payload))
+        uploaded = sorted((kwargs['PartNumber'], kwargs['Body']) for name, kwargs in calls if name == 'upload_part')
+        self.assertEqual([part_number for part_number, _ in uploaded], [1, 2, 3])
+        self.assertEqual(b''.join(body for _, body in uploaded), payload)
+        self.assertEqual(max(len(body) for _, body in uploaded), 512)
+        self.assertTrue(all(kwargs['IfMatch'] == '"v1"' for name, kwargs in calls if name == 'get_object'))
+        complete = [kwargs for name, kwargs in calls if name == 'complete_multipart_upload']
+        self.assertEqual(
+            complete[0]['MultipartUpload']['Parts'],
+            [{'PartNumber': number, 'ETag': f'"etag-{number}"'} for number in (1, 2, 3)],
+        )
+
+        source_client, destination_client, calls = self._parallel_clients(payload, fail_part=2)
+        with contextlib.redirect_stderr(StringIO()):
+            result = copy_file(
+                source_key='bucket/large-file.raw.h5',
+                glacier_bucket='glacier-bucket',
+                retries=0,
+                retry_base_seconds=0.01,
+                retry_max_seconds=0.01,
+                stats=ProgressStats(total_files=1),
+                head_object_func=self._missing_head_object,
+                s3_client=destination_client,
+                source_s3_client=source_client,
+                source_size=len(payload),
+                parallel_multipart_threshold_bytes=1000,
+                parallel_part_size_bytes=512,
+                parallel_part_concurrency=1,
+            )
+        self.assertEqual(result['status'], 'failed')
+        self.assertIsInstance(result['error'], SSLError)
+        names = [name for name, _ in calls]
+        self.assertEqual(names[-1], 'abort_multipart_upload')
+        self.assertNotIn('complete_multipart_upload', names)
+        self.assertEqual(
+            len(parallel_part_ranges(100 * 1024 ** 3, 8 * 1024 * 1024)),
+            len(range(0, 100 * 1024 ** 3, 11 * 1024 * 1024)),
+        )
+
+    def test_parallel_parts_are_read_into_one_reused_buffer_per_thread(self):
+        class ReadOnlyBody:
+            def __init__(self, data):
+                self._stream = BytesIO(data)
+
+            def read(self, size):
+                return self._stream.read(size)
+
+        view = memoryview(bytearray(4))
+        self.assertEqual(read_into(ReadOnlyBody(b'abcdef'), view), 4)
+        self.assertEqual(view.tobytes(), b'abcd')
+        self.assertEqual(read_into(BytesIO(b'xy'), view), 2)
+        self.assertEqual(read_into(BytesIO(b''), view), 0)
+
+        payload = bytes(range(256)) * 6
+        source_client, destination_client, calls = self._parallel_clients(payload)
+        recorded_upload_part = destination_client.upload_part
+        bodies = []
+
+        def upload_part(**kwargs):
+            bodies.append(kwargs['Body'])
+            return recorded_upload_part(**kwargs)
+
+        destination_client.upload_part = upload_part
+        parallel_multipart_upload(
+            'bucket/large-file.raw.h5',
+            'glacier-bucket',
+            'bucket/large-file.raw.h5',
+            s3_client=destination_client,
+            source_s3_client=source_client,
+            part_size_bytes=512,
+            part_concurrency=1,
+            copy_chunk_bytes=100,
+        )
+
+        self.assertEqual(len(bodies), 3)
+        self.assertIsInstance(bodies[0], bytearray)
+        self.assertTrue(all(body is bodies[0] for body in bodies))
+        uploaded = [kwargs['Body'] for name, kwargs in calls if name == 'upload_part']
+        self.assertEqual(b''.join(uploaded), payload)
+
+    def test_multipart_journal_continues_a_failed_upload_from_its_stored_parts(self):
+        payload = bytes(range(256)) * 5
+        copy_kwargs = {
+            'source_key': 'bucket/large-file.raw.h5',
+            'glacier_bucket': 'glacier-bucket',
+            'retries': 0,
+            'retry_base_seconds': 0.01,
+            'retry_max_seconds': 0.01,
+            'head_object_func': self._missing_head_object,
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_path = os.path.join(temp_dir, MULTIPART_JOURNAL_NAME)
+            journal = MultipartJournal(journal_path)
+            source_client, destination_client, calls = self._parallel_clients(payload, fail_part=2)
+            with contextlib.redirect_stderr(StringIO()):
+                result = copy_file(
+                    stats=ProgressStats(total_files=1),
+                    s3_client=destination_client,
+                    source_s3_client=source_client,
+                    source_size=len(payload),
+                    parallel_multipart_threshold_bytes=1000,
+                    parallel_part_size_bytes=512,
+                    parallel_part_concurrency=1,
+                    multipart_journal=journal,
+                    **copy_kwargs,
+                )
+            journal.close()
+            self.assertEqual(result['status'], 'failed')
+            self.assertNotIn('abort_multipart_upload', [name for name, _ in calls])
+            stored_parts = [
+                {'PartNumber': kwargs['PartNumber'], 'ETag': f'"etag-{kwargs["PartNumber"]}"', 'Size': len(kwargs['Body'])}
+                for name, kwargs in calls
+                if name == 'upload_part' and kwargs['PartNumber'] != 2
+            ]
+
+            journal = MultipartJournal(journal_path)
+            entry = journal.open_upload('bucket/large-file.raw.h5')
+            self.assertEqual(entry['upload_id'], 'upload-1')
+            self.assertEqual(entry['part_size'], 512)
+            self.assertEqual(entry['parts'][1], '"etag-1"')
+            self.assertNotIn(2, entry['parts'])
+            source_client, destination_client, calls = self._parallel_clients(payload, stored_parts=stored_parts)
+            with contextlib.redirect_stderr(StringIO()):
+                result = copy_file(
+                    stats=ProgressStats(total_files=1),
+                    s3_client=destination_client,
+                    source_s3_client=source_client,
+                    multipart_journal=journal,
+                    **copy_kwargs,
+                )
+            journal.close()
+            journal = MultipartJournal(journal_path)
+            reopened_entry = journal.open_upload('bucket/large-file.raw.h5')
+            journal.close()
+            with open(journal_path, 'r', encoding='utf8') as journal_file:
+                compacted = journal_file.read()
+
+        self.assertEqual(result['status'], 'uploaded')
+        names = [name for name, _ in calls]
+        self.assertNotIn('create_multipart_upload', names)
+        uploaded = sorted(kwargs['PartNumber'] for name, kwargs in calls if name == 'upload_part')
+        self.assertEqual(uploaded, sorted({1, 2, 3} - {part['PartNumber'] for part in stored_parts}))
+        complete = [kwargs for name, kwargs in calls if name == 'complete_multipart_upload'][0]
+        self.assertEqual(complete['UploadId'], 'upload-1')
+        self.assertEqual([part['PartNumber'] for part in complete['MultipartUpload']['Parts']], [1, 2, 3])
+        self.assertIsNone(reopened_entry)
+        self.assertEqual(compacted, '')
+
+    def test_journaled_upload_is_aborted_when_the_key_is_skipped_or_its_source_is_gone(self):
+        payload = bytes(range(256)) * 5
+        copy_kwargs = {
+            'glacier_bucket': 'glacier-bucket',
+            'retries': 0,
+            'retry_base_seconds': 0.01,
+            'retry_max_seconds': 0.01,
+            'stats': ProgressStats(total_files=1),
+        }
+        keys = ['bucket/listed.raw.h5', 'bucket/head-found.raw.h5', 'bucket/source-gone.raw.h5']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal = MultipartJournal(os.path.join(temp_dir, MULTIPART_JOURNAL_NAME))
+            for key in keys:
+                journal.record_create(key, f'upload-{key}', '"v1"', len(payload), 512)
+            source_client, destination_client, calls = self._parallel_clients(payload)
+
+            def missing_source_head(**kwargs):
+                self._missing_head_object()
+
+            results = [
+                copy_file(
+                    source_key=keys[0],
+                    s3_client=destination_client,
+                    destination_exists=True,
+                    multipart_journal=journal,
+                    **copy_kwargs,
+                ),
+                copy_file(
+                    source_key=keys[1],
+                    s3_client=destination_client,
+                    head_object_func=lambda *_args, **_kwargs: {},
+                    multipart_journal=journal,
+                    **copy_kwargs,
+                ),
+            ]
+            source_client.head_object = missing_source_head
+            with self.assertRaises(ClientError):
+                parallel_multipart_upload(
+                    keys[2],
+                    'glacier-bucket',
+                    keys[2],
+                    s3_client=destination_client,
+                    source_s3_client=source_client,
+                    journal=journal,
+                )
+            open_uploads = journal.open_uploads()
+            journal.close()
+
+        self.assertEqual([result['status'] for result in results], ['skipped_existing', 'skipped_existing'])
+        aborted = [(kwargs['Key'], kwargs['UploadId']) for name, kwargs in calls if name == 'abort_multipart_upload']
+        self.assertEqual(aborted, [(key, f'upload-{key}') for key in keys])
+        self.assertEqual(open_uploads, {})
+
+    def test_stale_journaled_uploads_are_aborted_and_fresh_ones_kept(self):
+        class AbortClient:
+            def __init__(self):
+                self.aborted = []
+
+            def abort_multipart_upload(self, **kwargs):
+                self.aborted.append((kwargs['Key'], kwargs['UploadId']))
+
+        now = datetime(2026, 10, 18, 12, tzinfo=timezone.utc).timestamp()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_path = os.path.join(temp_dir, MULTIPART_JOURNAL_NAME)
+            with open(journal_path, 'w', encoding='utf8') as journal_file:
+                # Journaled before uploads recorded their creation time.
+                journal_file.write(json.dumps({'event': 'create', 'key': 'bucket/legacy.bin', 'upload_id': 'legacy'}) + '\n')
+            journal = MultipartJournal(journal_path)
+            journal.record_create('bucket/old.bin', 'old', '"v1"', 100, 50, created_at_utc='2026-10-14T12:00:00Z')
+            journal.record_create('bucket/fresh.bin', 'fresh', '"v1"', 100, 50, created_at_utc='2026-10-17T12:00:00Z')
+            journal.close()
+            journal = MultipartJournal(journal_path)
+            client = AbortClient()
+
+            aborted = abort_stale_multipart_uploads(client, 'glacier-bucket', journal, 72, now=now)
+            open_uploads = journal.open_uploads()
+            journal.close()
+
+        self.assertEqual(aborted, 2)
+        self.assertEqual(sorted(client.aborted), [('bucket/legacy.bin', 'legacy'), ('bucket/old.bin', 'old')])
+        self.assertEqual(list(open_uploads), ['bucket/fresh.bin'])
+        self.assertEqual(open_uploads['bucket/fresh.bin']['created_at_utc'], '2026-10-17T12:00:00Z')
+
+    def test_resume_skips_keys_the_lineage_completed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            puts_path = os.path.join(temp_dir, 'puts.txt')
+            log_path = os.path.join(temp_dir, 'activity.log')
+            with open(puts_path, 'w', encoding='utf8') as puts_file:
+                puts_file.write('bucket/a.bin\nbucket/b.bin\nbucket/c.bin\nbucket/d.bin\n')
+            self.assertIsNone(load_resumable_lineage(log_path, puts_path))
+            save_run_state(log_path, puts_path, '2026-10-18T12:00:00Z')
+            logger = ActivityLogger(log_path, '2026-10-18T12:00:00Z')
+            logger.record_event('bucket/a.bin', 'bucket/a.bin', 10, 'archive', 'uploaded')
+            logger.record_event('bucket/b.bin', 'bucket/b.bin', 0, 'archive', 'already_present_skipped')
+            logger.close()
+            logger = ActivityLogger(log_path, '2026-10-11T12:00:00Z')
+            logger.record_event('bucket/c.bin', 'bucket/c.bin', 10, 'archive', 'uploaded')
+            logger.close()
+
+            lineage = load_resumable_lineage(log_path, puts_path)
+            put_index = load_put_index(puts_path)
+            completed = completed_put_mask(log_path, lineage, put_index)
+            put_index.close()
+            # Stage 3 rewrites puts.txt before every Stage 4 run; identical content keeps the lineage.
+            with open(puts_path, 'w', encoding='utf8') as puts_file:
+                puts_file.write('bucket/a.bin\nbucket/b.bin\nbucket/c.bin\nbucket/d.bin\n')
+            rewritten_stat = os.stat(puts_path)
+            os.utime(puts_path, ns=(rewritten_stat.st_atime_ns, rewritten_stat.st_mtime_ns + 10**9))
+            rewritten_lineage = load_resumable_lineage(log_path, puts_path)
+            with open(puts_path, 'a', encoding='utf8') as puts_file:
+                puts_file.write('bucket/e.bin\n')
+            changed_lineage = load_resumable_lineage(log_path, puts_path)
+
+        self.assertEqual(lineage, '2026-10-18T12:00:00Z')
+        self.assertEqual(completed.tolist(), [True, True, False, False])
+        self.assertEqual(rewritten_lineage, '2026-10-18T12:00:00Z')
+        self.assertIsNone(changed_lineage)
+
+    def test_resume_keeps_only_the_open_uploads_the_journal_owns(self):
+        started = datetime(2026, 10, 18, 12, tzinfo=timezone.utc)
+        uploads = [
+            {'Key': 'bucket/done.bin', 'UploadId': 'done-upload', 'Initiated': started + timedelta(minutes=1)},
+            {'Key': 'bucket/journaled.bin', 'UploadId': 'journaled-upload', 'Initiated': started},
+            {'Key': 'bucket/journaled.bin', 'UploadId': 'stream-upload', 'Initiated': started},
+            {'Key': 'bucket/stream.bin', 'UploadId': 'other-stream', 'Initiated': started},
+            {'Key': 'bucket/unlisted.bin', 'UploadId': 'unlisted-upload', 'Initiated': started},
+            {'Key': 'bucket/stream.bin', 'UploadId': 'older-run', 'Initiated': started - timedelta(days=1)},
+        ]
+        s3_client = mock.Mock()
+        s3_client.get_paginator.return_value.paginate.return_value = [{'Uploads': uploads[:3]}, {'Uploads': uploads[3:]}]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            puts_path = os.path.join(temp_dir, 'puts.txt')
+            with open(puts_path, 'w', encoding='utf8') as puts_file:
+                puts_file.write('bucket/done.bin\nbucket/journaled.bin\nbucket/stream.bin\n')
+            put_index = load_put_index(puts_path)
+            journal = MultipartJournal(os.path.join(temp_dir, MULTIPART_JOURNAL_NAME))
+            journal.record_create('bucket/journaled.bin', 'journaled-upload', '"v1"', 1024, 512)
+            with contextlib.redirect_stderr(StringIO()) as stderr:
+                journaled = reconcile_open_multipart_uploads(
+                    s3_client,
+                    'glacier-bucket',
+                    '2026-10-18T12:00:00Z',
+                    put_index,
+                    np.array([True, False, False]),
+                    journal,
+                )
+            open_uploads = journal.open_uploads()
+            journal.close()
+            put_index.close()
+
+        self.assertEqual(journaled, 1)
+        aborted = [call.kwargs['UploadId'] for call in s3_client.abort_multipart_upload.call_args_list]
+        self.assertEqual(aborted, ['done-upload', 'stream-upload', 'other-stream'])
+        self.assertEqual(open_uploads['bucket/journaled.bin']['upload_id'], 'journaled-upload')
+        self.assertIn('journaled=1 aborted_completed=1 aborted_unjournaled=2', stderr.getvalue())
+
+    def test_listing_precheck_vouches_for_listed_directories_and_inventory_keys(self):
+        puts = [
+            'bucket/a/1.bin',
+            'bucket/a/2.bin',
+            'bucket/a/3.bin',
+            f'bucket/a/{RETENTION_MARKER_NAME}',
+            'bucket/b/x y.bin',
+            'bucket/c/1.bin',
+            'bucket/c/2.bin',
+            'bucket/d/1.bin',
+            'bucket/d/2.bin',
+        ]
+        inventory_rows = ['archive,bucket/b/x%20y.bin,1,2026-01-01T00:00:00Z,GLACIER']
+        inventory_rows += [f'archive,bucket/c/old-{index}.bin,1,2026-01-01T00:00:00Z,GLACIER' for index in range(2000)]
+        listings = {'bucket/a/': [['bucket/a/0.bin'], ['bucket/a/1.bin']]}
+        listed_prefixes = []
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, Delimiter):
+                listed_prefixes.append((Bucket, Prefix, Delimiter))
+                if Prefix not in listings:
+                    raise ClientError({'Error': {'Code': 'AccessDenied'}}, 'ListObjectsV2')
+                return [{'Contents': [{'Key': key} for key in page]} for page in listings[Prefix]]
+
+        s3_client = mock.Mock()
+        s3_client.get_paginator.return_value = Paginator()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            puts_path = os.path.join(temp_dir, 'puts.txt')
+            inventory_path = os.path.join(temp_dir, 'glacier_inventory.csv')
+            with open(puts_path, 'w', encoding='utf8') as puts_file:
+                puts_file.write('\n'.join(puts) + '\n')
+            with open(inventory_path, 'w', encoding='utf8') as inventory_file:
+                inventory_file.write('\n'.join(inventory_rows) + '\n')
+            put_index = load_put_index(puts_path)
+            with contextlib.redirect_stderr(StringIO()):
+                states, summary = build_destination_states(
+                    put_index, 'archive', s3_client, inventory_path=inventory_path, list_workers=2
+                )
+            put_index.close()
+
+        self.assertEqual(sorted(listed_prefixes), [('archive', 'bucket/a/', '/'), ('archive', 'bucket/d/', '/')])
+        self.assertEqual(
+            states.tolist(),
+            [
+                DESTINATION_PRESENT,
+                DESTINATION_ABSENT,
+                DESTINATION_ABSENT,
+                DESTINATION_UNKNOWN,
+                DESTINATION_PRESENT,
+                DESTINATION_UNKNOWN,
+                DESTINATION_UNKNOWN,
+                DESTINATION_UNKNOWN,
+                DESTINATION_UNKNOWN,
+            ],
+        )
+        self.assertEqual(
+            summary,
+            {
+                'directories': 4,
+                'listed_directories': 1,
+                'failed_listings': 1,
+                'list_pages': 2,
+                'present': 2,
+                'absent': 2,
+                'head_prechecks': 4,
+            },
+        )
+
+        def unexpected_head_object(*_args, **_kwargs):
+            raise AssertionError('HeadObject should be skipped for vouched keys')
+
+        result = copy_file(
+            source_key='bucket/a/1.bin',
+            glacier_bucket='archive',
+            retries=0,
+            retry_base_seconds=0.01,
+            retry_max_seconds=0.01,
+            stats=ProgressStats(total_files=1),
+            head_object_func=unexpected_head_object,
+            s3_client=object(),
+            destination_exists=True,
+        )
+        self.assertEqual(result['status'], 'skipped_existing')
+
+
+class TestStage4AdaptiveConcurrency(unittest.TestCase):
+    def _snapshot(self, now, stream_bytes, retry_error_counts=None, active=4, idle_seconds=0.0):
+        retry_error_counts = Counter(retry_error_counts or {})
+        return {
+            'now': now,
+            'stream_bytes': stream_bytes,
+            'retry_count': sum(retry_error_counts.values()),
+            'retry_error_counts': retry_error_counts,
+            'active_transfers': {
+                f'bucket/{index}.bin': {'last_progress_time': now - idle_seconds} for index in range(active)
+            },
+        }
+
+    def test_limit_grows_on_rate_gain_and_halves_on_throttling_or_stalls(self):
+        controller = AdaptiveConcurrency(initial_workers=4, min_workers=2, max_workers=5, stall_seconds=60)
+        self.assertEqual(controller.update(self._snapshot(0, 0)), 'start')
+        self.assertEqual(controller.update(self._snapshot(30, 300)), 'rate_gain')
+        self.assertEqual(controller.limit, 5)
+        self.assertEqual(controller.update(self._snapshot(60, 800, active=5)), 'hold max_workers')
+        controller.max_workers = 6
+        self.assertEqual(controller.update(self._snapshot(90, 1300, active=5)), 'hold no_rate_gain')
+        self.assertEqual(
+            controller.update(self._snapshot(120, 2000, {'ReadTimeoutError': 1}, active=5)),
+            'hold window_retries=1',
+        )
+        self.assertEqual(
+            controller.update(self._snapshot(150, 3000, {'ReadTimeoutError': 1, 'ClientError:SlowDown:503': 2})),
+            'throttled_retries=2',
+        )
+        self.assertEqual(controller.limit, 2)
+        controller.limit = 4
+        self.assertEqual(
+            controller.update(
+                self._snapshot(180, 4000, {'ReadTimeoutError': 1, 'ClientError:SlowDown:503': 2}, idle_seconds=60)
+            ),
+            'stalled_transfers=4',
+        )
+        self.assertEqual(controller.limit, 2)
+        self.assertEqual(
+            controller.update(self._snapshot(210, 9000, {'ReadTimeoutError': 1, 'ClientError:SlowDown:503': 2}, 1)),
+            'hold unsaturated',
+        )
+
+    def test_process_files_keeps_in_flight_uploads_within_the_adaptive_limit(self):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_copy_file(source_key, glacier_bucket, *_args, **_kwargs):
+            with lock:
+                in_flight.append(source_key)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(source_key)
+            return {
+                'destination_key': source_key,
+                'resolved_source_key': source_key,
+                'status': 'uploaded',
+                'error': None,
+                'bytes_copied': 1,
+            }
+
+        activity_logger = mock.Mock()
+        controller = AdaptiveConcurrency(initial_workers=3, min_workers=1, max_workers=8, stall_seconds=60)
+        with mock.patch('stage4_process_puts_deletes.copy_file', fake_copy_file), contextlib.redirect_stdout(StringIO()):
+            result = process_files(
+                file_list=[f'bucket/{index}.bin' for index in range(20)],
+                glacier_bucket='glacier-bucket',
+                max_workers=3,
+                max_pending_tasks=256,
+                retries=0,
+                retry_base_seconds=1,
+                retry_max_seconds=1,
+                progress_interval_seconds=0,
+                progress_stall_alert_seconds=0,
+                activity_logger=activity_logger,
+                concurrency=controller,
+                adapt_interval_seconds=3600,
+            )
+
+        self.assertEqual(result['success_count'], 20)
+        self.assertEqual(activity_logger.record_event.call_count, 20)
+        self.assertEqual(max(peak), 3)
+
+
+# Spawned shard processes re-import their target, so the stubbed shards live at module level.
+def stub_copy_file(source_key, glacier_bucket, *_args, **_kwargs):
+    if source_key.endswith('.missing'):
+        return {
+            'destination_key': source_key,
+            'resolved_source_key': source_key,
+            'status': 'missing_source',
+            'error': FileNotFoundError(source_key),
+            'bytes_copied': 0,
+        }
+    return {
+        'destination_key': source_key,
+        'resolved_source_key': source_key,
+        'status': 'uploaded',
+        'error': None,
+        'bytes_copied': len(source_key),
+    }
+
+
+def run_stubbed_put_shard(shard, *args):
+    stage4_process_puts_deletes.copy_file = stub_copy_file
+    run_put_shard(shard, *args)
+
+
+def run_raising_put_shard(shard, *args):
+    if shard == 1:
+        stage4_process_puts_deletes.load_put_index = mock.Mock(side_effect=OSError('puts.txt vanished'))
+    run_stubbed_put_shard(shard, *args)
+
+
+def run_exiting_put_shard(shard, *args):
+    if shard == 1:
+        os._exit(3)
+    run_stubbed_put_shard(shard, *args)
+
+
+class TestStage4Sharding(unittest.TestCase):
+    def test_shards_partition_puts_by_key_hash_in_schedule_order(self):
+        keys = [f'bucket/dir/{index}.bin' for index in range(50)] + ['bucket/dir/3.bin']
+        key_hashes = np.array([put_key_hash(key) for key in keys], dtype=np.uint64)
+        shards = shard_indices(key_hashes, 3)
+
+        self.assertEqual(sorted(np.concatenate(shards).tolist()), list(range(len(keys))))
+        for shard, indices in enumerate(shards):
+            self.assertEqual(indices.tolist(), sorted(indices.tolist()))
+            self.assertTrue(all(put_key_hash(keys[index]) % 3 == shard for index in indices))
+        self.assertEqual(
+            [shard for shard, indices in enumerate(shards) if 3 in indices],
+            [shard for shard, indices in enumerate(shards) if 50 in indices],
+        )
+
+    def test_shard_journals_split_from_and_merge_back_into_the_main_journal(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal_path = os.path.join(temp_dir, MULTIPART_JOURNAL_NAME)
+            journal = MultipartJournal(journal_path)
+            for key in ('bucket/a.bin', 'bucket/b.bin', 'bucket/c.bin'):
+                journal.record_create(key, f'upload-{key}', '"v1"', 100, 50)
+                journal.record_part(key, f'upload-{key}', 1, '"etag-1"')
+            journal.close()
+
+            shard_paths = split_multipart_journal(journal_path, 2, lambda key: 0 if key == 'bucket/a.bin' else 1)
+            shard_journals = [MultipartJournal(path) for path in shard_paths]
+            main_journal = MultipartJournal(journal_path)
+            self.assertEqual(main_journal.open_uploads(), {})
+            main_journal.close()
+            self.assertEqual(list(shard_journals[0].open_uploads()), ['bucket/a.bin'])
+            self.assertEqual(sorted(shard_journals[1].open_uploads()), ['bucket/b.bin', 'bucket/c.bin'])
+            shard_journals[1].record_end('bucket/b.bin', 'upload-bucket/b.bin', 'complete')
+            shard_journals[1].record_part('bucket/c.bin', 'upload-bucket/c.bin', 2, '"etag-2"')
+            for shard_journal in shard_journals:
+                shard_journal.close()
+
+            merge_shard_journals(journal_path)
+            journal = MultipartJournal(journal_path)
+            open_uploads = journal.open_uploads()
+            journal.close()
+            remaining_files = sorted(os.listdir(temp_dir))
+
+        self.assertEqual(sorted(open_uploads), ['bucket/a.bin', 'bucket/c.bin'])
+        self.assertEqual(open_uploads['bucket/c.bin']['parts'], {1: '"etag-1"', 2: '"etag-2"'})
+        self.assertEqual(remaining_files, [MULTIPART_JOURNAL_NAME])
+
+    def _run_shards(self, shard_func):
+        keys = [f'bucket/dir/{index}.bin' for index in range(12)] + ['bucket/dir/gone.missing']
+        activity_rows = []
+        activity_logger = mock.Mock()
+        activity_logger.record_event.side_effect = lambda *row: activity_rows.append(row)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            puts_path = os.path.join(temp_dir, 'puts.txt')
+            with open(puts_path, 'w', encoding='utf8') as puts_file:
+                puts_file.write(''.join(f'{key}\n' for key in keys))
+            put_index = load_put_index(puts_path)
+            positions = np.arange(len(keys))
+            shard_keys = [
+                [keys[index] for index in indices]
+                for indices in shard_indices(put_index.entries['hash'][positions], 2)
+            ]
+            stdout = StringIO()
+            try:
+                with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(StringIO()):
+                    result = process_files_sharded(
+                        processes=2,
+                        puts_file=puts_path,
+                        put_index=put_index,
+                        positions=positions,
+                        activity_logger=activity_logger,
+                        multipart_journal_file=os.path.join(temp_dir, MULTIPART_JOURNAL_NAME),
+                        process_options={
+                            'glacier_bucket': 'glacier-bucket',
+                            'max_workers': 2,
+                            'max_pending_tasks': 4,
+                            'retries': 0,
+                            'retry_base_seconds': 0.01,
+                            'retry_max_seconds': 0.01,
+                            'progress_stall_alert_seconds': 0,
+                        },
+                        progress_interval_seconds=0,
+                        shard_func=shard_func,
+                    )
+            except RuntimeError as error:
+                result = error
+            finally:
+                put_index.close()
+        return result, shard_keys, activity_rows, stdout.getvalue()
+
+    def test_sharded_run_merges_the_results_and_activity_of_every_shard(self):
+        result, shard_keys, activity_rows, summary = self._run_shards(run_stubbed_put_shard)
+
+        keys = sorted(key for keys in shard_keys for key in keys)
+        self.assertTrue(all(shard_keys))
+        self.assertEqual(result['success_count'], len(keys) - 1)
+        self.assertEqual(result['missing_source_count'], 1)
+        self.assertEqual(result['failure_count'], 0)
+        self.assertEqual(result['missing_sources'][0][0], 'bucket/dir/gone.missing')
+        self.assertEqual(sorted(row[0] for row in activity_rows), [key for key in keys if key != 'bucket/dir/gone.missing'])
+        self.assertIn(f'Successes: {len(keys) - 1}', summary)
+
+    def test_sharded_run_reports_shards_that_raise_or_exit_after_merging_the_rest(self):
+        for shard_func, message in (
+            (run_raising_put_shard, 'shard 1: OSError: puts.txt vanished'),
+            (run_exiting_put_shard, 'shard 1: exited with code 3'),
+        ):
+            with self.subTest(message=message):
+                error, shard_keys, activity_rows, summary = self._run_shards(shard_func)
+
+                self.assertIsInstance(error, RuntimeError)
+                self.assertEqual(str(error), f'Stage 4 shard processes failed: {message}')
+                surviving_uploads = sorted(key for key in shard_keys[0] if key != 'bucket/dir/gone.missing')
+                self.assertEqual(sorted(row[0] for row in activity_rows), surviving_uploads)
+                self.assertIn(f'Successes: {len(surviving_uploads)}', summary)
+
+    def test_shard_progress_merges_the_latest_snapshot_of_each_shard(self):
+        clock = iter([0.0, 30.0])
+        progress = ShardProgress(total_files=10, total_bytes=None, clock=lambda: next(clock))
+
+        def shard_snapshot(completed, retry_error_counts, active_key):
+            stats = ProgressStats(total_files=5)
+            for _ in range(completed):
+                stats.record_completion(success=True, bytes_copied=10)
+            for name, count in retry_error_counts.items():
+                stats.retry_count += count
+                stats.retry_error_counts[name] += count
+            stats.record_transfer_start(active_key)
+            return stats.snapshot()
+
+        progress.update(0, shard_snapshot(1, {}, 'bucket/old.bin'))
+        progress.update(0, shard_snapshot(2, {'ClientError:SlowDown:503': 1}, 'bucket/a.bin'))
+        progress.update(1, shard_snapshot(3, {'ClientError:SlowDown:503': 2}, 'bucket/b.bin'))
+        merged = progress.snapshot()
+
+        self.assertEqual(merged['now'], 30.0)
+        self.assertEqual(merged['start_time'], 0.0)
+        self.assertEqual(merged['total_files'], 10)
+        self.assertEqual(merged['completed'], 5)
+        self.assertEqual(merged['success_bytes'], 50)
+        self.assertEqual(merged['retry_error_counts'], Counter({'ClientError:SlowDown:503': 3}))
+        self.assertEqual(sorted(merged['active_transfers']), ['bucket/a.bin', 'bucket/b.bin'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Columnar cache of canonicalized inventories.
+
+Stage 3 and the retention report both decode the same raw inventory CSVs:
+URL-decoding Glacier keys, canonicalizing rclone dot segments, parsing
+timestamps and splitting out bad keys.  The cache stores that decoded result
+once per inventory snapshot as Parquet, keyed by a hash of the uncompressed
+inventory content, so a plain ``.csv`` and its ``.csv.gz`` upload share one
+cache entry.  The key also carries the loader's decoder version, so entries
+decoded by older key-decoding logic are never reused.
+
+The cached table holds the loader's frame columns (``int64`` sizes,
+``timestamp[ns, UTC]`` modification times) plus dictionary-encoded
+``KeyBucket`` and ``KeyPrefix`` columns for ad-hoc queries.  Bad keys and the
+loader's ``inventory_processing`` counters travel in the schema metadata.
+Effective retention timestamps are not cached: they depend on the policy and
+on the paired Ceph markers, so each consumer applies them after loading.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - the runtime image ships pyarrow
+    pa = None
+    pq = None
+
+INVENTORY_CACHE_SCHEMA_VERSION = 1
+INVENTORY_CACHE_METADATA_KEY = b"data_lifecycle_inventory"
+HASH_READ_BYTES = 8 * 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+INVENTORY_TYPES = ("nrp", "aws")
+
+
+def inventory_cache_available() -> bool:
+    return pq is not None
+
+
+def source_content_hash(inventory_path: str | os.PathLike) -> str:
+    """Return the SHA-256 of the inventory content, decompressing gzip input."""
+
+    with open(inventory_path, "rb") as probe:
+        compressed = probe.read(2) == GZIP_MAGIC
+    opener = gzip.open if compressed else open
+    digest = hashlib.sha256()
+    with opener(inventory_path, "rb") as stream:
+        while True:
+            block = stream.read(HASH_READ_BYTES)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def inventory_cache_path(
+    cache_dir: str | os.PathLike, inventory_type: str, source_hash: str, decoder_version: int
+) -> Path:
+    return Path(cache_dir) / (
+        f"{inventory_type.lower()}-inventory-v{INVENTORY_CACHE_SCHEMA_VERSION}-d{decoder_version}-"
+        f"{source_hash[:32]}.parquet"
+    )
+
+
+def _dictionary_column(values: pd.Series) -> "pa.Array":
+    return pa.array(values.astype("category"))
+
+
+def write_inventory_cache(
+    path: str | os.PathLike,
+    inventory: pd.DataFrame,
+    bad_keys: pd.DataFrame,
+    stats: dict[str, int],
+    *,
+    source_hash: str,
+    decoder_version: int,
+) -> None:
+    """Atomically write one canonical inventory and its loader evidence."""
+
+    if not inventory_cache_available():
+        raise RuntimeError("pyarrow is required to write the inventory cache.")
+
+    keys = inventory["BucketKey"].astype("string")
+    table = pa.Table.from_pandas(inventory, preserve_index=None)
+    table = table.append_column("KeyBucket", _dictionary_column(keys.str.split("/", n=1).str[0]))
+    table = table.append_column("KeyPrefix", _dictionary_column(keys.str.rsplit("/", n=1).str[0] + "/"))
+    metadata = dict(table.schema.metadata or {})
+    metadata[INVENTORY_CACHE_METADATA_KEY] = json.dumps(
+        {
+            "schema_version": INVENTORY_CACHE_SCHEMA_VERSION,
+            "source_sha256": source_hash,
+            "decoder_version": decoder_version,
+            "frame_columns": [str(column) for column in inventory.columns],
+            "stats": {name: int(value) for name, value in stats.items()},
+            "bad_keys": [
+                {"Issue": str(row.Issue), "BucketKeyEscaped": str(row.BucketKeyEscaped), "BucketKey": str(row.BucketKey)}
+                for row in bad_keys.itertuples(index=False)
+            ],
+        },
+        sort_keys=True,
+    ).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+
+    destination = Path(path)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    temp_fd, temp_path = tempfile.mkstemp(dir=destination.parent, prefix=".inventory-cache-", suffix=".parquet")
+    os.close(temp_fd)
+    try:
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, destination)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def read_inventory_cache(
+    path: str | os.PathLike, decoder_version: int
+) -> tuple[pd.DataFrame, pd.DataFrame, dict[str, int]]:
+    """Memory-map a cache entry and return ``(inventory, bad_keys, stats)``."""
+
+    if not inventory_cache_available():
+        raise RuntimeError("pyarrow is required to read the inventory cache.")
+
+    schema_metadata = pq.read_schema(path, memory_map=True).metadata or {}
+    payload = json.loads(schema_metadata[INVENTORY_CACHE_METADATA_KEY])
+    if payload.get("schema_version") != INVENTORY_CACHE_SCHEMA_VERSION:
+        raise ValueError(f"Unsupported inventory cache schema_version: {payload.get('schema_version')!r}")
+    if payload.get("decoder_version") != decoder_version:
+        raise ValueError(f"Inventory cache decoder_version {payload.get('decoder_version')!r} != {decoder_version}")
+
+    table = pq.read_table(
+        path,
+        columns=payload["frame_columns"],
+        memory_map=True,
+        use_pandas_metadata=True,
+    )
+    inventory = table.to_pandas()
+    bad_keys = pd.DataFrame(payload["bad_keys"], columns=["Issue", "BucketKeyEscaped", "BucketKey"])
+    bad_keys["BucketKey"] = bad_keys["BucketKey"].astype("string")
+    return inventory, bad_keys, dict(payload["stats"])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build the canonical Parquet cache for one inventory snapshot.")
+    parser.add_argument("--inventory-type", choices=INVENTORY_TYPES, required=True)
+    parser.add_argument("--inventory", required=True, help="Raw NRP or AWS inventory CSV (optionally gzip-compressed)")
+    parser.add_argument("--cache-dir", required=True)
+    parser.add_argument("--chunk-rows", type=int, default=int(os.getenv("STAGE3_CHUNK_ROWS", "0")))
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> None:
+    # Imported here because the Stage 3 loader itself consults this module.
+    from generate_puts_deletes import load_aws_inventory, load_nrp_inventory
+
+    loader = load_nrp_inventory if args.inventory_type == "nrp" else load_aws_inventory
+    loader(args.inventory, {}, chunk_rows=args.chunk_rows, cache_dir=args.cache_dir)
+
+
+if __name__ == "__main__":
+    main(parse_args())
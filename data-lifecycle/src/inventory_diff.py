@@ -0,0 +1,138 @@
+"""Shared key comparison between the local and Glacier inventories.
+
+Stage 3 asks the same membership questions several times: which local keys
+are missing from Glacier (PUTs), which Glacier keys no longer exist as local
+scientific objects (DELETEs and the Glacier cleanup phase), which retention
+markers are newer than their Glacier copy, and how many distinct objects each
+side holds.  Answering each with ``Series.isin`` or ``nunique`` rebuilt a hash
+table over tens of millions of Python strings every time.
+
+``diff_inventories`` encodes both key columns into one integer code space in a
+single pass.  Every answer above is then a linear numpy pass over those codes.
+Control-object and NOBACKUP prefix tests likewise run once per distinct key
+or directory (``key_encoding``) rather than once per row.
+All arrays are positional: they line up with the rows of the frames the diff
+was computed from, whatever their index labels.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from key_encoding import KeyEncoding, encode_keys
+
+
+@dataclass(frozen=True)
+class InventoryDiff:
+    local_codes: np.ndarray
+    glacier_codes: np.ndarray
+    null_codes: np.ndarray
+    local_scientific: np.ndarray
+    glacier_scientific: np.ndarray
+    local_in_glacier: np.ndarray
+    glacier_in_local_scientific: np.ndarray
+    glacier_marker_dates: pd.Series
+    keys: KeyEncoding
+
+    @property
+    def local_rows(self) -> int:
+        return int(len(self.local_codes))
+
+    @property
+    def glacier_rows(self) -> int:
+        return int(len(self.glacier_codes))
+
+    def check_frames(self, local_inventory: pd.DataFrame, glacier_inventory: pd.DataFrame) -> None:
+        if len(local_inventory) != self.local_rows or len(glacier_inventory) != self.glacier_rows:
+            raise ValueError(
+                "Inventory diff does not match the supplied frames: "
+                f"diff has {self.local_rows}/{self.glacier_rows} rows, "
+                f"frames have {len(local_inventory)}/{len(glacier_inventory)}."
+            )
+
+    def distinct_local(self, row_mask: np.ndarray | None = None) -> int:
+        return self._distinct(self.local_codes, row_mask)
+
+    def distinct_glacier(self, row_mask: np.ndarray | None = None) -> int:
+        return self._distinct(self.glacier_codes, row_mask)
+
+    def local_under_prefixes(self, prefixes) -> np.ndarray:
+        """Positional mask of local rows whose key starts with any of ``prefixes``."""
+
+        return self.keys.under_prefixes(prefixes)[self.local_codes]
+
+    def local_prefix_cover(self, prefixes) -> np.ndarray:
+        """Per local row, the position in ``prefixes`` of the longest prefix of its key, or ``-1``."""
+
+        return self.keys.covering_prefix(list(prefixes))[self.local_codes]
+
+    def local_no_backup_prefixes(self) -> list[str]:
+        """Return the directories holding a local ``NOBACKUP`` marker, in row order."""
+
+        marker_rows = np.flatnonzero(self.keys.nobackup_marker()[self.local_codes])
+        _, first_rows = np.unique(self.local_codes[marker_rows], return_index=True)
+        directories = self.keys.key_directories(self.local_codes[marker_rows[np.sort(first_rows)]])
+        return [directory for directory in dict.fromkeys(directories) if directory and directory != "/"]
+
+    def _distinct(self, codes: np.ndarray, row_mask: np.ndarray | None) -> int:
+        selected = codes if row_mask is None else codes[row_mask]
+        present = np.unique(selected)
+        if len(self.null_codes):
+            present = present[~np.isin(present, self.null_codes)]
+        return int(len(present))
+
+
+def _code_flags(codes: np.ndarray, key_count: int) -> np.ndarray:
+    flags = np.zeros(key_count, dtype=bool)
+    flags[codes] = True
+    return flags
+
+
+def diff_inventories(local_inventory: pd.DataFrame, glacier_inventory: pd.DataFrame) -> InventoryDiff:
+    """Encode both inventories' keys once and derive every membership set.
+
+    Missing keys compare equal to each other, matching ``Series.isin``.
+    """
+
+    local_keys = local_inventory["BucketKey"]
+    glacier_keys = glacier_inventory["BucketKey"]
+    codes, uniques = pd.factorize(
+        pd.concat([local_keys, glacier_keys], ignore_index=True),
+        use_na_sentinel=False,
+    )
+    codes = codes.astype(np.int64, copy=False)
+    key_count = len(uniques)
+    local_codes = codes[: len(local_keys)]
+    glacier_codes = codes[len(local_keys) :]
+
+    keys = encode_keys(uniques)
+    scientific = ~keys.lifecycle_control()
+    local_scientific = scientific[local_codes]
+    glacier_scientific = scientific[glacier_codes]
+    in_glacier = _code_flags(glacier_codes, key_count)
+    in_local_scientific = _code_flags(local_codes[local_scientific], key_count)
+
+    # Only marker-shaped keys can ever be compared by date, so the per-key
+    # maximum is computed over the (small) marker subset of Glacier.
+    glacier_markers = keys.retention_marker()[glacier_codes]
+    if "LastModified" in glacier_inventory:
+        glacier_dates = pd.to_datetime(glacier_inventory["LastModified"], errors="coerce", utc=True)
+        latest_marker_dates = glacier_dates.iloc[glacier_markers].groupby(glacier_codes[glacier_markers]).max()
+    else:
+        latest_marker_dates = pd.Series(dtype="datetime64[ns, UTC]")
+    glacier_marker_dates = latest_marker_dates.reindex(local_codes).reset_index(drop=True)
+
+    return InventoryDiff(
+        local_codes=local_codes,
+        glacier_codes=glacier_codes,
+        null_codes=np.flatnonzero(pd.isna(uniques)),
+        local_scientific=local_scientific,
+        glacier_scientific=glacier_scientific,
+        local_in_glacier=in_glacier[local_codes],
+        glacier_in_local_scientific=in_local_scientific[glacier_codes],
+        glacier_marker_dates=glacier_marker_dates,
+        keys=keys,
+    )
@@ -0,0 +1,174 @@
+"""Dictionary encoding of the distinct keys shared by both inventories.
+
+Stage 3 keys repeat the same bucket and directory text millions of times
+(``braingeneers/ephys/<uuid>/original/data/...``), and every prefix or suffix
+test used to run a pandas string operation per row, once per question.
+``KeyEncoding`` holds the distinct keys of both inventories and answers those
+questions once per distinct value:
+
+* control-object kinds (``NOBACKUP``, retention markers) are classified once
+  per distinct key in a single suffix pass;
+* a prefix ending in ``/`` covers a key exactly when it covers the key's
+  directory (everything up to and including the last ``/``), so NOBACKUP
+  exclusion is a binary search per prefix over the sorted distinct
+  directories (``SortedPrefixIndex``).  The directory dictionary is only
+  built when there are prefixes to test.
+
+Row-level answers are then a numpy ``take`` through the key codes.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from lifecycle_constants import FILE_RETENTION_SUFFIX, NOBACKUP_MARKER_NAME, RETENTION_MARKER_NAME
+
+SCIENTIFIC_KEY = 0
+NOBACKUP_KEY = 1
+RETENTION_MARKER_KEY = 2
+
+_NOBACKUP_SUFFIX = f"/{NOBACKUP_MARKER_NAME}"
+_RETENTION_SUFFIXES = (f"/{RETENTION_MARKER_NAME}", FILE_RETENTION_SUFFIX)
+_MAX_CHARACTER = chr(0x10FFFF)
+
+
+def _key_kind(key) -> int:
+    if not isinstance(key, str):
+        return SCIENTIFIC_KEY
+    if key.endswith(_RETENTION_SUFFIXES):
+        return RETENTION_MARKER_KEY
+    if key.endswith(_NOBACKUP_SUFFIX):
+        return NOBACKUP_KEY
+    return SCIENTIFIC_KEY
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """Return the smallest string above every string starting with ``prefix``.
+
+    ``None`` means there is no such bound (the range runs to the end).
+    """
+
+    while prefix and prefix[-1] == _MAX_CHARACTER:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class SortedPrefixIndex:
+    """Distinct strings sorted once so each prefix is a binary-searched range.
+
+    A prefix ``p`` covers exactly the sorted slice ``[p, successor(p))``, so
+    looking up ``P`` prefixes over ``N`` strings costs ``O((N + P) log N)``
+    instead of a ``startswith`` test per string and prefix.
+    """
+
+    def __init__(self, values, *, positions: np.ndarray | None = None, size: int | None = None) -> None:
+        values = np.asarray(values, dtype=object)
+        order = np.argsort(values, kind="stable")
+        self._sorted = values[order]
+        self._positions = order if positions is None else np.asarray(positions)[order]
+        self._size = len(values) if size is None else size
+
+    def bounds(self, prefix: str) -> tuple[int, int]:
+        low = int(np.searchsorted(self._sorted, prefix, side="left"))
+        upper = _prefix_upper_bound(prefix)
+        high = len(self._sorted) if upper is None else int(np.searchsorted(self._sorted, upper, side="left"))
+        return low, high
+
+    def covering(self, prefixes: Sequence[str]) -> np.ndarray:
+        """Return, per original value, the position of its longest covering prefix or ``-1``."""
+
+        sorted_cover = np.full(len(self._sorted), -1, dtype=np.int64)
+        # Shorter prefixes first, so a nested (longer) prefix overwrites its range.
+        for position in sorted(range(len(prefixes)), key=lambda candidate: len(prefixes[candidate])):
+            low, high = self.bounds(prefixes[position])
+            sorted_cover[low:high] = position
+        cover = np.full(self._size, -1, dtype=np.int64)
+        cover[self._positions] = sorted_cover
+        return cover
+
+
+@dataclass(frozen=True)
+class KeyEncoding:
+    keys: np.ndarray
+    kinds: np.ndarray
+
+    def lifecycle_control(self) -> np.ndarray:
+        """Per-key equivalent of ``lifecycle_controls.lifecycle_control_mask``."""
+
+        return self.kinds != SCIENTIFIC_KEY
+
+    def retention_marker(self) -> np.ndarray:
+        return self.kinds == RETENTION_MARKER_KEY
+
+    def nobackup_marker(self) -> np.ndarray:
+        return self.kinds == NOBACKUP_KEY
+
+    @cached_property
+    def _directory_dictionary(self) -> tuple[np.ndarray, SortedPrefixIndex]:
+        # Keys without a slash (or missing keys) have no directory: code -1.
+        directories = np.array(
+            [key[: key.rfind("/") + 1] or None if isinstance(key, str) else None for key in self.keys],
+            dtype=object,
+        )
+        codes, uniques = pd.factorize(directories)
+        return codes.astype(np.int64, copy=False), SortedPrefixIndex(uniques)
+
+    @cached_property
+    def _key_index(self) -> SortedPrefixIndex:
+        present = np.fromiter((isinstance(key, str) for key in self.keys), dtype=bool, count=len(self.keys))
+        return SortedPrefixIndex(self.keys[present], positions=np.flatnonzero(present), size=len(self.keys))
+
+    def key_directories(self, key_codes: np.ndarray) -> list[str | None]:
+        """Return the ``/``-terminated directory of each selected key."""
+
+        return [
+            key[: key.rfind("/") + 1] or None if isinstance(key, str) else None
+            for key in self.keys[key_codes]
+        ]
+
+    def covering_prefix(self, prefixes: Sequence[str]) -> np.ndarray:
+        """Return, per distinct key, the position in ``prefixes`` of the longest
+        prefix the key starts with, or ``-1``.
+
+        Prefixes ending in ``/`` are looked up in the sorted directory
+        dictionary; any others in the sorted distinct keys themselves.
+        """
+
+        cover = np.full(len(self.keys), -1, dtype=np.int64)
+        directory_positions = [position for position, prefix in enumerate(prefixes) if prefix.endswith("/")]
+        other_positions = [position for position, prefix in enumerate(prefixes) if not prefix.endswith("/")]
+        if directory_positions:
+            directory_codes, directory_index = self._directory_dictionary
+            by_directory = directory_index.covering([prefixes[position] for position in directory_positions])
+            in_directory = directory_codes >= 0
+            found = by_directory[directory_codes[in_directory]]
+            cover[in_directory] = np.where(found >= 0, np.asarray(directory_positions)[found], -1)
+        if other_positions:
+            found = self._key_index.covering([prefixes[position] for position in other_positions])
+            other_cover = np.where(found >= 0, np.asarray(other_positions)[found], -1)
+            lengths = np.array([len(prefix) for prefix in prefixes] + [-1])
+            cover = np.where(lengths[other_cover] > lengths[cover], other_cover, cover)
+        return cover
+
+    def under_prefixes(self, prefixes: Iterable[str]) -> np.ndarray:
+        """Return which distinct keys start with any of ``prefixes``."""
+
+        prefixes = list(prefixes)
+        if not prefixes:
+            return np.zeros(len(self.keys), dtype=bool)
+        return self.covering_prefix(prefixes) >= 0
+
+
+def encode_keys(keys: np.ndarray | pd.Index) -> KeyEncoding:
+    """Classify distinct ``keys``; missing keys count as scientific, as in pandas masks."""
+
+    keys = np.asarray(keys, dtype=object)
+    kinds = np.fromiter(map(_key_kind, keys), dtype=np.int8, count=len(keys))
+    return KeyEncoding(keys=keys, kinds=kinds)
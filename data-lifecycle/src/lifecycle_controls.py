@@ -12,8 +12,11 @@ contents and user-defined object metadata are intentionally ignored.
 
 from __future__ import annotations
 
+import re
 from collections.abc import Iterable
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
 
 from lifecycle_constants import (
@@ -35,24 +38,122 @@ def normalize_atomic_directories(paths: Iterable[str] | None) -> list[str]:
     return normalized
 
 
-def atomic_group_for_key(bucket_key: str, atomic_directories: Iterable[str] | None) -> str | None:
-    key = str(bucket_key or "")
-    for pattern in normalize_atomic_directories(atomic_directories):
-        if pattern.endswith("/*"):
-            prefix = f"{pattern[:-2].rstrip('/')}/"
-            if not key.startswith(prefix):
-                continue
-            group_id = key[len(prefix) :].split("/", 1)[0]
-            if group_id:
-                return f"{prefix}{group_id}/"
-            continue
+class _PrefixNode:
+    __slots__ = ("children", "roots")
 
-        prefix = pattern.rstrip("*")
-        if prefix and not prefix.endswith("/"):
-            prefix = f"{prefix}/"
-        if prefix and key.startswith(prefix):
-            return prefix
-    return None
+    def __init__(self) -> None:
+        self.children: dict[str, _PrefixNode] = {}
+        self.roots: list[tuple[int, str, bool]] = []
+
+
+class AtomicDirectoryIndex:
+    """Compiled ``backup.atomic_directories`` lookups, built once per policy.
+
+    Every configured prefix ends at a ``/`` boundary, so the patterns are
+    stored in a trie keyed by path segment and a scalar lookup walks at most
+    the key's leading segments.  When patterns overlap, the earliest
+    configured pattern wins, as it always has.  The Series API applies the
+    same patterns as one compiled anchored alternation.
+    """
+
+    def __init__(self, atomic_directories: Iterable[str] | None) -> None:
+        self.patterns: list[str] = normalize_atomic_directories(atomic_directories)
+        # ``(prefix, is_wildcard)`` per usable pattern, in configuration order.
+        self.roots: list[tuple[str, bool]] = []
+        self._trie = _PrefixNode()
+        alternatives: list[str] = []
+        self._group_roots: dict[str, tuple[str, bool]] = {}
+        for pattern in self.patterns:
+            if pattern.endswith("/*"):
+                prefix, is_wildcard = f"{pattern[:-2].rstrip('/')}/", True
+            else:
+                prefix, is_wildcard = pattern.rstrip("*"), False
+                if prefix and not prefix.endswith("/"):
+                    prefix = f"{prefix}/"
+                if not prefix:
+                    continue
+            order = len(self.roots)
+            self.roots.append((prefix, is_wildcard))
+            node = self._trie
+            for segment in prefix[:-1].split("/"):
+                node = node.children.setdefault(segment, _PrefixNode())
+            node.roots.append((order, prefix, is_wildcard))
+            group_name = f"p{order}"
+            self._group_roots[group_name] = (prefix, is_wildcard)
+            if is_wildcard:
+                alternatives.append(f"{re.escape(prefix)}(?P<{group_name}>[^/]+)")
+            else:
+                alternatives.append(f"(?P<{group_name}>{re.escape(prefix)})")
+        self._pattern = re.compile("(?:" + "|".join(alternatives) + ")") if alternatives else None
+
+    @classmethod
+    def coerce(cls, atomic_directories: AtomicDirectoryIndex | Iterable[str] | None) -> AtomicDirectoryIndex:
+        if isinstance(atomic_directories, cls):
+            return atomic_directories
+        return _cached_index(tuple(atomic_directories or ()))
+
+    def __bool__(self) -> bool:
+        return bool(self.roots)
+
+    def match(self, bucket_key: str) -> tuple[str, str] | None:
+        """Return ``(group, root)`` for the first configured pattern covering the key."""
+
+        key = str(bucket_key or "")
+        node = self._trie
+        position = 0
+        best: tuple[int, str, str] | None = None
+        while True:
+            end = key.find("/", position)
+            if end < 0:
+                break
+            node = node.children.get(key[position:end])
+            if node is None:
+                break
+            position = end + 1
+            for order, prefix, is_wildcard in node.roots:
+                if best is not None and best[0] < order:
+                    continue
+                if not is_wildcard:
+                    best = (order, prefix, prefix)
+                    continue
+                group_end = key.find("/", position)
+                group_id = key[position:] if group_end < 0 else key[position:group_end]
+                if group_id:
+                    best = (order, f"{prefix}{group_id}/", prefix)
+        return None if best is None else (best[1], best[2])
+
+    def group_for_key(self, bucket_key: str) -> str | None:
+        matched = self.match(bucket_key)
+        return None if matched is None else matched[0]
+
+    def match_series(self, keys: pd.Series) -> tuple[pd.Series, pd.Series]:
+        """Return ``(groups, roots)`` aligned with ``keys``; unmatched rows are ``None``."""
+
+        groups: list[str | None] = [None] * len(keys)
+        roots: list[str | None] = [None] * len(keys)
+        if self._pattern is not None:
+            for position, match in enumerate(map(self._pattern.match, keys.astype("string").fillna(""))):
+                if match is None:
+                    continue
+                prefix, is_wildcard = self._group_roots[match.lastgroup]
+                groups[position] = f"{prefix}{match.group(match.lastgroup)}/" if is_wildcard else prefix
+                roots[position] = prefix
+        return (
+            pd.Series(groups, index=keys.index, dtype=object),
+            pd.Series(roots, index=keys.index, dtype=object),
+        )
+
+
+@lru_cache(maxsize=32)
+def _cached_index(atomic_directories: tuple[str, ...]) -> AtomicDirectoryIndex:
+    return AtomicDirectoryIndex(atomic_directories)
+
+
+def atomic_group_for_key(
+    bucket_key: str,
+    atomic_directories: AtomicDirectoryIndex | Iterable[str] | None,
+) -> str | None:
+    return AtomicDirectoryIndex.coerce(atomic_directories).group_for_key(bucket_key)
 
 
 def atomic_retention_marker(group_prefix: str) -> str:
@@ -97,7 +198,7 @@ def retention_marker_mask(keys: pd.Series) -> pd.Series:
 
 def retention_marker_target(
     marker_key: str,
-    atomic_directories: Iterable[str] | None,
+    atomic_directories: AtomicDirectoryIndex | Iterable[str] | None,
 ) -> tuple[str, str] | None:
     """Return ``(scope, target)`` for a valid retention marker.
 
@@ -126,69 +227,95 @@ def scientific_inventory(inventory: pd.DataFrame) -> pd.DataFrame:
     return inventory.loc[~lifecycle_control_mask(inventory["BucketKey"])].copy()
 
 
-def apply_effective_last_modified(
-    inventory: pd.DataFrame,
-    atomic_directories: Iterable[str] | None,
-    *,
-    authoritative_markers: pd.DataFrame | None = None,
-) -> pd.DataFrame:
-    """Apply file and atomic marker timestamps to scientific inventory rows.
+def retention_marker_dates(
+    markers: pd.DataFrame,
+    atomic_directories: AtomicDirectoryIndex | Iterable[str] | None,
+) -> tuple[pd.Series, pd.Series]:
+    """Return the newest valid ``(file, atomic)`` marker date per target key.
 
-    ``authoritative_markers`` defaults to ``inventory``.  Callers may pass the
-    current Ceph inventory explicitly when evaluating another inventory so a
-    stale Glacier marker can never extend retention by itself.
+    Vectorized ``retention_marker_target`` over every marker-shaped row of
+    ``markers``; rows without a timestamp are ignored.
     """
 
-    updated = inventory.copy()
-    updated["LastModified"] = pd.to_datetime(updated["LastModified"], errors="coerce", utc=True)
-    marker_source = authoritative_markers if authoritative_markers is not None else inventory
-    marker_source = marker_source.copy()
-    marker_source["LastModified"] = pd.to_datetime(
-        marker_source["LastModified"], errors="coerce", utc=True
+    keys = markers["BucketKey"].astype("string")
+    dates = pd.to_datetime(markers["LastModified"], errors="coerce", utc=True)
+    candidates = retention_marker_mask(keys) & dates.notna()
+    keys = keys[candidates]
+    dates = dates[candidates]
+
+    atomic_rows = keys.str.endswith(f"/{RETENTION_MARKER_NAME}", na=False)
+    atomic_keys = keys[atomic_rows]
+    atomic_targets = atomic_keys.str[: -len(RETENTION_MARKER_NAME)]
+    groups, _ = AtomicDirectoryIndex.coerce(atomic_directories).match_series(atomic_keys)
+    valid_atomic = groups.to_numpy(dtype=object) == atomic_targets.to_numpy(dtype=object)
+
+    file_targets = keys[~atomic_rows].str[: -len(FILE_RETENTION_SUFFIX)]
+    valid_file = (file_targets.str.len() > 0).to_numpy(dtype=bool)
+
+    def newest(targets: pd.Series, valid, target_dates: pd.Series) -> pd.Series:
+        if not valid.any():
+            return pd.Series(dtype="datetime64[ns, UTC]")
+        return target_dates[valid].groupby(targets[valid].astype(object).to_numpy()).max()
+
+    return (
+        newest(file_targets, valid_file, dates[~atomic_rows]),
+        newest(atomic_targets, valid_atomic, dates[atomic_rows]),
     )
 
-    file_markers: dict[str, pd.Timestamp] = {}
-    atomic_markers: dict[str, pd.Timestamp] = {}
-    candidate_markers = marker_source.loc[
-        retention_marker_mask(marker_source["BucketKey"]),
-        ["BucketKey", "LastModified"],
-    ]
-    for row in candidate_markers.itertuples(index=False):
-        if pd.isna(row.LastModified):
-            continue
-        target = retention_marker_target(str(row.BucketKey), atomic_directories)
-        if target is None:
-            continue
-        scope, target_key = target
-        destination = atomic_markers if scope == "atomic" else file_markers
-        previous = destination.get(target_key)
-        timestamp = pd.Timestamp(row.LastModified)
-        if previous is None or timestamp > previous:
-            destination[target_key] = timestamp
 
-    control_mask = lifecycle_control_mask(updated["BucketKey"])
-    scientific_mask = ~control_mask
-    file_marker_dates = pd.to_datetime(
-        updated["BucketKey"].map(file_markers), errors="coerce", utc=True
-    )
-    file_update_mask = scientific_mask & file_marker_dates.notna() & (
-        updated["LastModified"].isna() | (file_marker_dates > updated["LastModified"])
+def _prefixes_overlap(roots: list[tuple[str, bool]]) -> bool:
+    prefixes = [prefix for prefix, _ in roots]
+    return any(
+        first.startswith(second) or second.startswith(first)
+        for position, first in enumerate(prefixes)
+        for second in prefixes[position + 1 :]
     )
-    updated.loc[file_update_mask, "LastModified"] = file_marker_dates[file_update_mask]
 
+
+def _effective_group_keys(keys: Iterable[str], roots: list[tuple[str, bool]]) -> list[str | None]:
+    """Map each key to its atomic timestamp group, or ``None``.
+
+    Wildcard groups are ``<prefix><first segment>/`` with the segment taken
+    verbatim (even when empty); a plain pattern is a single group.  Callers
+    guarantee the prefixes do not overlap, so at most one pattern applies.
+    """
+
+    alternatives = []
+    for position, (prefix, is_wildcard) in enumerate(roots):
+        if is_wildcard:
+            alternatives.append(f"{re.escape(prefix)}(?P<w{position}>[^/]*)")
+        else:
+            alternatives.append(f"(?P<p{position}>{re.escape(prefix)})")
+    pattern = re.compile("(?:" + "|".join(alternatives) + ")")
+    group_keys: list[str | None] = []
+    for match in map(pattern.match, keys):
+        if match is None:
+            group_keys.append(None)
+        elif match.lastgroup[0] == "w":
+            group_keys.append(f"{match.group(0)}/")
+        else:
+            group_keys.append(match.group(0))
+    return group_keys
+
+
+def _apply_atomic_patterns_sequentially(
+    updated: pd.DataFrame,
+    scientific_mask: pd.Series,
+    roots: list[tuple[str, bool]],
+    atomic_markers: pd.Series,
+) -> None:
+    # Overlapping prefixes are applied one after another, each over the
+    # timestamps the previous pattern produced.
     keys = updated["BucketKey"].astype("string")
-    for pattern in normalize_atomic_directories(atomic_directories):
-        if pattern.endswith("/*"):
-            prefix = f"{pattern[:-2].rstrip('/')}/"
-            mask = scientific_mask & keys.str.startswith(prefix, na=False)
-            if not mask.any():
-                continue
+    for prefix, is_wildcard in roots:
+        mask = scientific_mask & keys.str.startswith(prefix, na=False)
+        if not mask.any():
+            continue
+        if is_wildcard:
             group_ids = keys.loc[mask].str[len(prefix) :].str.split("/", n=1).str[0]
             group_keys = prefix + group_ids + "/"
             group_max = updated.loc[mask].groupby(group_keys)["LastModified"].transform("max")
-            marker_dates = pd.to_datetime(
-                group_keys.map(atomic_markers), errors="coerce", utc=True
-            )
+            marker_dates = pd.to_datetime(group_keys.map(atomic_markers), errors="coerce", utc=True)
             effective = pd.concat(
                 [group_max.rename("data"), marker_dates.rename("marker")],
                 axis=1,
@@ -196,10 +323,6 @@ def apply_effective_last_modified(
             updated.loc[mask, "LastModified"] = effective
             continue
 
-        prefix = f"{pattern.rstrip('*').rstrip('/')}/"
-        mask = scientific_mask & keys.str.startswith(prefix, na=False)
-        if not mask.any():
-            continue
         effective_timestamp = updated.loc[mask, "LastModified"].max()
         marker_timestamp = atomic_markers.get(prefix)
         if marker_timestamp is not None and (
@@ -208,6 +331,64 @@ def apply_effective_last_modified(
             effective_timestamp = marker_timestamp
         updated.loc[mask, "LastModified"] = effective_timestamp
 
+
+def apply_effective_last_modified(
+    inventory: pd.DataFrame,
+    atomic_directories: AtomicDirectoryIndex | Iterable[str] | None,
+    *,
+    authoritative_markers: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """Apply file and atomic marker timestamps to scientific inventory rows.
+
+    ``authoritative_markers`` defaults to ``inventory``.  Callers may pass the
+    current Ceph inventory explicitly when evaluating another inventory so a
+    stale Glacier marker can never extend retention by itself.
+    """
+
+    atomic_index = AtomicDirectoryIndex.coerce(atomic_directories)
+    updated = inventory.copy()
+    updated["LastModified"] = pd.to_datetime(updated["LastModified"], errors="coerce", utc=True)
+    marker_source = authoritative_markers if authoritative_markers is not None else inventory
+    file_markers, atomic_markers = retention_marker_dates(marker_source, atomic_index)
+
+    control_mask = lifecycle_control_mask(updated["BucketKey"])
+    scientific_mask = ~control_mask
+    if not file_markers.empty:
+        file_marker_dates = pd.to_datetime(
+            updated["BucketKey"].map(file_markers), errors="coerce", utc=True
+        )
+        file_update_mask = scientific_mask & file_marker_dates.notna() & (
+            updated["LastModified"].isna() | (file_marker_dates > updated["LastModified"])
+        )
+        updated.loc[file_update_mask, "LastModified"] = file_marker_dates[file_update_mask]
+
+    if atomic_index and _prefixes_overlap(atomic_index.roots):
+        _apply_atomic_patterns_sequentially(updated, scientific_mask, atomic_index.roots, atomic_markers)
+    elif atomic_index:
+        scientific_positions = np.flatnonzero(scientific_mask.to_numpy(dtype=bool))
+        group_keys = np.array(
+            _effective_group_keys(
+                updated["BucketKey"].iloc[scientific_positions].astype("string").fillna(""),
+                atomic_index.roots,
+            ),
+            dtype=object,
+        )
+        grouped = pd.notna(group_keys)
+        if grouped.any():
+            # One groupby-max over every pattern's groups, then one mapping
+            # of the per-group effective timestamp back onto the rows.
+            positions = scientific_positions[grouped]
+            group_keys = pd.Series(group_keys[grouped])
+            timestamps = updated["LastModified"].iloc[positions].reset_index(drop=True)
+            group_max = timestamps.groupby(group_keys).max()
+            effective = pd.concat(
+                [group_max.rename("data"), atomic_markers.reindex(group_max.index).rename("marker")],
+                axis=1,
+            ).max(axis=1)
+            last_modified = updated["LastModified"].array.copy()
+            last_modified[positions] = pd.to_datetime(group_keys.map(effective), utc=True).array
+            updated["LastModified"] = last_modified
+
     updated["LastModified"] = pd.to_datetime(updated["LastModified"], errors="coerce", utc=True)
     return updated
 
@@ -215,24 +396,34 @@ def apply_effective_last_modified(
 def marker_upload_mask(
     local_inventory: pd.DataFrame,
     glacier_inventory: pd.DataFrame,
-    atomic_directories: Iterable[str] | None = None,
+    atomic_directories: AtomicDirectoryIndex | Iterable[str] | None = None,
+    *,
+    destination_dates: pd.Series | None = None,
 ) -> pd.Series:
-    """Select local markers absent from Glacier or newer than its marker copy."""
+    """Select local markers absent from Glacier or newer than its marker copy.
 
-    glacier_dates = (
-        glacier_inventory[["BucketKey", "LastModified"]]
-        .assign(LastModified=lambda frame: pd.to_datetime(frame["LastModified"], errors="coerce", utc=True))
-        .groupby("BucketKey")["LastModified"]
-        .max()
-    )
+    ``destination_dates`` may carry the newest Glacier ``LastModified`` for
+    each local row, positionally aligned, when the caller already computed it
+    (see ``inventory_diff``); ``glacier_inventory`` is then not consulted.
+    """
+
+    if destination_dates is None:
+        glacier_dates = (
+            glacier_inventory[["BucketKey", "LastModified"]]
+            .assign(LastModified=lambda frame: pd.to_datetime(frame["LastModified"], errors="coerce", utc=True))
+            .groupby("BucketKey")["LastModified"]
+            .max()
+        )
+        destination_dates = local_inventory["BucketKey"].map(glacier_dates)
+    else:
+        destination_dates = destination_dates.set_axis(local_inventory.index)
     local_dates = pd.to_datetime(local_inventory["LastModified"], errors="coerce", utc=True)
-    destination_dates = local_inventory["BucketKey"].map(glacier_dates)
     keys = local_inventory["BucketKey"].astype("string")
     is_marker = keys.str.endswith(FILE_RETENTION_SUFFIX, na=False)
     atomic_candidates = keys.str.endswith(f"/{RETENTION_MARKER_NAME}", na=False)
     if atomic_candidates.any():
-        valid_atomic = keys.loc[atomic_candidates].map(
-            lambda value: retention_marker_target(str(value), atomic_directories) is not None
-        )
-        is_marker.loc[atomic_candidates] = valid_atomic
+        atomic_keys = keys.loc[atomic_candidates]
+        groups, _ = AtomicDirectoryIndex.coerce(atomic_directories).match_series(atomic_keys)
+        marker_groups = atomic_keys.str[: -len(RETENTION_MARKER_NAME)].to_numpy(dtype=object)
+        is_marker.loc[atomic_candidates] = groups.to_numpy(dtype=object) == marker_groups
     return is_marker & (destination_dates.isna() | (local_dates > destination_dates))
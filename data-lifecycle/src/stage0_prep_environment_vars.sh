@@ -17,6 +17,8 @@ export GLACIER_ENDPOINT="${GLACIER_ENDPOINT:-https://s3.us-west-2.amazonaws.com}
 export GLACIER_PROFILE="${GLACIER_PROFILE-aws-braingeneers-backups}"
 export AWS_INVENTORY_BUCKET="${AWS_INVENTORY_BUCKET:-braingeneers-backups-inventory}"
 export AWS_INVENTORY_PREFIX="${AWS_INVENTORY_PREFIX:-braingeneers-backups-glacier/daily-inventory/}"
+# Canonical Parquet inventory cache shared by Stage 1-3; an explicitly empty value disables it.
+export INVENTORY_CACHE_DIR="${INVENTORY_CACHE_DIR-${LOCAL_SCRATCH_DIR}/inventory-cache}"
 export DEBUG_RCLONE_LIMIT="${DEBUG_RCLONE_LIMIT:-0}"
 
 # Get the date of the latest inventory file available on AWS
@@ -7,6 +7,8 @@ set -euo pipefail
 # See mission_control/data-lifecycle/README.md for more information.
 #
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
 #####################################################################################
 ## Stage 1:
 ## Copy data-lifecycle.yaml file and latest AWS inventory file (both locally and to NRP/S3)
@@ -36,3 +38,13 @@ echo "Copied s3://${AWS_INVENTORY_BUCKET}/${AWS_INVENTORY_PREFIX}${LATEST_INVENT
 # Upload the glacier manifest to NRP/S3
 aws --endpoint "${NRP_ENDPOINT}" s3 cp "${LOCAL_SCRATCH_DIR}/glacier_inventory.csv.gz" "${PRIMARY_INVENTORY_PATH}glacier_inventory.csv.gz"
 gunzip -f ${LOCAL_SCRATCH_DIR}/glacier_inventory.csv.gz
+
+if [ -n "${INVENTORY_CACHE_DIR:-}" ]; then
+  echo "Building canonical Glacier inventory cache in ${INVENTORY_CACHE_DIR}"
+  if ! python -u "${SCRIPT_DIR}/inventory_cache.py" \
+    --inventory-type aws \
+    --inventory "${LOCAL_SCRATCH_DIR}/glacier_inventory.csv" \
+    --cache-dir "${INVENTORY_CACHE_DIR}"; then
+    echo "WARNING: Failed to build the Glacier inventory cache; Stage 3 will decode the CSV directly."
+  fi
+fi
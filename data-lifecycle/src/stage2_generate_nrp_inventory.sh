@@ -592,4 +592,14 @@ if [[ $attempts -eq $max_attempts ]]; then
   echo "🔥 Failed to upload inventory after $max_attempts attempts."
 fi
 
+if [[ -n "${INVENTORY_CACHE_DIR:-}" ]]; then
+  echo -e "\n🗂️  Building canonical NRP inventory cache in: $INVENTORY_CACHE_DIR"
+  if ! python -u "${SCRIPT_DIR}/inventory_cache.py" \
+    --inventory-type nrp \
+    --inventory "$LOCAL_INVENTORY" \
+    --cache-dir "$INVENTORY_CACHE_DIR"; then
+    echo "⚠️  Failed to build the NRP inventory cache; Stage 3 will decode the CSV directly."
+  fi
+fi
+
 echo -e "\n✅ Done. See output files in: $LOCAL_SCRATCH_DIR"
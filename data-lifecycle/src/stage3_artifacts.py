@@ -0,0 +1,123 @@
+"""Single-pass writer for the Stage 3 CSV artifacts.
+
+Each CSV artifact is rendered once and streamed to every destination at the
+same time: the plain file at each requested path and, when enabled, a
+``.gz`` copy beside it.  ``notifications.csv`` and the cleanup-window CSV
+carry the same rows, so they share one rendering.
+
+Timestamp columns are formatted as ``YYYY-MM-DDTHH:MM:SSZ`` with
+``numpy.datetime_as_string`` instead of a per-value ``strftime``, and the
+rendered frame reuses the other columns of its source instead of copying it.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+from collections.abc import Sequence
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+
+ARTIFACT_TIMESTAMP_SUFFIX = "Z"
+ARTIFACT_GZIP_SUFFIX = ".gz"
+ARTIFACT_GZIP_LEVEL = 6
+ARTIFACT_BUFFER_BYTES = 1024 * 1024
+
+
+def format_utc_timestamps(values: pd.Series) -> np.ndarray:
+    """Return ``values`` as ``YYYY-MM-DDTHH:MM:SSZ`` strings; missing values stay missing."""
+
+    if getattr(values.dt, "tz", None) is not None:
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+    seconds = values.to_numpy(dtype="datetime64[s]")
+    missing = np.isnat(seconds)
+    formatted = np.char.add(np.datetime_as_string(seconds, unit="s"), ARTIFACT_TIMESTAMP_SUFFIX).astype(object)
+    formatted[missing] = None
+    return formatted
+
+
+def render_timestamp_columns(frame: pd.DataFrame, timestamp_columns: Sequence[str]) -> pd.DataFrame:
+    """Return ``frame`` with its datetime ``timestamp_columns`` formatted for output."""
+
+    formatted = {
+        column: format_utc_timestamps(frame[column])
+        for column in timestamp_columns
+        if column in frame.columns and pd.api.types.is_datetime64_any_dtype(frame[column])
+    }
+    if not formatted:
+        return frame
+    return pd.DataFrame(
+        {column: formatted.get(column, frame[column]) for column in frame.columns},
+        index=frame.index,
+        copy=False,
+    )
+
+
+class _TeeStream(io.RawIOBase):
+    def __init__(self, sinks) -> None:
+        super().__init__()
+        self._sinks = sinks
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        for sink in self._sinks:
+            sink.write(data)
+        return len(data)
+
+
+def artifact_destinations(paths: Sequence[str], gzip_variants: bool) -> list[str]:
+    """Return every file one rendering is written to."""
+
+    destinations = list(dict.fromkeys(paths))
+    if gzip_variants:
+        destinations += [f"{path}{ARTIFACT_GZIP_SUFFIX}" for path in destinations]
+    return destinations
+
+
+def write_csv_artifact(
+    data: pd.DataFrame | pd.Series,
+    paths: Sequence[str],
+    *,
+    timestamp_columns: Sequence[str] = (),
+    gzip_variants: bool = False,
+    **to_csv_options,
+) -> list[str]:
+    """Render ``data`` as UTF-8 CSV once and stream it to every destination.
+
+    Returns the files written.  ``to_csv_options`` are passed to
+    ``to_csv``; the bytes match ``data.to_csv(path, encoding='utf8', ...)``
+    after timestamp formatting.
+    """
+
+    paths = list(dict.fromkeys(paths))
+    if isinstance(data, pd.DataFrame):
+        data = render_timestamp_columns(data, timestamp_columns)
+    with ExitStack() as stack:
+        sinks = [stack.enter_context(open(path, "wb")) for path in paths]
+        if gzip_variants:
+            sinks += [
+                stack.enter_context(
+                    gzip.GzipFile(
+                        filename="",
+                        mode="wb",
+                        compresslevel=ARTIFACT_GZIP_LEVEL,
+                        fileobj=stack.enter_context(open(f"{path}{ARTIFACT_GZIP_SUFFIX}", "wb")),
+                        mtime=0,
+                    )
+                )
+                for path in paths
+            ]
+        # newline="" keeps the line terminator to_csv writes, as it does for a path.
+        text = io.TextIOWrapper(
+            io.BufferedWriter(_TeeStream(sinks), buffer_size=ARTIFACT_BUFFER_BYTES),
+            encoding="utf8",
+            newline="",
+        )
+        stack.callback(text.close)
+        data.to_csv(text, **to_csv_options)
+        text.flush()
+    return artifact_destinations(paths, gzip_variants)
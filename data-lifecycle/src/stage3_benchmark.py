@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""Synthetic inventories and a scaling benchmark for Stage 3.
+
+``generate_synthetic_inventories`` writes an NRP and a Glacier inventory CSV
+of a requested size in fixed-size chunks, so 100M-row inventories never sit
+in memory.  Every row is derived from a hash of its row number and the seed,
+so the same ``(rows, seed, anchor date)`` always produces the same files.
+The layout follows the policy file:
+
+* datasets of ``FILES_PER_DATASET`` files under each ``backup.atomic_directories``
+  root, and unmanaged datasets under ``UNMANAGED_PREFIX``;
+* directory and file retention markers, NOBACKUP markers, rclone dot
+  segments, keys that need URL encoding in the Glacier inventory and
+  control-character keys;
+* Glacier copies that are current, stale or missing, plus Glacier-only
+  objects deleted from Ceph.
+
+``run_benchmark`` runs ``generate_puts_deletes.py`` on them and records
+throughput and peak RSS per phase from its ``stage3-profile.json``, tagged with
+the image ``VERSION``.  ``find_regressions`` compares two results so a
+slower release candidate can be rejected::
+
+    python stage3_benchmark.py --rows 1M 10M --work-dir /scratch/bench \\
+        --output bench-39.json --baseline bench-38.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+import generate_puts_deletes
+from lifecycle_constants import FILE_RETENTION_SUFFIX, NOBACKUP_MARKER_NAME, RETENTION_MARKER_NAME
+from lifecycle_controls import AtomicDirectoryIndex
+from stage4_keys import RCLONE_DOT_SEGMENT
+
+STAGE3_BENCHMARK_SCHEMA_VERSION = 1
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parent / "data-lifecycle.yaml"
+VERSION_PATH = Path(__file__).resolve().parent.parent / "VERSION"
+FILES_PER_DATASET = 16
+GENERATOR_CHUNK_ROWS = 1_000_000
+UNMANAGED_PREFIX = "braingeneers/personal/"
+DATASET_AGE_SECONDS = 11 * 365 * 86400
+RECENT_MARKER_SECONDS = 60 * 86400
+STALE_COPY_SECONDS = 30 * 86400
+DELETED_AGE_SECONDS = 2 * 365 * 86400
+GLACIER_STORAGE_CLASS = "DEEP_ARCHIVE"
+DEFAULT_GLACIER_BUCKET = "braingeneers-backups"
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_PHASE_SECONDS = 1.0
+ROW_COUNT_SUFFIXES = {"K": 10**3, "M": 10**6, "G": 10**9}
+BENCHMARK_OUTPUTS = (
+    ("--puts-output", "puts.txt"),
+    ("--puts-manifest-output", "puts-manifest.csv"),
+    ("--deletes-output", "deletes.txt"),
+    ("--badkeys-output", "badkeys.tsv"),
+    ("--notifications-output", "notifications.csv"),
+    ("--cleanup-window-output", "cleanup_within_notification_window.csv"),
+    ("--cleanup-summary-output", "cleanup_within_notification_window_summary.csv"),
+    ("--cleanup-slack-message-output", "cleanup_within_notification_window_slack.txt"),
+    ("--comparison-summary-output", "comparison-summary.json"),
+    ("--prefix-rollups-output", "prefix-rollups.csv"),
+)
+
+
+def parse_row_count(text: str) -> int:
+    """Parse ``1000000``, ``1M`` or ``2.5K`` style row counts."""
+
+    multiplier = ROW_COUNT_SUFFIXES.get(text[-1:].upper(), 1)
+    number = text[:-1] if multiplier != 1 else text
+    rows = int(float(number) * multiplier)
+    if rows <= 0:
+        raise argparse.ArgumentTypeError(f"row count must be positive: {text!r}")
+    return rows
+
+
+def read_version() -> str:
+    try:
+        return VERSION_PATH.read_text(encoding="utf8").strip()
+    except OSError:
+        return "unknown"
+
+
+def _mix(values: np.ndarray, seed: int) -> np.ndarray:
+    """splitmix64 of ``values`` under ``seed``; deterministic per value, not per chunk."""
+
+    mixed = values.astype(np.uint64) + np.uint64((seed * 0x9E3779B97F4A7C15) % 2**64)
+    mixed = (mixed ^ (mixed >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    mixed = (mixed ^ (mixed >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return mixed ^ (mixed >> np.uint64(31))
+
+
+def _format_seconds(seconds: np.ndarray, suffix: str) -> np.ndarray:
+    stamps = np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s")
+    return np.char.add(stamps, suffix)
+
+
+def synthetic_inventory_chunk(
+    start: int,
+    stop: int,
+    roots: list[str],
+    anchor_seconds: int,
+    seed: int,
+    glacier_bucket: str,
+):
+    """Return the NRP and Glacier rows generated for local rows ``[start, stop)``."""
+
+    rows = np.arange(start, stop, dtype=np.int64)
+    dataset = rows // FILES_PER_DATASET
+    file_number = rows % FILES_PER_DATASET
+    dataset_hash = _mix(dataset, seed)
+    row_hash = _mix(rows, seed + 1)
+
+    atomic = (dataset_hash % np.uint64(10)) < np.uint64(8)
+    root_index = ((dataset_hash >> np.uint64(8)) % np.uint64(len(roots))).astype(np.int64)
+    selector = (dataset_hash >> np.uint64(24)).astype(np.int64)
+    row_selector = (row_hash % np.uint64(1_000_000)).astype(np.int64)
+    dataset_seconds = anchor_seconds - (dataset_hash % np.uint64(DATASET_AGE_SECONDS)).astype(np.int64)
+    last_modified = dataset_seconds + file_number * 60
+    sizes = (row_hash >> np.uint64(20)) % np.uint64(2**31)
+
+    directory_marker = atomic & (file_number == 0) & (selector % 25 == 0)
+    no_backup = ~atomic & (file_number == 0) & (selector % 20 == 0)
+    file_marker = ~atomic & (file_number == 1) & (selector % 30 == 1)
+    dot_segment = (file_number == 3) & (selector % 50 == 7)
+    url_special = (file_number == 4) & (selector % 40 == 9)
+    control_character = (file_number == 5) & (selector % 500 == 13)
+    marker = directory_marker | no_backup | file_marker
+    last_modified = np.where(
+        marker, anchor_seconds - (row_selector % RECENT_MARKER_SECONDS), last_modified
+    )
+    sizes = np.where(marker, 0, sizes).astype(np.int64)
+
+    # Row kinds: 0 plain, 1 directory marker, 2 NOBACKUP, 3 file marker,
+    # 4 control character, 5 rclone dot segment, 6 URL-encoded characters.
+    kind = np.select(
+        [directory_marker, no_backup, file_marker, control_character, dot_segment, url_special],
+        [1, 2, 3, 4, 5, 6],
+        default=0,
+    )
+    names = [f"{value:012x}" for value in (dataset_hash >> np.uint64(16)).tolist()]
+    directories = [
+        f"{roots[root]}{name}/" if is_atomic else f"{UNMANAGED_PREFIX}user{select % 200}/{name}/"
+        for name, is_atomic, root, select in zip(names, atomic.tolist(), root_index.tolist(), selector.tolist())
+    ]
+    templates = (
+        "{0}original/data/chunk{1}.raw",
+        "{0}" + RETENTION_MARKER_NAME,
+        "{0}" + NOBACKUP_MARKER_NAME,
+        "{0}original/data/chunk2.raw" + FILE_RETENTION_SUFFIX,
+        "{0}original/data/bad\u2401chunk{1}.raw",
+        "{0}original/" + RCLONE_DOT_SEGMENT + "/chunk{1}.raw",
+        "{0}original/data/run {1}@lab (copy).raw",
+    )
+    keys = [
+        templates[row_kind].format(directory, number)
+        for directory, row_kind, number in zip(directories, kind.tolist(), file_number.tolist())
+    ]
+    keys = np.array(keys, dtype=object)
+
+    local = pd.DataFrame(
+        {
+            "LastModified": _format_seconds(last_modified, "Z"),
+            "BucketKey": keys,
+            "Size": sizes,
+        }
+    )
+
+    # Glacier: 85% current copies, 5% stale copies, 10% missing; half the
+    # markers are uploaded.  Some datasets also have Glacier-only files.
+    copy_selector = row_selector % 100
+    backed_up = (copy_selector < 90) & ~control_character & ~no_backup
+    backed_up &= ~marker | (copy_selector % 2 == 0)
+    stale = backed_up & (copy_selector >= 85)
+    glacier_seconds = np.where(stale, last_modified - STALE_COPY_SECONDS, last_modified)[backed_up]
+    glacier_keys = keys[backed_up]
+    glacier_sizes = sizes[backed_up]
+
+    deleted = (copy_selector < 6) & ~marker & ~control_character
+    deleted_keys = np.array(
+        [key.replace("/original/", "/deleted/", 1) for key in keys[deleted]],
+        dtype=object,
+    )
+    glacier_keys = np.concatenate([glacier_keys, deleted_keys])
+    glacier_seconds = np.concatenate([glacier_seconds, last_modified[deleted] - DELETED_AGE_SECONDS])
+    glacier_sizes = np.concatenate([glacier_sizes, sizes[deleted]])
+
+    encode = (dot_segment | url_special)[backed_up]
+    encode = np.concatenate([encode, (dot_segment | url_special)[deleted]])
+    glacier_keys[encode] = [quote(key, safe="/") for key in glacier_keys[encode]]
+    # Keep source-row order so the files do not depend on the chunk size.
+    order = np.argsort(np.concatenate([rows[backed_up], rows[deleted]]), kind="stable")
+    glacier = pd.DataFrame(
+        {
+            "Bucket": glacier_bucket,
+            "BucketKey": glacier_keys[order],
+            "Size": glacier_sizes[order],
+            "LastModified": _format_seconds(glacier_seconds[order], ".000Z"),
+            "StorageClass": GLACIER_STORAGE_CLASS,
+        }
+    )
+    return local, glacier
+
+
+def generate_synthetic_inventories(
+    output_dir: str | os.PathLike,
+    rows: int,
+    *,
+    config: dict,
+    seed: int = 0,
+    anchor: datetime | None = None,
+    chunk_rows: int = GENERATOR_CHUNK_ROWS,
+) -> tuple[Path, Path]:
+    """Write ``rows`` NRP rows and the matching Glacier inventory; return both paths.
+
+    Files already generated for the same rows, seed and anchor day are reused.
+    """
+
+    anchor = anchor or datetime.now(timezone.utc)
+    roots = [prefix for prefix, _ in AtomicDirectoryIndex((config.get("backup") or {}).get("atomic_directories")).roots]
+    if not roots:
+        raise ValueError("The benchmark configuration has no backup.atomic_directories.")
+    glacier_bucket = (config.get("aws_s3_glacier") or {}).get("bucket", DEFAULT_GLACIER_BUCKET)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"{rows}-seed{seed}-{anchor.strftime('%Y%m%d')}"
+    local_path = output_dir / f"local-{stem}.csv"
+    glacier_path = output_dir / f"glacier-{stem}.csv"
+    if local_path.is_file() and glacier_path.is_file():
+        return local_path, glacier_path
+
+    anchor_seconds = int(anchor.timestamp())
+    partial_local = local_path.with_suffix(".csv.partial")
+    partial_glacier = glacier_path.with_suffix(".csv.partial")
+    with open(partial_local, "w", encoding="utf8", newline="") as local_file, \
+            open(partial_glacier, "w", encoding="utf8", newline="") as glacier_file:
+        for start in range(0, rows, chunk_rows):
+            local, glacier = synthetic_inventory_chunk(
+                start, min(rows, start + chunk_rows), roots, anchor_seconds, seed, glacier_bucket
+            )
+            local.to_csv(local_file, index=False, header=False)
+            glacier.to_csv(glacier_file, index=False, header=False)
+    os.replace(partial_local, local_path)
+    os.replace(partial_glacier, glacier_path)
+    return local_path, glacier_path
+
+
+def count_lines(path: str | os.PathLike) -> int:
+    with open(path, "rb") as handle:
+        return sum(block.count(b"\n") for block in iter(lambda: handle.read(8 * 1024 * 1024), b""))
+
+
+def run_benchmark(
+    config_path: str | os.PathLike,
+    local_path: str | os.PathLike,
+    glacier_path: str | os.PathLike,
+    work_dir: str | os.PathLike,
+    *,
+    processes: int = 1,
+    chunk_rows: int = 0,
+) -> dict:
+    """Run Stage 3 once and return per-phase throughput and peak RSS.
+
+    Each run is a fresh ``generate_puts_deletes.py`` process, so its peak RSS
+    is not inflated by earlier runs; its output goes to ``stage3.log``.
+    """
+
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    profile_path = work_dir / "stage3-profile.json"
+    command = [
+        sys.executable,
+        generate_puts_deletes.__file__,
+        "--config", str(config_path),
+        "--prp-inventory", str(local_path),
+        "--aws-inventory", str(glacier_path),
+        "--progress-interval-seconds", "0",
+        "--chunk-rows", str(chunk_rows),
+        "--processes", str(processes),
+        "--profile-output", str(profile_path),
+    ]
+    for option, name in BENCHMARK_OUTPUTS:
+        command += [option, str(work_dir / name)]
+    with open(work_dir / "stage3.log", "w", encoding="utf8") as log_file:
+        subprocess.run(command, stdout=log_file, stderr=subprocess.STDOUT, check=True)
+    profile = json.loads(profile_path.read_text(encoding="utf8"))
+    input_rows = count_lines(local_path) + count_lines(glacier_path)
+    phases = {}
+    for phase in profile["phases"]:
+        wall = phase["wall_seconds"]
+        phases[phase["phase"]] = {
+            "wall_seconds": wall,
+            "cpu_seconds": phase["cpu_seconds"],
+            "child_cpu_seconds": phase["child_cpu_seconds"],
+            "input_rows_per_second": input_rows / wall if wall > 0 else None,
+            "peak_rss_mib": phase["peak_rss_mib"],
+            "peak_rss_growth_mib": phase["peak_rss_growth_mib"],
+        }
+    return {
+        "input_rows": input_rows,
+        "total_wall_seconds": profile["total_wall_seconds"],
+        "input_rows_per_second": input_rows / profile["total_wall_seconds"],
+        "peak_rss_mib": profile["peak_rss_mib"],
+        "phases": phases,
+    }
+
+
+def benchmark_environment(seed: int, processes: int, chunk_rows: int) -> dict:
+    return {
+        "version": read_version(),
+        "seed": seed,
+        "processes": processes,
+        "chunk_rows": chunk_rows,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def find_regressions(
+    current: dict,
+    baseline: dict,
+    *,
+    tolerance: float = DEFAULT_TOLERANCE,
+    min_phase_seconds: float = DEFAULT_MIN_PHASE_SECONDS,
+) -> list[str]:
+    """Return a description of every run in ``current`` slower or larger than ``baseline``.
+
+    Runs are matched by row count.  Phases shorter than ``min_phase_seconds``
+    in the baseline are too noisy to compare and are skipped.
+    """
+
+    for setting in ("seed", "processes", "chunk_rows"):
+        if current["environment"][setting] != baseline["environment"][setting]:
+            raise ValueError(
+                f"Benchmark {setting} differs from the baseline "
+                f"({current['environment'][setting]!r} vs {baseline['environment'][setting]!r})."
+            )
+    limit = 1.0 + tolerance
+    baseline_runs = {run["rows"]: run for run in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        previous = baseline_runs.get(run["rows"])
+        if previous is None:
+            continue
+        label = f"rows={run['rows']}"
+        for name, phase in previous["phases"].items():
+            observed = run["phases"].get(name)
+            if observed is None or phase["wall_seconds"] < min_phase_seconds:
+                continue
+            if observed["wall_seconds"] > phase["wall_seconds"] * limit:
+                regressions.append(
+                    f"{label} phase={name} wall_seconds {phase['wall_seconds']:.2f} -> {observed['wall_seconds']:.2f}"
+                )
+        if run["peak_rss_mib"] > previous["peak_rss_mib"] * limit:
+            regressions.append(
+                f"{label} peak_rss_mib {previous['peak_rss_mib']:.1f} -> {run['peak_rss_mib']:.1f}"
+            )
+    return regressions
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Stage 3 on synthetic inventories.")
+    parser.add_argument("--rows", type=parse_row_count, nargs="+", default=[10**6], help="NRP rows per run, e.g. 1M 10M 100M")
+    parser.add_argument("--work-dir", required=True, help="Directory for generated inventories and Stage 3 outputs")
+    parser.add_argument("--config", default=str(DEFAULT_CONFIG_PATH), help="Policy whose atomic directories shape the data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=1, help="Stage 3 --processes")
+    parser.add_argument("--chunk-rows", type=int, default=0, help="Stage 3 --chunk-rows")
+    parser.add_argument("--output", help="Path to the benchmark result JSON")
+    parser.add_argument("--baseline", help="Earlier benchmark result to compare against; regressions exit 1")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown or RSS growth fraction")
+    parser.add_argument("--generate-only", action="store_true", help="Only write the synthetic inventories")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_arguments(argv)
+    config = generate_puts_deletes.load_config_file(args.config)
+    anchor = datetime.now(timezone.utc)
+    result = {
+        "schema_version": STAGE3_BENCHMARK_SCHEMA_VERSION,
+        "generated_at_utc": anchor.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "environment": benchmark_environment(args.seed, args.processes, args.chunk_rows),
+        "runs": [],
+    }
+    for rows in args.rows:
+        print(f"[stage3][benchmark] generating rows={rows} seed={args.seed}", flush=True)
+        local_path, glacier_path = generate_synthetic_inventories(
+            Path(args.work_dir) / "inventories", rows, config=config, seed=args.seed, anchor=anchor
+        )
+        if args.generate_only:
+            print(f"[stage3][benchmark] wrote {local_path} and {glacier_path}", flush=True)
+            continue
+        run = run_benchmark(
+            args.config,
+            local_path,
+            glacier_path,
+            Path(args.work_dir) / f"run-{rows}",
+            processes=args.processes,
+            chunk_rows=args.chunk_rows,
+        )
+        run["rows"] = rows
+        result["runs"].append(run)
+        print(
+            f"[stage3][benchmark] rows={rows} seconds={run['total_wall_seconds']:.1f} "
+            f"rows_per_second={run['input_rows_per_second']:.0f} peak_rss_mib={run['peak_rss_mib']:.1f}",
+            flush=True,
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as output_file:
+            json.dump(result, output_file, indent=2, sort_keys=True)
+            output_file.write("\n")
+    if args.baseline and result["runs"]:
+        with open(args.baseline, "r", encoding="utf8") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(result, baseline, tolerance=args.tolerance)
+        for regression in regressions:
+            print(f"[stage3][benchmark] REGRESSION {regression}", flush=True)
+        if regressions:
+            return 1
+        print(
+            f"[stage3][benchmark] no regressions against version {baseline['environment']['version']}",
+            flush=True,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
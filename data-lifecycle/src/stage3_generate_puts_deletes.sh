@@ -16,6 +16,7 @@ echo "# Stage 3: Generate PUTS, DELETES, and NOTIFICATIONS."
 echo "#"
 echo "📂 Stage 3 artifacts will be written to:"
 echo " - PUT list:                   ${LOCAL_SCRATCH_DIR}/puts.txt"
+echo " - PUT manifest CSV:           ${LOCAL_SCRATCH_DIR}/puts-manifest.csv"
 echo " - DELETE list:                ${LOCAL_SCRATCH_DIR}/deletes.txt"
 echo " - BADKEYS list:               ${LOCAL_SCRATCH_DIR}/badkeys.tsv"
 echo " - Notifications CSV:          ${LOCAL_SCRATCH_DIR}/notifications.csv"
@@ -23,19 +24,25 @@ echo " - Cleanup window CSV:         ${LOCAL_SCRATCH_DIR}/cleanup_within_notific
 echo " - Cleanup summary CSV:        ${LOCAL_SCRATCH_DIR}/cleanup_within_notification_window_summary.csv"
 echo " - Cleanup Slack text:         ${LOCAL_SCRATCH_DIR}/cleanup_within_notification_window_slack.txt"
 echo " - Comparison summary JSON:    ${LOCAL_SCRATCH_DIR}/comparison-summary.json"
+echo " - Stage 3 phase profile JSON: ${LOCAL_SCRATCH_DIR}/stage3-profile.json"
+echo " - Prefix rollups CSV:         ${LOCAL_SCRATCH_DIR}/prefix-rollups.csv"
 echo " - Upload activity log:        ${LOCAL_SCRATCH_DIR}/activity.log"
+
 python -u "${SCRIPT_DIR}/generate_puts_deletes.py" \
   --config "${DATA_LIFECYCLE_CONFIG_PATH}" \
   --prp-inventory ${LOCAL_SCRATCH_DIR}/local_inventory.csv \
   --aws-inventory ${LOCAL_SCRATCH_DIR}/glacier_inventory.csv \
   --puts-output ${LOCAL_SCRATCH_DIR}/puts.txt \
+  --puts-manifest-output ${LOCAL_SCRATCH_DIR}/puts-manifest.csv \
   --deletes-output ${LOCAL_SCRATCH_DIR}/deletes.txt \
   --badkeys-output ${LOCAL_SCRATCH_DIR}/badkeys.tsv \
   --notifications-output ${LOCAL_SCRATCH_DIR}/notifications.csv \
   --cleanup-window-output ${LOCAL_SCRATCH_DIR}/cleanup_within_notification_window.csv \
   --cleanup-summary-output ${LOCAL_SCRATCH_DIR}/cleanup_within_notification_window_summary.csv \
   --cleanup-slack-message-output ${LOCAL_SCRATCH_DIR}/cleanup_within_notification_window_slack.txt \
-  --comparison-summary-output ${LOCAL_SCRATCH_DIR}/comparison-summary.json
+  --comparison-summary-output ${LOCAL_SCRATCH_DIR}/comparison-summary.json \
+  --profile-output ${LOCAL_SCRATCH_DIR}/stage3-profile.json \
+  --prefix-rollups-output ${LOCAL_SCRATCH_DIR}/prefix-rollups.csv
 
 echo ""
 echo "#"
@@ -67,6 +74,8 @@ cleanup_artifacts=(
   "${LOCAL_SCRATCH_DIR}/notifications.csv"
   "${LOCAL_SCRATCH_DIR}/cleanup_within_notification_window_summary.csv"
   "${LOCAL_SCRATCH_DIR}/cleanup_within_notification_window_slack.txt"
+  "${LOCAL_SCRATCH_DIR}/stage3-profile.json"
+  "${LOCAL_SCRATCH_DIR}/prefix-rollups.csv"
 )
 
 for artifact in "${cleanup_artifacts[@]}"; do
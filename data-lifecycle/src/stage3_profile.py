@@ -0,0 +1,167 @@
+"""Machine-readable per-phase measurements of a Stage 3 run.
+
+``Stage3ProgressReporter`` already announces each phase; ``PhaseProfile``
+turns the same phase boundaries into records that can be trended across
+workflow runs:
+
+* wall time and CPU time of the process, plus CPU time of reaped child
+  processes (the ``--processes`` shard workers);
+* RSS at the end of the phase and how much the peak RSS grew during it;
+* the phase's details (row counts, byte sizes) as passed to ``set_phase``
+  and ``record``.
+
+One named phase can additionally be captured with ``cProfile`` (top
+functions by cumulative time, plus a ``.pstats`` dump) or ``tracemalloc``
+(peak traced memory and top allocation sites).
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+STAGE3_PROFILE_SCHEMA_VERSION = 1
+PHASE_CAPTURE_MODES = ("cprofile", "tracemalloc")
+PROFILE_TOP_ENTRIES = 25
+
+
+@dataclass(frozen=True)
+class PhaseSample:
+    wall: float
+    cpu: float
+    child_cpu: float
+    rss_mib: float
+    peak_rss_mib: float
+
+
+def take_sample(memory_reader) -> PhaseSample:
+    times = os.times()
+    memory = memory_reader()
+    return PhaseSample(
+        wall=time.monotonic(),
+        cpu=times.user + times.system,
+        child_cpu=times.children_user + times.children_system,
+        rss_mib=memory["rss_mib"],
+        peak_rss_mib=memory["peak_rss_mib"],
+    )
+
+
+class PhaseCapture:
+    """cProfile or tracemalloc capture of the phase named ``phase``."""
+
+    def __init__(self, phase: str, mode: str, pstats_path: str | None = None) -> None:
+        if mode not in PHASE_CAPTURE_MODES:
+            raise ValueError(f"Unknown phase capture mode {mode!r}; expected one of {PHASE_CAPTURE_MODES}.")
+        self.phase = phase
+        self.mode = mode
+        self.pstats_path = pstats_path
+        self._profiler = None
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            tracemalloc.start()
+
+    def stop(self) -> dict:
+        if self.mode == "cprofile":
+            self._profiler.disable()
+            return self._cprofile_summary()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "mode": self.mode,
+            "peak_traced_mib": peak / (1024 * 1024),
+            "top_allocations": [
+                {"site": str(statistic.traceback), "size_mib": statistic.size / (1024 * 1024), "count": statistic.count}
+                for statistic in snapshot.statistics("lineno")[:PROFILE_TOP_ENTRIES]
+            ],
+        }
+
+    def _cprofile_summary(self) -> dict:
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        if self.pstats_path is not None:
+            stats.dump_stats(self.pstats_path)
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return {
+            "mode": self.mode,
+            "pstats_path": self.pstats_path,
+            "top_cumulative": [
+                {
+                    "function": f"{filename}:{line}({name})",
+                    "calls": calls,
+                    "total_seconds": total,
+                    "cumulative_seconds": cumulative,
+                }
+                for (filename, line, name), (_, calls, total, cumulative, _) in functions[:PROFILE_TOP_ENTRIES]
+            ],
+        }
+
+
+class PhaseProfile:
+    """Per-phase records, closed each time the next phase starts."""
+
+    def __init__(self, memory_reader, capture: PhaseCapture | None = None) -> None:
+        self.memory_reader = memory_reader
+        self.capture = capture
+        self.phases: list[dict] = []
+        self._started = take_sample(memory_reader)
+        self._current = None
+
+    def begin(self, phase: str, details: dict) -> None:
+        self.end()
+        self._current = (phase, dict(details), take_sample(self.memory_reader))
+        if self.capture is not None and self.capture.phase == phase:
+            self.capture.start()
+
+    def record(self, **details) -> None:
+        if self._current is not None:
+            self._current[1].update(details)
+
+    def end(self) -> None:
+        if self._current is None:
+            return
+        phase, details, start = self._current
+        self._current = None
+        captured = self.capture.stop() if self.capture is not None and self.capture.phase == phase else None
+        end = take_sample(self.memory_reader)
+        entry = {
+            "phase": phase,
+            "wall_seconds": round(end.wall - start.wall, 6),
+            "cpu_seconds": round(end.cpu - start.cpu, 6),
+            "child_cpu_seconds": round(end.child_cpu - start.child_cpu, 6),
+            "rss_mib": end.rss_mib,
+            "peak_rss_mib": end.peak_rss_mib,
+            "peak_rss_growth_mib": max(0.0, end.peak_rss_mib - start.peak_rss_mib),
+            "details": details,
+        }
+        if captured is not None:
+            entry["capture"] = captured
+        self.phases.append(entry)
+
+    def as_dict(self) -> dict:
+        now = take_sample(self.memory_reader)
+        return {
+            "schema_version": STAGE3_PROFILE_SCHEMA_VERSION,
+            "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "total_wall_seconds": round(now.wall - self._started.wall, 6),
+            "total_cpu_seconds": round(now.cpu - self._started.cpu, 6),
+            "total_child_cpu_seconds": round(now.child_cpu - self._started.child_cpu, 6),
+            "peak_rss_mib": now.peak_rss_mib,
+            "phases": list(self.phases),
+        }
+
+
+def write_stage3_profile(output_path: str, profile: dict) -> None:
+    with open(output_path, "w", encoding="utf8") as profile_file:
+        json.dump(profile, profile_file, indent=2, sort_keys=True)
+        profile_file.write("\n")
@@ -0,0 +1,200 @@
+"""Per-prefix object count and size rollups of a Stage 3 comparison.
+
+Each rollup row totals the scientific objects under one atomic group or one
+folder prefix:
+
+* ``ObjectCount``/``TotalBytes`` and ``PendingPutObjects``/``PendingPutBytes``
+  over the local (Ceph) inventory;
+* the earliest and latest effective ``LastModified`` of those objects and the
+  next S3 cleanup date (``s3_expire_days`` after the earliest object outside a
+  NOBACKUP prefix);
+* ``GlacierOnlyObjects``/``GlacierOnlyBytes`` and the next Glacier cleanup
+  date over objects that exist only in Glacier.
+
+Folder prefixes are those ``derive_folder_group`` returns at depths 1 to
+``ROLLUP_FOLDER_DEPTHS``; an object counts toward depth ``d`` only when its key
+has at least ``d`` folder segments.  Rows are first summed per directory and
+atomic group, so the prefix rollups are built from far fewer rows than the
+inventories.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+
+from lifecycle_controls import AtomicDirectoryIndex
+
+ROLLUP_FOLDER_DEPTHS = 3
+PREFIX_ROLLUP_COLUMNS = [
+    "GroupingType",
+    "Depth",
+    "GroupingKey",
+    "ObjectCount",
+    "TotalBytes",
+    "PendingPutObjects",
+    "PendingPutBytes",
+    "EarliestLastModified",
+    "LatestLastModified",
+    "NextS3CleanupDate",
+    "GlacierOnlyObjects",
+    "GlacierOnlyBytes",
+    "NextGlacierCleanupDate",
+]
+PREFIX_ROLLUP_TIMESTAMP_COLUMNS = (
+    "EarliestLastModified",
+    "LatestLastModified",
+    "NextS3CleanupDate",
+    "NextGlacierCleanupDate",
+)
+_ROLLUP_AGGREGATIONS = {
+    "ObjectCount": "sum",
+    "TotalBytes": "sum",
+    "PendingPutObjects": "sum",
+    "PendingPutBytes": "sum",
+    "EarliestLastModified": "min",
+    "LatestLastModified": "max",
+    "NextS3CleanupDate": "min",
+    "GlacierOnlyObjects": "sum",
+    "GlacierOnlyBytes": "sum",
+    "NextGlacierCleanupDate": "min",
+}
+
+
+def _folder_prefixes(folder_path: str, depths: int) -> list[str | None]:
+    # derive_folder_group's prefix at each depth, or None when the key is shallower.
+    if "//" in folder_path or folder_path.startswith("/"):
+        folder_path = "/".join(segment for segment in folder_path.split("/") if segment)
+    segments = folder_path.split("/", depths)[:depths] if folder_path else []
+    prefixes: list[str | None] = [None] * depths
+    prefix = ""
+    for depth, segment in enumerate(segments):
+        prefix = f"{prefix}{segment}/"
+        prefixes[depth] = prefix
+    return prefixes
+
+
+def _atomic_groups(keys: np.ndarray, directory_codes: np.ndarray, directories, atomic_index) -> np.ndarray:
+    """Return each key's atomic group ('' outside atomic directories).
+
+    A key's group depends only on its directory, except for a key directly
+    under a wildcard root, whose group is the key itself; only those are
+    matched one by one.
+    """
+    groups = np.array([atomic_index.group_for_key(f"{directory}/") or "" for directory in directories], dtype=object)
+    row_groups = groups[directory_codes]
+    wildcard_roots = {prefix for prefix, is_wildcard in atomic_index.roots if is_wildcard}
+    at_root = np.fromiter((f"{directory}/" in wildcard_roots for directory in directories), dtype=bool)
+    for position in np.flatnonzero(at_root[directory_codes]):
+        row_groups[position] = atomic_index.group_for_key(keys[position]) or ""
+    return row_groups
+
+
+def _byte_sizes(sizes: pd.Series) -> np.ndarray:
+    return pd.to_numeric(sizes, errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+
+
+def _aggregate(frame: pd.DataFrame, by: list[str]) -> pd.DataFrame:
+    return frame.groupby(by, sort=False).agg(_ROLLUP_AGGREGATIONS).reset_index()
+
+
+def _rollup_rows(
+    local: pd.DataFrame,
+    glacier_only: pd.DataFrame,
+    pending: np.ndarray,
+    s3_cleanup_eligible: np.ndarray,
+    s3_expire_days: int,
+    cold_storage_expire_days: int,
+) -> pd.DataFrame:
+    local_bytes = _byte_sizes(local["Size"])
+    glacier_bytes = _byte_sizes(glacier_only["Size"])
+    local_last_modified = local["LastModified"].reset_index(drop=True)
+    glacier_last_modified = glacier_only["LastModified"].reset_index(drop=True)
+    local_rows = pd.DataFrame(
+        {
+            "BucketKey": local["BucketKey"].to_numpy(dtype=object),
+            "ObjectCount": np.ones(len(local), dtype=np.int64),
+            "TotalBytes": local_bytes,
+            "PendingPutObjects": pending.astype(np.int64),
+            "PendingPutBytes": np.where(pending, local_bytes, 0),
+            "EarliestLastModified": local_last_modified,
+            "LatestLastModified": local_last_modified,
+            "NextS3CleanupDate": (local_last_modified + pd.Timedelta(days=s3_expire_days)).where(
+                s3_cleanup_eligible
+            ),
+        }
+    )
+    glacier_rows = pd.DataFrame(
+        {
+            "BucketKey": glacier_only["BucketKey"].to_numpy(dtype=object),
+            "GlacierOnlyObjects": np.ones(len(glacier_only), dtype=np.int64),
+            "GlacierOnlyBytes": glacier_bytes,
+            "NextGlacierCleanupDate": glacier_last_modified + pd.Timedelta(days=cold_storage_expire_days),
+        }
+    )
+    rows = pd.concat([local_rows, glacier_rows], ignore_index=True)
+    count_columns = [column for column, how in _ROLLUP_AGGREGATIONS.items() if how == "sum"]
+    rows[count_columns] = rows[count_columns].fillna(0).astype(np.int64)
+    return rows
+
+
+def build_prefix_rollups(
+    local: pd.DataFrame,
+    glacier: pd.DataFrame,
+    *,
+    local_scientific: np.ndarray,
+    put_mask: np.ndarray,
+    no_backup_mask: np.ndarray,
+    glacier_only_mask: np.ndarray,
+    atomic_directories: AtomicDirectoryIndex | Sequence[str] | None,
+    s3_expire_days: int,
+    cold_storage_expire_days: int,
+    folder_depths: int = ROLLUP_FOLDER_DEPTHS,
+) -> pd.DataFrame:
+    """Return one row per atomic group and folder prefix (see the module docstring).
+
+    All masks are positional over ``local`` or ``glacier``; ``local`` carries
+    the effective (atomic-group) ``LastModified``.  Rows are ordered by
+    ``GroupingType`` (``atomic`` first), ``Depth`` and ``GroupingKey``.
+    """
+
+    atomic_index = AtomicDirectoryIndex.coerce(atomic_directories)
+    local_scientific = np.asarray(local_scientific, dtype=bool)
+    rows = _rollup_rows(
+        local.loc[local_scientific],
+        glacier.loc[np.asarray(glacier_only_mask, dtype=bool)],
+        np.asarray(put_mask, dtype=bool)[local_scientific],
+        ~np.asarray(no_backup_mask, dtype=bool)[local_scientific],
+        s3_expire_days,
+        cold_storage_expire_days,
+    )
+    if rows.empty:
+        return pd.DataFrame(columns=PREFIX_ROLLUP_COLUMNS)
+
+    keys = rows.pop("BucketKey").fillna("").to_numpy(dtype=object)
+    directory_codes, directories = pd.factorize(np.array([key.rpartition("/")[0] for key in keys], dtype=object))
+    rows["Directory"] = directory_codes
+    rows["AtomicGroup"] = _atomic_groups(keys, directory_codes, directories, atomic_index)
+    by_directory = _aggregate(rows, ["Directory", "AtomicGroup"])
+
+    atomic = _aggregate(by_directory[by_directory["AtomicGroup"] != ""].drop(columns=["Directory"]), ["AtomicGroup"])
+    atomic.insert(0, "GroupingType", "atomic")
+    atomic.insert(1, "Depth", [len([part for part in group.split("/") if part]) for group in atomic["AtomicGroup"]])
+    rollups = [atomic.rename(columns={"AtomicGroup": "GroupingKey"})]
+    prefixes = np.array([_folder_prefixes(directory, folder_depths) for directory in directories], dtype=object)
+    prefixes = prefixes.reshape(len(directories), folder_depths)
+    for depth in range(1, folder_depths + 1):
+        folders = by_directory.drop(columns=["Directory", "AtomicGroup"])
+        folders["GroupingKey"] = prefixes[by_directory["Directory"].to_numpy(), depth - 1]
+        folders = _aggregate(folders.dropna(subset=["GroupingKey"]), ["GroupingKey"])
+        folders.insert(0, "GroupingType", "folder")
+        folders.insert(1, "Depth", depth)
+        rollups.append(folders)
+
+    rollup = pd.concat(rollups, ignore_index=True)[PREFIX_ROLLUP_COLUMNS]
+    rollup["Depth"] = rollup["Depth"].astype(np.int64)
+    rollup.sort_values(["GroupingType", "Depth", "GroupingKey"], inplace=True)
+    rollup.reset_index(drop=True, inplace=True)
+    return rollup
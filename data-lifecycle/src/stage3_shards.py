@@ -0,0 +1,140 @@
+"""Key-prefix partitioning of the Stage 3 comparison across processes.
+
+Every per-row Stage 3 decision depends only on rows that share an atomic
+timestamp group, on a retention marker and its target, or on the same key in
+the other inventory.  ``shard_rows`` sends each row to a shard by a stable
+hash of an anchor that keeps all of those rows together:
+
+* a key under ``backup.atomic_directories`` is anchored at the group token
+  (``<root><segment>``) of the shortest matching root.  Any key that shares a
+  timestamp group with it under any pattern shares that token as well;
+* any other key is anchored at itself, and a file retention marker at its
+  target key.
+
+NOBACKUP prefixes can cover keys in any shard, so the caller resolves them
+once over the whole local inventory.  Shards are compared independently and
+merged back by row position, which keeps every artifact identical to the
+single-process run.
+"""
+
+from __future__ import annotations
+
+import re
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from lifecycle_constants import FILE_RETENTION_SUFFIX
+from lifecycle_controls import AtomicDirectoryIndex
+
+
+@dataclass(frozen=True)
+class ShardTask:
+    local: pd.DataFrame
+    glacier: pd.DataFrame
+    atomic_directories: list[str]
+    no_backup_prefixes: list[str]
+    s3_expire_days: int
+    cold_storage_expire_days: int
+    notification_days: int
+    now_utc: datetime
+
+
+@dataclass(frozen=True)
+class ShardResult:
+    local_last_modified: pd.Series
+    glacier_last_modified: pd.Series
+    put_mask: np.ndarray
+    glacier_only_mask: np.ndarray
+    cleanup_window: pd.DataFrame
+    key_counts: dict
+
+
+def _anchor_pattern(atomic_index: AtomicDirectoryIndex) -> re.Pattern | None:
+    # Alternatives are tried in order, so the shortest root matches first.
+    alternatives = [
+        f"{re.escape(prefix)}[^/]*" if is_wildcard else re.escape(prefix)
+        for prefix, is_wildcard in sorted(atomic_index.roots, key=lambda root: len(root[0]))
+    ]
+    return re.compile("|".join(alternatives)) if alternatives else None
+
+
+def _shard_anchor(key: str, pattern: re.Pattern | None) -> str:
+    if key.endswith(FILE_RETENTION_SUFFIX):
+        key = key[: -len(FILE_RETENTION_SUFFIX)]
+    matched = pattern.match(key) if pattern is not None else None
+    return key if matched is None else matched.group(0)
+
+
+def shard_rows(
+    local_keys: pd.Series,
+    glacier_keys: pd.Series,
+    atomic_index: AtomicDirectoryIndex,
+    shards: int,
+) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    """Return each shard's ``(local, glacier)`` row positions, in ascending order.
+
+    Both inventories are encoded together so each distinct key is anchored
+    and hashed once; missing keys go to shard 0.
+    """
+
+    codes, uniques = pd.factorize(
+        np.concatenate([local_keys.to_numpy(dtype=object), glacier_keys.to_numpy(dtype=object)])
+    )
+    pattern = _anchor_pattern(atomic_index)
+    unique_shards = np.fromiter(
+        (
+            zlib.crc32(_shard_anchor(key, pattern).encode("utf-8", "surrogatepass")) % shards
+            for key in np.asarray(uniques, dtype=object)
+        ),
+        dtype=np.int64,
+        count=len(uniques),
+    )
+    row_shards = np.zeros(len(codes), dtype=np.int64)
+    present = codes >= 0
+    row_shards[present] = unique_shards[codes[present]]
+    return (
+        _positions_by_shard(row_shards[: len(local_keys)], shards),
+        _positions_by_shard(row_shards[len(local_keys) :], shards),
+    )
+
+
+def _positions_by_shard(row_shards: np.ndarray, shards: int) -> list[np.ndarray]:
+    order = np.argsort(row_shards, kind="stable")
+    bounds = np.searchsorted(row_shards[order], np.arange(shards + 1))
+    return [order[bounds[shard] : bounds[shard + 1]] for shard in range(shards)]
+
+
+def scatter_masks(length: int, positions: list[np.ndarray], masks: list[np.ndarray]) -> np.ndarray:
+    merged = np.zeros(length, dtype=bool)
+    for shard_positions, mask in zip(positions, masks):
+        merged[shard_positions] = mask
+    return merged
+
+
+def scatter_column(frame: pd.DataFrame, column: str, positions: list[np.ndarray], parts: list[pd.Series]) -> pd.DataFrame:
+    """Return ``frame`` with ``column`` rebuilt from per-shard values."""
+
+    merged = pd.concat(
+        [pd.Series(part.array, index=shard_positions) for shard_positions, part in zip(positions, parts)]
+    ).sort_index()
+    updated = frame.copy()
+    updated[column] = merged.array
+    return updated
+
+
+def merge_key_counts(counts: list[dict]) -> dict:
+    """Sum per-shard key counts; each key lives in exactly one shard."""
+
+    merged: dict = {}
+    for shard_counts in counts:
+        for name, value in shard_counts.items():
+            if isinstance(value, list):
+                previous = merged.get(name, [0] * len(value))
+                merged[name] = [left + right for left, right in zip(previous, value)]
+            else:
+                merged[name] = merged.get(name, 0) + value
+    return merged
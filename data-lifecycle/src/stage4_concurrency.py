@@ -0,0 +1,80 @@
+"""Adaptive (AIMD) upload concurrency for Stage 4.
+
+With ``--concurrency adaptive`` Stage 4 keeps at most ``limit`` uploads in
+flight and revises the limit once per window from ``ProgressStats``
+snapshots:
+
+* a ``SlowDown``/``Throttling`` retry in the window, or an active transfer
+  whose stream has not advanced for ``stall_seconds``, halves the limit;
+* otherwise, when the window recorded no retries, every slot was busy and
+  the aggregate stream rate beat the previous window's, the limit grows by
+  one;
+* anything else holds the limit.
+
+The limit stays within ``[min_workers, max_workers]``.  Lowering it never
+interrupts running uploads; Stage 4 just submits no new ones until the
+in-flight count drops below it.
+"""
+
+CONCURRENCY_MODES = ('fixed', 'adaptive')
+THROTTLE_ERROR_CODES = frozenset({'SlowDown', 'Throttling', 'ThrottlingException'})
+RATE_IMPROVEMENT_FRACTION = 0.05
+
+
+def throttle_retry_count(retry_error_counts):
+    """Sum retries whose ``classify_error`` name carries a throttling error code."""
+
+    return sum(
+        count for name, count in retry_error_counts.items() if THROTTLE_ERROR_CODES.intersection(name.split(':'))
+    )
+
+
+class AdaptiveConcurrency:
+    def __init__(self, initial_workers, min_workers, max_workers, stall_seconds):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.stall_seconds = stall_seconds
+        self.limit = min(max(initial_workers, min_workers), max_workers)
+        self._previous = None
+        self._previous_rate = None
+
+    def _decrease(self):
+        self.limit = max(self.min_workers, self.limit // 2)
+
+    def update(self, snapshot):
+        """Revise ``limit`` from the window since the previous snapshot and return the reason."""
+
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return 'start'
+
+        elapsed = max(1e-6, snapshot['now'] - previous['now'])
+        rate = (snapshot['stream_bytes'] - previous['stream_bytes']) / elapsed
+        previous_rate, self._previous_rate = self._previous_rate, rate
+        retries = snapshot['retry_count'] - previous['retry_count']
+        throttled = throttle_retry_count(snapshot['retry_error_counts']) - throttle_retry_count(
+            previous['retry_error_counts']
+        )
+        active_transfers = snapshot['active_transfers']
+        stalled = sum(
+            1
+            for transfer in active_transfers.values()
+            if snapshot['now'] - transfer['last_progress_time'] >= self.stall_seconds
+        )
+
+        if throttled > 0:
+            self._decrease()
+            return f'throttled_retries={throttled}'
+        if stalled > 0:
+            self._decrease()
+            return f'stalled_transfers={stalled}'
+        if retries > 0:
+            return f'hold window_retries={retries}'
+        if self.limit >= self.max_workers:
+            return 'hold max_workers'
+        if len(active_transfers) < self.limit:
+            return 'hold unsaturated'
+        if rate <= 0 or (previous_rate is not None and rate <= previous_rate * (1 + RATE_IMPROVEMENT_FRACTION)):
+            return 'hold no_rate_gain'
+        self.limit += 1
+        return 'rate_gain'
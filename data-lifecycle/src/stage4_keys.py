@@ -32,6 +32,7 @@ def normalize_put_key(raw_key):
     return normalize_bucket_object_key(key)
 
 
+# Stage 3 decodes inventories with this; bump generate_puts_deletes.INVENTORY_DECODER_VERSION when it changes.
 def normalize_bucket_object_key(raw_key):
     if raw_key is None:
         return None
@@ -77,20 +78,24 @@ def load_put_keys(puts_file):
             keys.append(normalized_key)
 
     if malformed:
-        sample_lines = '\n'.join(f'  line {line_no}: {raw_key!r}' for line_no, raw_key in malformed[:10])
-        more_label = '\n  ...' if len(malformed) > 10 else ''
-        raise ValueError(
-            (
-                f'Found {len(malformed)} malformed PUT key(s) in {puts_file}. '
-                'Failing fast before upload. '
-                "Expected keys in 'bucket/object' form.\n"
-                f'{sample_lines}{more_label}'
-            )
-        )
+        raise malformed_put_keys_error(puts_file, malformed)
 
     return keys
 
 
+def malformed_put_keys_error(puts_file, malformed):
+    sample_lines = '\n'.join(f'  line {line_no}: {raw_key!r}' for line_no, raw_key in malformed[:10])
+    more_label = '\n  ...' if len(malformed) > 10 else ''
+    return ValueError(
+        (
+            f'Found {len(malformed)} malformed PUT key(s) in {puts_file}. '
+            'Failing fast before upload. '
+            "Expected keys in 'bucket/object' form.\n"
+            f'{sample_lines}{more_label}'
+        )
+    )
+
+
 def normalize_rclone_dot_segments(object_key):
     segments = object_key.split('/')
     normalized_segments = []
@@ -0,0 +1,164 @@
+"""Local journal of Stage 4's explicit multipart uploads.
+
+``parallel_multipart_upload`` appends one JSON line when it creates an
+upload (upload ID, source ETag, object size, part size), one per stored
+part (part number and ETag) and one when the upload completes or is
+aborted.  A retryable failure leaves the upload open.  The next attempt,
+in the same run or a later one, replays the journal, confirms the stored
+parts with ``ListParts`` and uploads only the missing ranges, provided the
+source ETag and size still match.  Each upload records when it was created,
+so Stage 4 can abort uploads left open for longer than
+``--multipart-journal-max-age-hours`` at the end of a run.
+
+Replaying keeps only uploads that are still open, and the file is rewritten
+with just those so it stays small.  A line cut short by a killed process is
+ignored.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+MULTIPART_JOURNAL_NAME = 'multipart-journal.jsonl'
+
+
+class MultipartJournal:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._open_uploads = self._replay()
+        self._compact()
+        self._file_handle = open(path, 'a', encoding='utf8')
+
+    def _replay(self):
+        open_uploads = {}
+        if not os.path.exists(self.path):
+            return open_uploads
+        with open(self.path, 'r', encoding='utf8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                    key = record['key']
+                    upload_id = record['upload_id']
+                    event = record['event']
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if event == 'create':
+                    open_uploads[key] = {
+                        'upload_id': upload_id,
+                        'source_etag': record.get('source_etag'),
+                        'size': record.get('size'),
+                        'part_size': record.get('part_size'),
+                        'created_at_utc': record.get('created_at_utc'),
+                        'parts': {},
+                    }
+                    continue
+                entry = open_uploads.get(key)
+                if entry is None or entry['upload_id'] != upload_id:
+                    continue
+                if event == 'part':
+                    entry['parts'][record['part']] = record['etag']
+                elif event in {'complete', 'abort'}:
+                    del open_uploads[key]
+        return open_uploads
+
+    def _records(self, key, entry):
+        yield {
+            'event': 'create',
+            'key': key,
+            'upload_id': entry['upload_id'],
+            'source_etag': entry['source_etag'],
+            'size': entry['size'],
+            'part_size': entry['part_size'],
+            'created_at_utc': entry['created_at_utc'],
+        }
+        for part_number, etag in sorted(entry['parts'].items()):
+            yield {'event': 'part', 'key': key, 'upload_id': entry['upload_id'], 'part': part_number, 'etag': etag}
+
+    def _compact(self):
+        temp_fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path) or None,
+            prefix='multipart-journal-',
+            suffix='.jsonl',
+            text=True,
+        )
+        try:
+            with os.fdopen(temp_fd, 'w', encoding='utf8') as compact_file:
+                for key, entry in self._open_uploads.items():
+                    for record in self._records(key, entry):
+                        compact_file.write(json.dumps(record, sort_keys=True) + '\n')
+            os.replace(temp_path, self.path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def _append(self, record):
+        self._file_handle.write(json.dumps(record, sort_keys=True) + '\n')
+        self._file_handle.flush()
+
+    def open_upload(self, key):
+        """Return the journaled open upload for ``key`` (parts as ``{part number: ETag}``), or None."""
+
+        with self._lock:
+            entry = self._open_uploads.get(key)
+            return None if entry is None else {**entry, 'parts': dict(entry['parts'])}
+
+    def open_uploads(self):
+        """Return every journaled open upload as ``{key: entry}``."""
+
+        with self._lock:
+            return {key: {**entry, 'parts': dict(entry['parts'])} for key, entry in self._open_uploads.items()}
+
+    def adopt(self, key, entry):
+        """Journal an open upload taken over from another journal, with its stored parts."""
+
+        self.record_create(
+            key,
+            entry['upload_id'],
+            entry['source_etag'],
+            entry['size'],
+            entry['part_size'],
+            created_at_utc=entry.get('created_at_utc'),
+        )
+        for part_number, etag in sorted(entry['parts'].items()):
+            self.record_part(key, entry['upload_id'], part_number, etag)
+
+    def clear(self):
+        """Forget every open upload and empty the journal file."""
+
+        with self._lock:
+            self._open_uploads.clear()
+            self._file_handle.truncate(0)
+
+    def record_create(self, key, upload_id, source_etag, size, part_size, created_at_utc=None):
+        with self._lock:
+            entry = {
+                'upload_id': upload_id,
+                'source_etag': source_etag,
+                'size': size,
+                'part_size': part_size,
+                'created_at_utc': created_at_utc or time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'parts': {},
+            }
+            self._open_uploads[key] = entry
+            self._append(next(self._records(key, entry)))
+
+    def record_part(self, key, upload_id, part_number, etag):
+        with self._lock:
+            entry = self._open_uploads.get(key)
+            if entry is not None and entry['upload_id'] == upload_id:
+                entry['parts'][part_number] = etag
+            self._append({'event': 'part', 'key': key, 'upload_id': upload_id, 'part': part_number, 'etag': etag})
+
+    def record_end(self, key, upload_id, event):
+        with self._lock:
+            entry = self._open_uploads.get(key)
+            if entry is not None and entry['upload_id'] == upload_id:
+                del self._open_uploads[key]
+            self._append({'event': event, 'key': key, 'upload_id': upload_id})
+
+    def close(self):
+        with self._lock:
+            self._file_handle.close()
@@ -0,0 +1,138 @@
+"""Batched destination-existence precheck for Stage 4.
+
+By default ``copy_file`` sends a ``HeadObject`` to the Glacier bucket before
+every data upload.  With ``--destination-precheck listing`` Stage 4 first
+resolves existence for whole directories of pending PUTs:
+
+* the Glacier inventory Stage 1 downloaded marks PUT keys it already lists as
+  present, and gives the number of objects in each PUT directory;
+* a directory is listed with ``ListObjectsV2`` (``Delimiter='/'``) when the
+  pages that listing needs, estimated from that count, are fewer than the
+  HEADs it replaces.  A completed listing vouches for every pending key of the
+  directory: present when listed, absent otherwise.
+
+Keys the precheck cannot vouch for (retention markers, directories not worth
+listing, failed listings) keep the per-object ``HeadObject``.  States are an
+``int8`` array aligned with ``PutIndex`` positions.
+"""
+
+import csv
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import numpy as np
+
+PRECHECK_MODES = ('head', 'listing')
+DESTINATION_UNKNOWN = -1
+DESTINATION_ABSENT = 0
+DESTINATION_PRESENT = 1
+LIST_PAGE_KEYS = 1000
+DEFAULT_PRECHECK_LIST_WORKERS = 8
+
+
+def put_directories(put_index):
+    """Return each position's directory code (-1 for retention markers) and the distinct directories."""
+
+    codes = np.full(len(put_index), -1, dtype=np.int64)
+    directory_codes = {}
+    for position in np.flatnonzero(~np.asarray(put_index.entries['control'], dtype=bool)):
+        key = put_index.key(position)
+        directory = key[:key.rfind('/') + 1]
+        codes[position] = directory_codes.setdefault(directory, len(directory_codes))
+    return codes, list(directory_codes)
+
+
+def scan_glacier_inventory(inventory_path, put_index, directory_codes, states):
+    """Count inventory objects per PUT directory and mark PUT keys the inventory lists as present."""
+
+    counts = np.zeros(len(directory_codes), dtype=np.int64)
+    with open(inventory_path, 'r', encoding='utf8', newline='') as inventory_file:
+        for row in csv.reader(inventory_file):
+            if len(row) < 2:
+                continue
+            key = unquote(row[1]) if '%' in row[1] else row[1]
+            code = directory_codes.get(key[:key.rfind('/') + 1])
+            if code is None:
+                continue
+            counts[code] += 1
+            states[put_index.positions(key)] = DESTINATION_PRESENT
+    return counts
+
+
+def list_directory_keys(s3_client, glacier_bucket, directory):
+    keys = []
+    pages = 0
+    for page in s3_client.get_paginator('list_objects_v2').paginate(
+        Bucket=glacier_bucket, Prefix=directory, Delimiter='/'
+    ):
+        pages += 1
+        keys.extend(item['Key'] for item in page.get('Contents', ()))
+    return keys, pages
+
+
+def build_destination_states(
+    put_index,
+    glacier_bucket,
+    s3_client,
+    inventory_path=None,
+    list_workers=DEFAULT_PRECHECK_LIST_WORKERS,
+):
+    """Return destination states aligned with ``put_index`` positions and a summary of the precheck."""
+
+    states = np.full(len(put_index), DESTINATION_UNKNOWN, dtype=np.int8)
+    codes, directories = put_directories(put_index)
+    directory_codes = {directory: code for code, directory in enumerate(directories)}
+    inventory_counts = np.zeros(len(directories), dtype=np.int64)
+    if inventory_path is not None:
+        try:
+            inventory_counts = scan_glacier_inventory(inventory_path, put_index, directory_codes, states)
+        except (OSError, csv.Error, UnicodeDecodeError) as error:
+            print(
+                f'WARNING: Glacier inventory {inventory_path} unusable for the precheck ({error}); '
+                'estimating listing cost from pending PUTs only.',
+                file=sys.stderr,
+                flush=True,
+            )
+
+    data_positions = np.flatnonzero(codes >= 0)
+    by_directory = data_positions[np.argsort(codes[data_positions], kind='stable')]
+    pending_counts = np.bincount(codes[data_positions], minlength=len(directories))
+    boundaries = np.concatenate(([0], np.cumsum(pending_counts)))
+    estimated_pages = np.maximum(1, -(-(inventory_counts + pending_counts) // LIST_PAGE_KEYS))
+    listed_codes = np.flatnonzero(estimated_pages < pending_counts)
+
+    def list_directory(code):
+        try:
+            return code, list_directory_keys(s3_client, glacier_bucket, directories[code]), None
+        except Exception as error:
+            return code, None, error
+
+    list_pages = 0
+    failed_listings = 0
+    with ThreadPoolExecutor(max_workers=list_workers) as executor:
+        for code, listing, error in executor.map(list_directory, listed_codes):
+            if error is not None:
+                failed_listings += 1
+                print(
+                    f'WARNING: Listing s3://{glacier_bucket}/{directories[code]} failed; keeping HEAD prechecks: {error}',
+                    file=sys.stderr,
+                    flush=True,
+                )
+                continue
+            keys, pages = listing
+            list_pages += pages
+            directory_positions = by_directory[boundaries[code]:boundaries[code + 1]]
+            states[directory_positions] = DESTINATION_ABSENT
+            for key in keys:
+                states[put_index.positions(key)] = DESTINATION_PRESENT
+
+    return states, {
+        'directories': len(directories),
+        'listed_directories': int(len(listed_codes)) - failed_listings,
+        'failed_listings': failed_listings,
+        'list_pages': list_pages,
+        'present': int(np.count_nonzero(states == DESTINATION_PRESENT)),
+        'absent': int(np.count_nonzero(states == DESTINATION_ABSENT)),
+        'head_prechecks': int(np.count_nonzero(states[data_positions] == DESTINATION_UNKNOWN)),
+    }
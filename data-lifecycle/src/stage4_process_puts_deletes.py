@@ -4,7 +4,9 @@ import argparse
 import csv
 import json
 import math
+import multiprocessing
 import os
+import queue as queue_module
 import random
 import sys
 import threading
@@ -22,6 +24,7 @@ os.environ['NRP_ENDPOINT'] = NRP_ENDPOINT
 os.environ['ENDPOINT'] = NRP_ENDPOINT
 
 import boto3
+import numpy as np
 import braingeneers.utils.smart_open_braingeneers as smart_open_bgr
 import smart_open as smart_open_aws
 from botocore.config import Config as BotocoreConfig
@@ -43,7 +46,34 @@ from badkeys import (
     source_get_failed_records,
     write_badkeys_tsv,
 )
-from stage4_keys import build_source_lookup_candidates, load_put_keys, normalize_bucket_object_key
+from stage4_concurrency import CONCURRENCY_MODES, AdaptiveConcurrency
+from stage4_precheck import (
+    DEFAULT_PRECHECK_LIST_WORKERS,
+    DESTINATION_PRESENT,
+    DESTINATION_UNKNOWN,
+    PRECHECK_MODES,
+    build_destination_states,
+)
+from stage4_keys import build_source_lookup_candidates, normalize_bucket_object_key
+from stage4_multipart_journal import MULTIPART_JOURNAL_NAME, MultipartJournal
+from stage4_put_index import load_put_index, put_key_hash
+from stage4_resume import (
+    completed_put_mask,
+    list_open_multipart_uploads,
+    list_uploaded_parts,
+    load_resumable_lineage,
+    parse_run_started_at,
+    save_run_state,
+)
+from stage4_schedule import PUT_ORDERS, load_manifest_sizes, order_by_size
+from stage4_shards import (
+    SHARD_SNAPSHOT_INTERVAL_SECONDS,
+    QueueActivityLogger,
+    ShardProgress,
+    merge_shard_journals,
+    shard_indices,
+    split_multipart_journal,
+)
 from lifecycle_controls import is_retention_marker
 
 GLACIER_BUCKET = os.getenv('GLACIER_BUCKET')
@@ -51,6 +81,9 @@ LOCAL_SCRATCH_DIR = os.getenv('LOCAL_SCRATCH_DIR')
 AWS_PROFILE = os.getenv('GLACIER_PROFILE', 'aws-braingeneers-backups')
 DEFAULT_AWS_REGION = 'us-west-2'
 DEFAULT_WORKERS = 2
+DEFAULT_MIN_WORKERS = 1
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_ADAPT_INTERVAL_SECONDS = 30
 DEFAULT_RETRIES = 3
 DEFAULT_RETRY_BASE_SECONDS = 1.5
 DEFAULT_RETRY_MAX_SECONDS = 30.0
@@ -58,6 +91,14 @@ DEFAULT_AWS_MAX_ATTEMPTS = 5
 DEFAULT_AWS_RETRY_MODE = 'standard'
 DEFAULT_AWS_MAX_POOL_CONNECTIONS = 64
 MULTIPART_PART_SIZE_BYTES = 64 * 1024 * 1024
+# Objects at or above the threshold upload as parallel ranged parts; the part
+# size stays small (see docs/multipart_root_cause_analysis.md).
+DEFAULT_PARALLEL_MULTIPART_THRESHOLD_BYTES = 512 * 1024 * 1024
+DEFAULT_PARALLEL_PART_SIZE_BYTES = 8 * 1024 * 1024
+DEFAULT_PARALLEL_PART_CONCURRENCY = 4
+# Journaled uploads older than this are aborted at the end of a run instead of waiting for a later run to resume them.
+DEFAULT_MULTIPART_JOURNAL_MAX_AGE_HOURS = 72.0
+MAX_MULTIPART_PARTS = 10000
 DEFAULT_PROGRESS_INTERVAL_SECONDS = 30
 DEFAULT_PROGRESS_STALL_ALERT_SECONDS = 600
 DEFAULT_MAX_PENDING_TASKS = 256
@@ -86,6 +127,22 @@ def env_float(name, default):
         return default
 
 
+def put_list_counts(file_list):
+    """Row and distinct-key counts of a PUT list, overall and per data/control split."""
+    if hasattr(file_list, 'put_counts'):
+        return file_list.put_counts()
+    data_puts = [key for key in file_list if not is_retention_marker(key)]
+    control_puts = [key for key in file_list if is_retention_marker(key)]
+    return {
+        'rows': len(file_list),
+        'distinct': len(set(file_list)),
+        'data_rows': len(data_puts),
+        'data_distinct': len(set(data_puts)),
+        'control_rows': len(control_puts),
+        'control_distinct': len(set(control_puts)),
+    }
+
+
 def validate_upload_fraction_guard(file_list, comparison_summary_path, max_upload_fraction):
     try:
         with open(comparison_summary_path, 'r', encoding='utf8') as summary_file:
@@ -114,8 +171,9 @@ def validate_upload_fraction_guard(file_list, comparison_summary_path, max_uploa
     if not math.isfinite(float(recorded_fraction)):
         raise UploadFractionGuardError('pending_upload_fraction must be finite')
 
-    actual_rows = len(file_list)
-    actual_distinct = len(set(file_list))
+    counts = put_list_counts(file_list)
+    actual_rows = counts['rows']
+    actual_distinct = counts['distinct']
     if actual_rows != summary['pending_put_rows']:
         raise UploadFractionGuardError(
             f'PUT row count mismatch: summary={summary["pending_put_rows"]} actual={actual_rows}'
@@ -137,12 +195,10 @@ def validate_upload_fraction_guard(file_list, comparison_summary_path, max_uploa
             'pending_control_put_distinct_objects',
         )
     )
-    data_puts = [key for key in file_list if not is_retention_marker(key)]
-    control_puts = [key for key in file_list if is_retention_marker(key)]
-    actual_data_rows = len(data_puts)
-    actual_data_distinct = len(set(data_puts))
-    actual_control_rows = len(control_puts)
-    actual_control_distinct = len(set(control_puts))
+    actual_data_rows = counts['data_rows']
+    actual_data_distinct = counts['data_distinct']
+    actual_control_rows = counts['control_rows']
+    actual_control_distinct = counts['control_distinct']
     if has_control_accounting:
         expected_counts = {
             'pending_data_put_rows': actual_data_rows,
@@ -299,6 +355,7 @@ def stream_upload(
     multipart_part_size_bytes = multipart_part_size_bytes or MULTIPART_PART_SIZE_BYTES
     copy_chunk_bytes = copy_chunk_bytes or COPY_CHUNK_BYTES
     bytes_copied = 0
+    chunk = memoryview(bytearray(copy_chunk_bytes))
 
     with source_opener(source_url, 'rb') as fin, destination_opener(
         destination_url,
@@ -310,17 +367,235 @@ def stream_upload(
         },
     ) as fout:
         while True:
-            data = fin.read(copy_chunk_bytes)
-            if not data:
+            count = read_into(fin, chunk)
+            if not count:
                 break
-            fout.write(data)
-            bytes_copied += len(data)
+            fout.write(chunk[:count])
+            bytes_copied += count
             if progress_callback is not None:
-                progress_callback(len(data))
+                progress_callback(count)
 
     return bytes_copied
 
 
+def read_into(stream, view):
+    """Read up to ``len(view)`` bytes from ``stream`` into ``view`` and return the count (0 at end of stream).
+
+    Streams with ``readinto`` fill the caller's buffer directly; botocore's
+    ``StreamingBody`` has only ``read``, so its chunk is copied in.
+    """
+    readinto = getattr(stream, 'readinto', None)
+    if readinto is not None:
+        return readinto(view) or 0
+    data = stream.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+
+def parallel_part_ranges(size, part_size_bytes):
+    """Return ``(part_number, first_byte, last_byte)`` ranges, growing the part size in MiB steps past 10,000 parts."""
+    part_size = part_size_bytes
+    minimum_part_size = -(-size // MAX_MULTIPART_PARTS)
+    if minimum_part_size > part_size:
+        mib = 1024 * 1024
+        part_size = -(-minimum_part_size // mib) * mib
+    return [
+        (part_number, start, min(size, start + part_size) - 1)
+        for part_number, start in enumerate(range(0, size, part_size), 1)
+    ]
+
+
+def resumable_multipart_upload(s3_client, glacier_bucket, destination_key, head, journal=None):
+    """Return ``(upload_id, stored parts, part size)`` of the journaled upload worth continuing, or ``(None, {}, None)``.
+
+    A journaled upload is continued when the source ETag and size still match
+    and is aborted otherwise.
+    """
+    entry = journal.open_upload(destination_key) if journal is not None else None
+    if entry is None:
+        return None, {}, None
+    size = int(head['ContentLength'])
+    if size > 0 and entry['source_etag'] == head.get('ETag') and entry['size'] == size:
+        try:
+            stored_parts = list_uploaded_parts(s3_client, glacier_bucket, destination_key, entry['upload_id'])
+        except Exception as error:
+            print(
+                f'WARNING: Could not list parts of s3://{glacier_bucket}/{destination_key}; starting over: {error}',
+                file=sys.stderr,
+                flush=True,
+            )
+        else:
+            return entry['upload_id'], stored_parts, entry['part_size']
+    abort_multipart_upload(s3_client, glacier_bucket, destination_key, entry['upload_id'], journal=journal)
+    return None, {}, None
+
+
+def parallel_multipart_upload(
+    source_bucket_key,
+    glacier_bucket,
+    destination_key,
+    s3_client=None,
+    source_s3_client=None,
+    part_size_bytes=None,
+    part_concurrency=None,
+    copy_chunk_bytes=None,
+    progress_callback=None,
+    journal=None,
+):
+    """Upload one object as concurrent ranged GETs from Ceph and explicit UploadPart calls.
+
+    Ranged GETs carry the source ETag in ``IfMatch`` so every part comes from
+    the same object version.  With a ``MultipartJournal`` the upload, each
+    stored part and the outcome are journaled, and a retryable failure leaves
+    the upload open so the next attempt continues after the stored parts;
+    otherwise any failure aborts the upload before the error propagates to
+    ``copy_file``'s retry loop.
+    """
+    s3_client = s3_client or get_s3_client()
+    source_s3_client = source_s3_client or get_source_s3_client()
+    part_size_bytes = part_size_bytes or DEFAULT_PARALLEL_PART_SIZE_BYTES
+    part_concurrency = part_concurrency or DEFAULT_PARALLEL_PART_CONCURRENCY
+    copy_chunk_bytes = copy_chunk_bytes or COPY_CHUNK_BYTES
+    source_bucket, source_object_key = source_bucket_key.split('/', 1)
+
+    try:
+        head = source_s3_client.head_object(Bucket=source_bucket, Key=source_object_key)
+    except BaseException as error:
+        # As for a failed part, only a retryable error keeps the journaled upload open for the next attempt.
+        if journal is not None and isinstance(error, Exception) and not is_retryable_error(error):
+            abort_open_upload(s3_client, glacier_bucket, destination_key, journal=journal)
+        raise
+    size = int(head['ContentLength'])
+    source_etag = head.get('ETag')
+    upload_id, stored_parts, stored_part_size = resumable_multipart_upload(
+        s3_client, glacier_bucket, destination_key, head, journal=journal
+    )
+    part_size_bytes = stored_part_size or part_size_bytes
+    if size == 0:
+        s3_client.put_object(Bucket=glacier_bucket, Key=destination_key, Body=b'')
+        return 0
+
+    part_buffers = threading.local()
+
+    def upload_part(part_number, first_byte, last_byte):
+        get_kwargs = {'Bucket': source_bucket, 'Key': source_object_key, 'Range': f'bytes={first_byte}-{last_byte}'}
+        if source_etag:
+            get_kwargs['IfMatch'] = source_etag
+        body = source_s3_client.get_object(**get_kwargs)['Body']
+        # Each part thread reuses one buffer sized to the first (largest) part; upload_part sends it before
+        # the thread reads its next part.
+        buffer = getattr(part_buffers, 'buffer', None)
+        if buffer is None:
+            buffer = part_buffers.buffer = bytearray(part_ranges[0][2] - part_ranges[0][1] + 1)
+        expected_bytes = last_byte - first_byte + 1
+        part_view = memoryview(buffer)[:expected_bytes]
+        part_bytes = 0
+        while part_bytes < expected_bytes:
+            count = read_into(body, part_view[part_bytes:part_bytes + copy_chunk_bytes])
+            if not count:
+                break
+            part_bytes += count
+            if progress_callback is not None:
+                progress_callback(count)
+        if part_bytes != expected_bytes:
+            raise IOError(
+                f'short ranged read for part {part_number} of s3://{source_bucket_key}: '
+                f'expected {expected_bytes} bytes, got {part_bytes}'
+            )
+        response = s3_client.upload_part(
+            Bucket=glacier_bucket,
+            Key=destination_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            # botocore takes bytearray bodies as they are; only a short last part is copied out.
+            Body=buffer if expected_bytes == len(buffer) else part_view.tobytes(),
+        )
+        if journal is not None:
+            journal.record_part(destination_key, upload_id, part_number, response['ETag'])
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    part_ranges = parallel_part_ranges(size, part_size_bytes)
+    reused_parts = {}
+    for part_number, first_byte, last_byte in part_ranges:
+        stored = stored_parts.get(part_number)
+        if stored is not None and stored['Size'] == last_byte - first_byte + 1:
+            reused_parts[part_number] = {'PartNumber': part_number, 'ETag': stored['ETag']}
+    if upload_id is None:
+        upload_id = s3_client.create_multipart_upload(Bucket=glacier_bucket, Key=destination_key)['UploadId']
+        if journal is not None:
+            journal.record_create(destination_key, upload_id, source_etag, size, part_size_bytes)
+    else:
+        print(
+            (
+                f'[stage4] resuming multipart upload for s3://{glacier_bucket}/{destination_key}: '
+                f'reusing {len(reused_parts)}/{len(part_ranges)} stored parts'
+            ),
+            file=sys.stderr,
+            flush=True,
+        )
+    try:
+        with ThreadPoolExecutor(max_workers=part_concurrency) as executor:
+            futures = {
+                part_range[0]: executor.submit(upload_part, *part_range)
+                for part_range in part_ranges
+                if part_range[0] not in reused_parts
+            }
+            try:
+                parts = [
+                    reused_parts[part_number] if part_number in reused_parts else futures[part_number].result()
+                    for part_number, _, _ in part_ranges
+                ]
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+        s3_client.complete_multipart_upload(
+            Bucket=glacier_bucket,
+            Key=destination_key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+    except BaseException as error:
+        if journal is not None and (not isinstance(error, Exception) or is_retryable_error(error)):
+            print(
+                (
+                    f'[stage4] keeping multipart upload for s3://{glacier_bucket}/{destination_key} open '
+                    f'to resume after: {error}'
+                ),
+                file=sys.stderr,
+                flush=True,
+            )
+        else:
+            abort_multipart_upload(s3_client, glacier_bucket, destination_key, upload_id, journal=journal)
+        raise
+
+    if journal is not None:
+        journal.record_end(destination_key, upload_id, 'complete')
+    return size
+
+
+def abort_multipart_upload(s3_client, glacier_bucket, destination_key, upload_id, journal=None):
+    try:
+        s3_client.abort_multipart_upload(Bucket=glacier_bucket, Key=destination_key, UploadId=upload_id)
+    except Exception as abort_error:
+        print(
+            (
+                f'WARNING: Failed to abort multipart upload {upload_id} for '
+                f's3://{glacier_bucket}/{destination_key}: {abort_error}'
+            ),
+            file=sys.stderr,
+            flush=True,
+        )
+    if journal is not None:
+        journal.record_end(destination_key, upload_id, 'abort')
+
+
+def abort_open_upload(s3_client, glacier_bucket, destination_key, journal=None):
+    """Abort the upload the journal left open for ``destination_key``, if any."""
+    entry = journal.open_upload(destination_key) if journal is not None else None
+    if entry is not None:
+        abort_multipart_upload(s3_client, glacier_bucket, destination_key, entry['upload_id'], journal=journal)
+
+
 def is_retryable_error(error):
     # Invalid request shapes/params will never succeed on retry.
     if isinstance(error, ParamValidationError):
@@ -475,8 +750,12 @@ class ActivityLogger:
 
 
 class ProgressStats:
-    def __init__(self, total_files):
+    def __init__(self, total_files, total_bytes=None):
         self.total_files = total_files
+        # Known from the Stage 3 PUT manifest; completed_planned_bytes counts
+        # every finished file's manifest size, uploaded or not.
+        self.total_bytes = total_bytes
+        self.completed_planned_bytes = 0
         self.start_time = time.monotonic()
         self.last_completion_time = self.start_time
         self.completed = 0
@@ -496,10 +775,11 @@ class ProgressStats:
             self.retry_sleep_seconds += sleep_seconds
             self.retry_error_counts[classify_error(error)] += 1
 
-    def record_completion(self, success, bytes_copied):
+    def record_completion(self, success, bytes_copied, planned_bytes=0):
         now = time.monotonic()
         with self._lock:
             self.completed += 1
+            self.completed_planned_bytes += planned_bytes
             self.last_completion_time = now
             if success:
                 self.success_count += 1
@@ -539,6 +819,8 @@ class ProgressStats:
                 'start_time': self.start_time,
                 'last_completion_time': self.last_completion_time,
                 'total_files': self.total_files,
+                'total_bytes': self.total_bytes,
+                'completed_planned_bytes': self.completed_planned_bytes,
                 'completed': self.completed,
                 'success_count': self.success_count,
                 'failure_count': self.failure_count,
@@ -601,6 +883,14 @@ def progress_reporter(stats, interval_seconds, stop_event, stall_alert_seconds):
                 for row in transfer_rows[:3]
             )
 
+        remaining_label = ''
+        if current['total_bytes'] is not None:
+            remaining_bytes = max(0, current['total_bytes'] - current['completed_planned_bytes'])
+            eta_label = 'unknown'
+            if stream_bytes_delta > 0:
+                eta_label = format_duration(remaining_bytes / (stream_bytes_delta / interval_elapsed))
+            remaining_label = f' remaining={remaining_bytes / (1024 ** 3):.2f}GiB eta={eta_label}'
+
         print(
             (
                 f"[STATUS] elapsed={format_duration(elapsed)} done={current['completed']}/{current['total_files']} "
@@ -612,6 +902,7 @@ def progress_reporter(stats, interval_seconds, stop_event, stall_alert_seconds):
                 f"window_retries={retries_delta} window_retry_sleep={retry_sleep_delta:.1f}s "
                 f"active={active_count} oldest_active={oldest_active_seconds:.0f}s "
                 f"stalled_active={stalled_active_count} top_retry_errors={top_retry_errors_label}"
+                f"{remaining_label}"
             ),
             file=sys.stderr,
             flush=True,
@@ -661,6 +952,12 @@ def copy_file(
     copy_chunk_bytes=None,
     sleep_func=time.sleep,
     uniform_func=random.uniform,
+    source_size=None,
+    parallel_multipart_threshold_bytes=0,
+    parallel_part_size_bytes=None,
+    parallel_part_concurrency=None,
+    destination_exists=None,
+    multipart_journal=None,
 ):
     source_candidates = build_source_lookup_candidates(source_key)
     if not source_candidates:
@@ -677,11 +974,34 @@ def copy_file(
     s3_client = s3_client or get_s3_client()
     multipart_part_size_bytes = multipart_part_size_bytes or MULTIPART_PART_SIZE_BYTES
     copy_chunk_bytes = copy_chunk_bytes or COPY_CHUNK_BYTES
+    # source_size is the Stage 3 manifest size; the parallel path re-reads the length from the source.
+    # An upload journaled as open resumes through the parallel path whatever the size.
+    use_parallel_multipart = (
+        (multipart_journal is not None and multipart_journal.open_upload(source_key) is not None)
+        or (
+            parallel_multipart_threshold_bytes > 0
+            and source_size is not None
+            and source_size >= parallel_multipart_threshold_bytes
+        )
+    )
+
+    # destination_exists comes from the listing precheck; None means HeadObject decides.
+    # A key skipped as present no longer needs the upload an earlier attempt left open.
+    if destination_exists and not is_retention_marker(source_key):
+        abort_open_upload(s3_client, glacier_bucket, source_key, journal=multipart_journal)
+        return {
+            'destination_key': source_key,
+            'resolved_source_key': source_key,
+            'status': 'skipped_existing',
+            'error': None,
+            'bytes_copied': 0,
+        }
 
     for attempt in range(1, total_attempts + 1):
-        if not is_retention_marker(source_key):
+        if destination_exists is None and not is_retention_marker(source_key):
             try:
                 head_object_func(glacier_bucket, source_key, s3_client=s3_client)
+                abort_open_upload(s3_client, glacier_bucket, source_key, journal=multipart_journal)
                 return {
                     'destination_key': source_key,
                     'resolved_source_key': source_key,
@@ -719,16 +1039,30 @@ def copy_file(
             bytes_copied = 0
             stats.record_transfer_start(candidate_source_key)
             try:
-                bytes_copied = stream_upload(
-                    source_url,
-                    destination_url,
-                    source_opener=source_opener,
-                    destination_opener=destination_opener,
-                    s3_client=s3_client,
-                    multipart_part_size_bytes=multipart_part_size_bytes,
-                    copy_chunk_bytes=copy_chunk_bytes,
-                    progress_callback=lambda size: stats.record_transfer_progress(candidate_source_key, size),
-                )
+                if use_parallel_multipart:
+                    bytes_copied = parallel_multipart_upload(
+                        candidate_source_key,
+                        glacier_bucket,
+                        source_key,
+                        s3_client=s3_client,
+                        source_s3_client=source_s3_client,
+                        part_size_bytes=parallel_part_size_bytes,
+                        part_concurrency=parallel_part_concurrency,
+                        copy_chunk_bytes=copy_chunk_bytes,
+                        progress_callback=lambda size: stats.record_transfer_progress(candidate_source_key, size),
+                        journal=multipart_journal,
+                    )
+                else:
+                    bytes_copied = stream_upload(
+                        source_url,
+                        destination_url,
+                        source_opener=source_opener,
+                        destination_opener=destination_opener,
+                        s3_client=s3_client,
+                        multipart_part_size_bytes=multipart_part_size_bytes,
+                        copy_chunk_bytes=copy_chunk_bytes,
+                        progress_callback=lambda size: stats.record_transfer_progress(candidate_source_key, size),
+                    )
 
                 if candidate_source_key != source_key:
                     print(
@@ -796,9 +1130,23 @@ def process_files(
     progress_interval_seconds,
     progress_stall_alert_seconds,
     activity_logger,
+    planned_sizes=None,
+    concurrency=None,
+    adapt_interval_seconds=DEFAULT_ADAPT_INTERVAL_SECONDS,
+    parallel_multipart_threshold_bytes=0,
+    parallel_part_size_bytes=DEFAULT_PARALLEL_PART_SIZE_BYTES,
+    parallel_part_concurrency=DEFAULT_PARALLEL_PART_CONCURRENCY,
+    destination_states=None,
+    multipart_journal=None,
+    multipart_journal_max_age_hours=None,
+    stats=None,
+    report_summary=True,
 ):
     total_files = len(file_list)
-    stats = ProgressStats(total_files=total_files)
+    stats = stats or ProgressStats(
+        total_files=total_files,
+        total_bytes=int(sum(planned_sizes)) if planned_sizes is not None else None,
+    )
     success_count = 0
     already_present_count = 0
     failure_count = 0
@@ -818,9 +1166,21 @@ def process_files(
         progress_thread.start()
 
     try:
+        if concurrency is not None:
+            # The pool is sized for the ceiling; the controller's limit caps in-flight uploads.
+            max_workers = concurrency.max_workers
+            concurrency.update(stats.snapshot())
+            next_adapt_time = time.monotonic() + adapt_interval_seconds
+
+        def submission_limit():
+            return concurrency.limit if concurrency is not None else max_pending_tasks
+
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
             file_iter = iter(file_list)
+            size_iter = iter(planned_sizes) if planned_sizes is not None else None
+            state_iter = iter(destination_states) if destination_states is not None else None
             pending = {}
+            pending_planned_bytes = {}
             completed_count = 0
 
             def submit_next_task():
@@ -829,6 +1189,12 @@ def process_files(
                 except StopIteration:
                     return False
 
+                planned_bytes = int(next(size_iter)) if size_iter is not None else None
+                destination_exists = None
+                if state_iter is not None:
+                    state = next(state_iter)
+                    if state != DESTINATION_UNKNOWN:
+                        destination_exists = state == DESTINATION_PRESENT
                 future = executor.submit(
                     copy_file,
                     source_key,
@@ -837,18 +1203,29 @@ def process_files(
                     retry_base_seconds,
                     retry_max_seconds,
                     stats,
+                    source_size=planned_bytes,
+                    parallel_multipart_threshold_bytes=parallel_multipart_threshold_bytes,
+                    parallel_part_size_bytes=parallel_part_size_bytes,
+                    parallel_part_concurrency=parallel_part_concurrency,
+                    destination_exists=destination_exists,
+                    multipart_journal=multipart_journal,
                 )
                 pending[future] = source_key
+                pending_planned_bytes[future] = planned_bytes or 0
                 return True
 
-            while len(pending) < max_pending_tasks and submit_next_task():
+            while len(pending) < submission_limit() and submit_next_task():
                 pass
 
             while pending:
-                done_futures, _ = wait(pending, return_when=FIRST_COMPLETED)
+                wait_timeout = None
+                if concurrency is not None:
+                    wait_timeout = max(0.0, next_adapt_time - time.monotonic())
+                done_futures, _ = wait(pending, timeout=wait_timeout, return_when=FIRST_COMPLETED)
                 for future in done_futures:
                     completed_count += 1
                     source_key = pending.pop(future, 'unknown')
+                    planned_bytes = pending_planned_bytes.pop(future, 0)
                     try:
                         result = future.result()
                         destination_key = result['destination_key']
@@ -857,7 +1234,11 @@ def process_files(
                         error = result['error']
                         bytes_copied = result['bytes_copied']
                         head_visible_source_key = result.get('head_visible_source_key')
-                        stats.record_completion(success=(status in {'uploaded', 'skipped_existing'}), bytes_copied=bytes_copied)
+                        stats.record_completion(
+                            success=(status in {'uploaded', 'skipped_existing'}),
+                            bytes_copied=bytes_copied,
+                            planned_bytes=planned_bytes,
+                        )
                         if status == 'uploaded':
                             success_count += 1
                             activity_logger.record_event(
@@ -902,22 +1283,245 @@ def process_files(
                     except Exception as error:
                         failure_count += 1
                         failures.append((source_key, error))
-                        stats.record_completion(success=False, bytes_copied=0)
+                        stats.record_completion(
+                            success=False, bytes_copied=0, planned_bytes=planned_bytes
+                        )
                         print(f'Exception occurred for s3://{source_key} - {error}', file=sys.stderr, flush=True)
 
-                while len(pending) < max_pending_tasks and submit_next_task():
+                if concurrency is not None and time.monotonic() >= next_adapt_time:
+                    previous_limit = concurrency.limit
+                    reason = concurrency.update(stats.snapshot())
+                    next_adapt_time = time.monotonic() + adapt_interval_seconds
+                    if concurrency.limit != previous_limit:
+                        print(
+                            (
+                                f'[stage4][concurrency] limit {previous_limit} -> {concurrency.limit} '
+                                f'in_flight={len(pending)} reason={reason}'
+                            ),
+                            file=sys.stderr,
+                            flush=True,
+                        )
+
+                while len(pending) < submission_limit() and submit_next_task():
                     pass
     finally:
         stop_event.set()
         if progress_thread is not None:
             progress_thread.join(timeout=2)
 
+    open_multipart_uploads = 0
+    if multipart_journal is not None:
+        if multipart_journal_max_age_hours is not None:
+            stale_count = abort_stale_multipart_uploads(
+                get_s3_client(), glacier_bucket, multipart_journal, multipart_journal_max_age_hours
+            )
+            if stale_count:
+                print(
+                    (
+                        f'[stage4] aborted {stale_count} journaled multipart upload(s) open for more than '
+                        f'{multipart_journal_max_age_hours:g}h'
+                    ),
+                    file=sys.stderr,
+                    flush=True,
+                )
+        open_multipart_uploads = len(multipart_journal.open_uploads())
+
+    result = {
+        'success_count': success_count,
+        'already_present_count': already_present_count,
+        'failure_count': failure_count,
+        'missing_source_count': missing_source_count,
+        'failures': failures,
+        'missing_sources': missing_sources,
+        'source_access_bad_keys': sorted(set(source_access_bad_keys)),
+        'open_multipart_uploads': open_multipart_uploads,
+    }
+    if report_summary:
+        print_run_summary(result, stats.snapshot())
+    return result
+
+
+def run_put_shard(
+    shard,
+    queue,
+    puts_file,
+    positions,
+    planned_sizes,
+    destination_states,
+    multipart_journal_file,
+    process_options,
+    concurrency_options,
+):
+    """Upload one ``--processes`` shard in a spawned process, reporting rows, snapshots and the result over ``queue``."""
+    try:
+        put_index = load_put_index(puts_file)
+        stats = ProgressStats(
+            total_files=len(positions),
+            total_bytes=int(sum(planned_sizes)) if planned_sizes is not None else None,
+        )
+        concurrency = AdaptiveConcurrency(**concurrency_options) if concurrency_options is not None else None
+        multipart_journal = MultipartJournal(multipart_journal_file)
+        stop_event = threading.Event()
+
+        def send_snapshots():
+            while not stop_event.wait(SHARD_SNAPSHOT_INTERVAL_SECONDS):
+                queue.put(('progress', shard, stats.snapshot()))
+
+        snapshot_thread = threading.Thread(target=send_snapshots, daemon=True)
+        snapshot_thread.start()
+        try:
+            result = process_files(
+                file_list=put_index.ordered(positions),
+                activity_logger=QueueActivityLogger(queue),
+                planned_sizes=planned_sizes,
+                concurrency=concurrency,
+                destination_states=destination_states,
+                multipart_journal=multipart_journal,
+                stats=stats,
+                report_summary=False,
+                progress_interval_seconds=0,
+                **process_options,
+            )
+        finally:
+            stop_event.set()
+            snapshot_thread.join()
+            multipart_journal.close()
+            put_index.close()
+        queue.put(('progress', shard, stats.snapshot()))
+        # Exceptions such as botocore's ClientError do not survive pickling; the summary only prints them.
+        result['failures'] = [(key, str(error)) for key, error in result['failures']]
+        result['missing_sources'] = [(key, str(error)) for key, error in result['missing_sources']]
+        queue.put(('result', shard, result))
+    except BaseException as error:
+        queue.put(('error', shard, f'{type(error).__name__}: {error}'))
+        raise
+
+
+def process_files_sharded(
+    processes,
+    puts_file,
+    put_index,
+    positions,
+    activity_logger,
+    multipart_journal_file,
+    process_options,
+    planned_sizes=None,
+    concurrency_options=None,
+    destination_states=None,
+    progress_interval_seconds=DEFAULT_PROGRESS_INTERVAL_SECONDS,
+    progress_stall_alert_seconds=DEFAULT_PROGRESS_STALL_ALERT_SECONDS,
+    shard_func=run_put_shard,
+):
+    """Run ``process_files`` over ``processes`` key-hash shards of ``positions`` and merge their results.
+
+    ``shard_func`` is the spawned process target and must be importable by the child.
+    """
+
+    def shard_of_key(key):
+        return put_key_hash(key) % processes
+
+    shards = shard_indices(put_index.entries['hash'][positions], processes)
+    journal_paths = split_multipart_journal(multipart_journal_file, processes, shard_of_key)
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    progress = ShardProgress(
+        total_files=len(positions),
+        total_bytes=int(sum(planned_sizes)) if planned_sizes is not None else None,
+        clock=time.monotonic,
+    )
+    stop_event = threading.Event()
+    progress_thread = None
+    if progress_interval_seconds > 0:
+        progress_thread = threading.Thread(
+            target=progress_reporter,
+            args=(progress, progress_interval_seconds, stop_event, progress_stall_alert_seconds),
+            daemon=True,
+        )
+        progress_thread.start()
+
+    workers = []
+    results = {}
+    errors = {}
+    try:
+        for shard, indices in enumerate(shards):
+            worker = context.Process(
+                target=shard_func,
+                args=(
+                    shard,
+                    queue,
+                    puts_file,
+                    positions[indices],
+                    planned_sizes[indices] if planned_sizes is not None else None,
+                    destination_states[indices] if destination_states is not None else None,
+                    journal_paths[shard],
+                    process_options,
+                    concurrency_options,
+                ),
+                name=f'stage4-shard-{shard}',
+            )
+            worker.start()
+            workers.append(worker)
+            print(f'[stage4][shards] shard={shard} pid={worker.pid} puts={len(indices)}', file=sys.stderr, flush=True)
+
+        while len(results) + len(errors) < processes:
+            try:
+                message = queue.get(timeout=1.0)
+            except queue_module.Empty:
+                for shard, worker in enumerate(workers):
+                    if worker.exitcode not in (None, 0) and shard not in results:
+                        errors.setdefault(shard, f'exited with code {worker.exitcode}')
+                continue
+            kind, payload = message[0], message[1:]
+            if kind == 'activity':
+                activity_logger.record_event(*payload[0])
+            elif kind == 'progress':
+                progress.update(*payload)
+            elif kind == 'result':
+                results[payload[0]] = payload[1]
+            elif kind == 'error':
+                errors[payload[0]] = payload[1]
+        for worker in workers:
+            worker.join()
+    finally:
+        stop_event.set()
+        if progress_thread is not None:
+            progress_thread.join(timeout=2)
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        merge_shard_journals(multipart_journal_file)
+
+    result = {
+        'success_count': 0,
+        'already_present_count': 0,
+        'failure_count': 0,
+        'missing_source_count': 0,
+        'failures': [],
+        'missing_sources': [],
+        'source_access_bad_keys': [],
+        'open_multipart_uploads': 0,
+    }
+    for shard_result in results.values():
+        for name, value in shard_result.items():
+            result[name] += value
+    result['source_access_bad_keys'] = sorted(set(result['source_access_bad_keys']))
+    print_run_summary(result, progress.snapshot())
+    if errors:
+        raise RuntimeError(
+            'Stage 4 shard processes failed: '
+            + '; '.join(f'shard {shard}: {message}' for shard, message in sorted(errors.items()))
+        )
+    return result
+
+
+def print_run_summary(result, snapshot):
     print('\nSummary:')
-    print(f'  Successes: {success_count}')
-    print(f'  Already present skipped: {already_present_count}')
-    print(f'  Missing sources skipped: {missing_source_count}')
-    print(f'  Failures: {failure_count}')
-    snapshot = stats.snapshot()
+    print(f'  Successes: {result["success_count"]}')
+    print(f'  Already present skipped: {result["already_present_count"]}')
+    print(f'  Missing sources skipped: {result["missing_source_count"]}')
+    print(f'  Failures: {result["failure_count"]}')
+    print(f'  Multipart uploads left open: {result["open_multipart_uploads"]}')
     elapsed = max(0.0, snapshot['now'] - snapshot['start_time'])
     average_mib_per_sec = ((snapshot['success_bytes'] / (1024 * 1024)) / elapsed) if elapsed > 0 else 0.0
     print(f'  Retries: {snapshot["retry_count"]}')
@@ -930,17 +1534,17 @@ def process_files(
         for name, count in top_retry_errors:
             print(f'    - {name}: {count}')
 
-    if failure_count > 0:
+    if result['failure_count'] > 0:
         print('\nFailed Files:')
-        for source_key, error in failures:
+        for source_key, error in result['failures']:
             print(f'  s3://{source_key} - {error}', file=sys.stderr)
 
-    if missing_source_count > 0:
+    if result['missing_source_count'] > 0:
         print('\nSkipped Missing Source Files:')
-        for source_key, error in missing_sources:
+        for source_key, error in result['missing_sources']:
             print(f'  s3://{source_key} - {error}', file=sys.stderr)
 
-    source_access_bad_key_count = len(set(source_access_bad_keys))
+    source_access_bad_key_count = len(result['source_access_bad_keys'])
     if source_access_bad_key_count > 0:
         print(
             (
@@ -950,7 +1554,7 @@ def process_files(
             file=sys.stderr,
         )
 
-    if failure_count > 0 or missing_source_count > 0:
+    if result['failure_count'] > 0 or result['missing_source_count'] > 0:
         print(
             (
                 '\nStage 4 completed with recoverable per-file issues. '
@@ -962,14 +1566,6 @@ def process_files(
     else:
         print('\nStage 4 completed cleanly.', flush=True)
 
-    return {
-        'success_count': success_count,
-        'already_present_count': already_present_count,
-        'failure_count': failure_count,
-        'missing_source_count': missing_source_count,
-        'source_access_bad_keys': sorted(set(source_access_bad_keys)),
-    }
-
 
 def split_s3_uri(uri):
     parsed = urlparse(uri)
@@ -1038,6 +1634,72 @@ def update_source_access_artifacts(source_access_bad_keys, source_s3_client=None
             )
 
 
+def abort_stale_multipart_uploads(s3_client, glacier_bucket, multipart_journal, max_age_hours, now=None):
+    """Abort journaled open uploads created more than ``max_age_hours`` ago, or at an unknown time; return the count."""
+    cutoff = (time.time() if now is None else now) - max_age_hours * 3600
+    aborted = 0
+    for key, entry in multipart_journal.open_uploads().items():
+        try:
+            created_at = parse_run_started_at(entry['created_at_utc']).timestamp()
+        except (TypeError, ValueError):
+            created_at = None
+        if created_at is not None and created_at > cutoff:
+            continue
+        abort_multipart_upload(s3_client, glacier_bucket, key, entry['upload_id'], journal=multipart_journal)
+        aborted += 1
+    return aborted
+
+
+def reconcile_open_multipart_uploads(
+    s3_client, glacier_bucket, run_started_at_utc, put_index, completed_puts, multipart_journal=None
+):
+    """Abort the lineage's open uploads of PUT keys that completed, or that the journal does not own.
+
+    Only journaled uploads resume (``resumable_multipart_upload``); anything else
+    left open, such as an interrupted smart_open stream, restarts from scratch.
+    Returns the number of journaled uploads kept for resuming.
+    """
+    open_uploads = list_open_multipart_uploads(s3_client, glacier_bucket, parse_run_started_at(run_started_at_utc))
+    journaled = 0
+    aborted_completed = 0
+    aborted_unjournaled = 0
+    for key, upload_id in open_uploads:
+        key_positions = put_index.positions(key)
+        if not key_positions:
+            continue
+        entry = multipart_journal.open_upload(key) if multipart_journal is not None else None
+        if completed_puts[key_positions].any():
+            aborted_completed += 1
+        elif entry is not None and entry['upload_id'] == upload_id:
+            journaled += 1
+            continue
+        else:
+            aborted_unjournaled += 1
+        abort_multipart_upload(s3_client, glacier_bucket, key, upload_id, journal=multipart_journal)
+    print(
+        (
+            f'[stage4][resume] open_multipart_uploads={len(open_uploads)} journaled={journaled} '
+            f'aborted_completed={aborted_completed} aborted_unjournaled={aborted_unjournaled}'
+        ),
+        file=sys.stderr,
+        flush=True,
+    )
+    return journaled
+
+
+def load_put_sizes_for_order(put_index, manifest_path):
+    """Return PUT sizes aligned with ``put_index``, or None (with a warning) when the manifest cannot order every PUT."""
+    try:
+        return load_manifest_sizes(manifest_path, put_index)
+    except (OSError, csv.Error, UnicodeDecodeError, ValueError) as error:
+        print(
+            f'WARNING: PUT manifest {manifest_path} unusable ({error}); shuffling PUTs instead.',
+            file=sys.stderr,
+            flush=True,
+        )
+        return None
+
+
 def main():
     parser = argparse.ArgumentParser(description='Copy S3 files to Glacier bucket with parallel processing.')
     parser.add_argument(
@@ -1047,6 +1709,15 @@ def main():
         default=DEFAULT_WORKERS,
         help=f'Number of worker threads (default: {DEFAULT_WORKERS})',
     )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=env_int('STAGE4_PROCESSES', 1),
+        help=(
+            'Shard PUTs by key hash across this many worker processes, each with its own clients and '
+            '--workers threads; the parent writes activity.log and merges progress (default: 1)'
+        ),
+    )
     parser.add_argument(
         '--retries',
         type=int,
@@ -1093,6 +1764,123 @@ def main():
             f'(default: {DEFAULT_MAX_PENDING_TASKS})'
         ),
     )
+    parser.add_argument(
+        '--concurrency',
+        choices=CONCURRENCY_MODES,
+        default=os.getenv('STAGE4_CONCURRENCY', 'fixed'),
+        help=(
+            'fixed runs --workers uploads at once; adaptive starts at --workers and adjusts between '
+            '--min-workers and --max-workers (grow while throughput improves, halve on SlowDown/Throttling '
+            'retries or stalled streams) (default: fixed)'
+        ),
+    )
+    parser.add_argument(
+        '--min-workers',
+        type=int,
+        default=env_int('STAGE4_MIN_WORKERS', DEFAULT_MIN_WORKERS),
+        help=f'Lower bound for adaptive concurrency (default: {DEFAULT_MIN_WORKERS})',
+    )
+    parser.add_argument(
+        '--max-workers',
+        type=int,
+        default=env_int('STAGE4_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+        help=f'Upper bound for adaptive concurrency (default: {DEFAULT_MAX_WORKERS})',
+    )
+    parser.add_argument(
+        '--adapt-interval-seconds',
+        type=int,
+        default=env_int('STAGE4_ADAPT_INTERVAL_SECONDS', DEFAULT_ADAPT_INTERVAL_SECONDS),
+        help=(
+            'Window over which adaptive concurrency measures throughput before adjusting; a stream idle for '
+            f'two windows counts as stalled (default: {DEFAULT_ADAPT_INTERVAL_SECONDS})'
+        ),
+    )
+    parser.add_argument(
+        '--parallel-multipart-threshold-mib',
+        type=int,
+        default=env_int(
+            'STAGE4_PARALLEL_MULTIPART_THRESHOLD_MIB', DEFAULT_PARALLEL_MULTIPART_THRESHOLD_BYTES // (1024 * 1024)
+        ),
+        help=(
+            'Upload objects at least this large (per the PUT manifest) as concurrent ranged parts; '
+            f'0 disables (default: {DEFAULT_PARALLEL_MULTIPART_THRESHOLD_BYTES // (1024 * 1024)})'
+        ),
+    )
+    parser.add_argument(
+        '--parallel-part-size-mib',
+        type=int,
+        default=env_int('STAGE4_PARALLEL_PART_SIZE_MIB', DEFAULT_PARALLEL_PART_SIZE_BYTES // (1024 * 1024)),
+        help=(
+            'UploadPart body size for parallel multipart uploads '
+            f'(default: {DEFAULT_PARALLEL_PART_SIZE_BYTES // (1024 * 1024)})'
+        ),
+    )
+    parser.add_argument(
+        '--parallel-part-concurrency',
+        type=int,
+        default=env_int('STAGE4_PARALLEL_PART_CONCURRENCY', DEFAULT_PARALLEL_PART_CONCURRENCY),
+        help=f'Concurrent parts per parallel multipart upload (default: {DEFAULT_PARALLEL_PART_CONCURRENCY})',
+    )
+    parser.add_argument(
+        '--destination-precheck',
+        choices=PRECHECK_MODES,
+        default=os.getenv('STAGE4_DESTINATION_PRECHECK', 'head'),
+        help=(
+            'head sends HeadObject before every data upload; listing first resolves whole PUT directories from '
+            'the Glacier inventory and ListObjectsV2, keeping HeadObject for keys it cannot vouch for (default: head)'
+        ),
+    )
+    parser.add_argument(
+        '--glacier-inventory',
+        default=os.getenv('STAGE4_GLACIER_INVENTORY') or None,
+        help='Glacier inventory CSV for the listing precheck (default: glacier_inventory.csv beside puts.txt)',
+    )
+    parser.add_argument(
+        '--precheck-list-workers',
+        type=int,
+        default=env_int('STAGE4_PRECHECK_LIST_WORKERS', DEFAULT_PRECHECK_LIST_WORKERS),
+        help=f'Concurrent ListObjectsV2 directory listings for the listing precheck (default: {DEFAULT_PRECHECK_LIST_WORKERS})',
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        default=os.getenv('STAGE4_RESUME', '0') == '1',
+        help=(
+            'Continue the last run over the same puts.txt: skip keys its activity.log rows record as uploaded or '
+            'already present, and resume the multipart uploads it left open'
+        ),
+    )
+    parser.add_argument(
+        '--multipart-journal',
+        default=os.getenv('STAGE4_MULTIPART_JOURNAL') or None,
+        help=(
+            'Journal of open explicit multipart uploads and their stored parts, so a failed or interrupted upload '
+            f'continues from its last stored part (default: {MULTIPART_JOURNAL_NAME} beside puts.txt)'
+        ),
+    )
+    parser.add_argument(
+        '--multipart-journal-max-age-hours',
+        type=float,
+        default=env_float('STAGE4_MULTIPART_JOURNAL_MAX_AGE_HOURS', DEFAULT_MULTIPART_JOURNAL_MAX_AGE_HOURS),
+        help=(
+            'Abort journaled multipart uploads still open at the end of a run that were created more than this many '
+            f'hours ago; 0 aborts every one (default: {DEFAULT_MULTIPART_JOURNAL_MAX_AGE_HOURS:g})'
+        ),
+    )
+    parser.add_argument(
+        '--put-order',
+        choices=PUT_ORDERS,
+        default=os.getenv('STAGE4_PUT_ORDER', 'size'),
+        help=(
+            'Order of PUTs: by size from the Stage 3 PUT manifest (largest first, interleaved with the smallest), '
+            'or a random shuffle; size falls back to shuffle without a complete manifest (default: size)'
+        ),
+    )
+    parser.add_argument(
+        '--puts-manifest',
+        default=os.getenv('STAGE4_PUTS_MANIFEST') or None,
+        help='Stage 3 PUT manifest with per-key sizes (default: puts-manifest.csv beside puts.txt)',
+    )
     parser.add_argument(
         '--comparison-summary',
         default=None,
@@ -1108,6 +1896,8 @@ def main():
 
     if args.workers < 1:
         parser.error('--workers must be >= 1')
+    if args.processes < 1:
+        parser.error('--processes must be >= 1')
     if args.retries < 0:
         parser.error('--retries must be >= 0')
     if args.retry_base_seconds <= 0:
@@ -1120,6 +1910,22 @@ def main():
         parser.error('--progress-stall-alert-seconds must be >= 0')
     if args.max_pending_tasks < args.workers:
         parser.error('--max-pending-tasks must be >= --workers')
+    if args.multipart_journal_max_age_hours < 0:
+        parser.error('--multipart-journal-max-age-hours must be >= 0')
+    if args.parallel_multipart_threshold_mib < 0:
+        parser.error('--parallel-multipart-threshold-mib must be >= 0')
+    if args.parallel_part_size_mib < 5:
+        parser.error('--parallel-part-size-mib must be >= 5 (the S3 minimum part size)')
+    if args.parallel_part_concurrency < 1:
+        parser.error('--parallel-part-concurrency must be >= 1')
+    if args.precheck_list_workers < 1:
+        parser.error('--precheck-list-workers must be >= 1')
+    if args.min_workers < 1:
+        parser.error('--min-workers must be >= 1')
+    if args.max_workers < args.min_workers:
+        parser.error('--max-workers must be >= --min-workers')
+    if args.adapt_interval_seconds <= 0:
+        parser.error('--adapt-interval-seconds must be > 0')
     if (args.comparison_summary is None) != (args.max_upload_fraction is None):
         parser.error('--comparison-summary and --max-upload-fraction must be provided together')
     if args.max_upload_fraction is not None and not 0 <= args.max_upload_fraction <= 1:
@@ -1128,7 +1934,7 @@ def main():
     puts_file = os.path.join(LOCAL_SCRATCH_DIR, 'puts.txt')
     activity_log_file = os.path.join(LOCAL_SCRATCH_DIR, 'activity.log')
     try:
-        file_list = load_put_keys(puts_file)
+        put_index = load_put_index(puts_file)
     except Exception as error:
         print(
             (
@@ -1142,7 +1948,7 @@ def main():
 
     if args.comparison_summary is not None:
         try:
-            validate_upload_fraction_guard(file_list, args.comparison_summary, args.max_upload_fraction)
+            validate_upload_fraction_guard(put_index, args.comparison_summary, args.max_upload_fraction)
         except UploadFractionGuardError as error:
             print(
                 f'Fatal stage4 upload-fraction guard: {error}',
@@ -1150,52 +1956,178 @@ def main():
                 flush=True,
             )
             sys.exit(EXIT_STAGE4_UPLOAD_FRACTION_GUARD)
-    random.shuffle(file_list)
+    rng = np.random.default_rng()
+    planned_sizes = None
+    put_order = 'shuffle'
+    if args.put_order == 'size':
+        manifest_path = args.puts_manifest or os.path.join(LOCAL_SCRATCH_DIR, 'puts-manifest.csv')
+        put_sizes = load_put_sizes_for_order(put_index, manifest_path)
+        if put_sizes is not None:
+            positions = order_by_size(put_sizes, rng)
+            planned_sizes = put_sizes[positions]
+            put_order = 'size'
+    if put_order == 'shuffle':
+        positions = rng.permutation(len(put_index))
+    run_started_at_utc = utc_now_iso()
+    resume_lineage = None
+    completed_puts = None
+    if args.resume:
+        resume_lineage = load_resumable_lineage(activity_log_file, puts_file)
+        if resume_lineage is None:
+            print(
+                '[stage4][resume] no earlier run recorded for this puts.txt; starting a new run',
+                file=sys.stderr,
+                flush=True,
+            )
+        else:
+            run_started_at_utc = resume_lineage
+            completed_puts = completed_put_mask(activity_log_file, resume_lineage, put_index)
+            remaining = ~completed_puts[positions]
+            positions = positions[remaining]
+            if planned_sizes is not None:
+                planned_sizes = planned_sizes[remaining]
+            print(
+                (
+                    f'[stage4][resume] run_started_at_utc={resume_lineage} '
+                    f'completed={int(np.count_nonzero(~remaining))} remaining={len(positions)}'
+                ),
+                file=sys.stderr,
+                flush=True,
+            )
+
+    concurrency = None
+    concurrency_options = None
+    concurrency_label = 'fixed'
+    if args.concurrency == 'adaptive':
+        concurrency_options = {
+            'initial_workers': args.workers,
+            'min_workers': args.min_workers,
+            'max_workers': args.max_workers,
+            'stall_seconds': 2 * args.adapt_interval_seconds,
+        }
+        concurrency = AdaptiveConcurrency(**concurrency_options)
+        concurrency_label = (
+            f'adaptive(start={concurrency.limit}, min={args.min_workers}, max={args.max_workers}, '
+            f'interval={args.adapt_interval_seconds}s)'
+        )
 
     aws_max_attempts = env_int('STAGE4_AWS_MAX_ATTEMPTS', DEFAULT_AWS_MAX_ATTEMPTS)
     aws_retry_mode = os.getenv('STAGE4_AWS_RETRY_MODE', DEFAULT_AWS_RETRY_MODE)
     aws_max_pool_connections = env_int('STAGE4_AWS_MAX_POOL_CONNECTIONS', DEFAULT_AWS_MAX_POOL_CONNECTIONS)
     aws_region = os.getenv('STAGE4_AWS_REGION') or boto3.Session(profile_name=AWS_PROFILE or None).region_name or DEFAULT_AWS_REGION
-    run_started_at_utc = utc_now_iso()
+    save_run_state(activity_log_file, puts_file, run_started_at_utc)
+    multipart_journal_file = args.multipart_journal or os.path.join(LOCAL_SCRATCH_DIR, MULTIPART_JOURNAL_NAME)
     activity_logger = ActivityLogger(activity_log_file, run_started_at_utc)
+    # Keys with a journaled open upload take the parallel path whatever the threshold.
+    if args.parallel_multipart_threshold_mib > 0:
+        upload_paths = (
+            f'smart_open_multipart<{args.parallel_multipart_threshold_mib}MiB,'
+            f'parallel_multipart>={args.parallel_multipart_threshold_mib}MiB'
+        )
+    else:
+        upload_paths = 'smart_open_multipart,parallel_multipart=journaled_resumes_only'
 
     print(
         (
             'Stage 4 config: '
-            f'workers={args.workers}, retries={args.retries}, '
+            f'processes={args.processes}, workers={args.workers}, retries={args.retries}, '
             f'retry_base_seconds={args.retry_base_seconds}, retry_max_seconds={args.retry_max_seconds}, '
             f'max_pending_tasks={args.max_pending_tasks}, '
             f'aws_max_attempts={aws_max_attempts}, aws_retry_mode={aws_retry_mode}, '
             f'aws_max_pool_connections={aws_max_pool_connections}, aws_region={aws_region}, '
-            'upload_path=smart_open_multipart_only, '
+            f'upload_paths={upload_paths}, '
             f'multipart_part_size_bytes={MULTIPART_PART_SIZE_BYTES}, '
             f'copy_chunk_bytes={COPY_CHUNK_BYTES}, '
-            'destination_exists_precheck=head_object, '
+            f"destination_exists_precheck={'head_object' if args.destination_precheck == 'head' else 'listing'}, "
             f'activity_log={activity_log_file}, '
+            f'multipart_journal={multipart_journal_file}, '
+            f'multipart_journal_max_age_hours={args.multipart_journal_max_age_hours:g}, '
             f'progress_interval_seconds={args.progress_interval_seconds}, '
             f'progress_stall_alert_seconds={args.progress_stall_alert_seconds}, '
-            'shuffle_puts_order=true'
+            f'put_order={put_order}, '
+            f'resume={resume_lineage is not None}, '
+            f'concurrency={concurrency_label}, '
+            f'parallel_multipart_threshold_mib={args.parallel_multipart_threshold_mib}, '
+            f'parallel_part_size_mib={args.parallel_part_size_mib}, '
+            f'parallel_part_concurrency={args.parallel_part_concurrency}'
         ),
         flush=True,
     )
 
     try:
+        multipart_journal = None
         try:
-            process_result = process_files(
-                file_list=file_list,
-                glacier_bucket=GLACIER_BUCKET,
-                max_workers=args.workers,
-                max_pending_tasks=args.max_pending_tasks,
-                retries=args.retries,
-                retry_base_seconds=args.retry_base_seconds,
-                retry_max_seconds=args.retry_max_seconds,
-                progress_interval_seconds=args.progress_interval_seconds,
-                progress_stall_alert_seconds=args.progress_stall_alert_seconds,
-                activity_logger=activity_logger,
-            )
+            # Shard journals left by an interrupted --processes run fold back before anything reads the journal.
+            merge_shard_journals(multipart_journal_file)
+            multipart_journal = MultipartJournal(multipart_journal_file)
+            if resume_lineage is not None:
+                reconcile_open_multipart_uploads(
+                    get_s3_client(), GLACIER_BUCKET, resume_lineage, put_index, completed_puts, multipart_journal
+                )
+            destination_states = None
+            if args.destination_precheck == 'listing':
+                inventory_path = args.glacier_inventory or os.path.join(LOCAL_SCRATCH_DIR, 'glacier_inventory.csv')
+                states, precheck_summary = build_destination_states(
+                    put_index,
+                    GLACIER_BUCKET,
+                    get_s3_client(),
+                    inventory_path=inventory_path,
+                    list_workers=args.precheck_list_workers,
+                )
+                destination_states = states[positions]
+                print(
+                    '[stage4][precheck] ' + ' '.join(f'{name}={value}' for name, value in precheck_summary.items()),
+                    file=sys.stderr,
+                    flush=True,
+                )
+            process_options = {
+                'glacier_bucket': GLACIER_BUCKET,
+                'max_workers': args.workers,
+                'max_pending_tasks': args.max_pending_tasks,
+                'retries': args.retries,
+                'retry_base_seconds': args.retry_base_seconds,
+                'retry_max_seconds': args.retry_max_seconds,
+                'progress_stall_alert_seconds': args.progress_stall_alert_seconds,
+                'adapt_interval_seconds': args.adapt_interval_seconds,
+                'parallel_multipart_threshold_bytes': args.parallel_multipart_threshold_mib * 1024 * 1024,
+                'parallel_part_size_bytes': args.parallel_part_size_mib * 1024 * 1024,
+                'parallel_part_concurrency': args.parallel_part_concurrency,
+                'multipart_journal_max_age_hours': args.multipart_journal_max_age_hours,
+            }
+            if args.processes > 1:
+                # Each shard process journals its own keys; the parent's journal hands them over.
+                multipart_journal.close()
+                multipart_journal = None
+                process_result = process_files_sharded(
+                    processes=args.processes,
+                    puts_file=puts_file,
+                    put_index=put_index,
+                    positions=positions,
+                    activity_logger=activity_logger,
+                    multipart_journal_file=multipart_journal_file,
+                    process_options=process_options,
+                    planned_sizes=planned_sizes,
+                    concurrency_options=concurrency_options,
+                    destination_states=destination_states,
+                    progress_interval_seconds=args.progress_interval_seconds,
+                    progress_stall_alert_seconds=args.progress_stall_alert_seconds,
+                )
+            else:
+                process_result = process_files(
+                    file_list=put_index.ordered(positions),
+                    progress_interval_seconds=args.progress_interval_seconds,
+                    activity_logger=activity_logger,
+                    planned_sizes=planned_sizes,
+                    concurrency=concurrency,
+                    destination_states=destination_states,
+                    multipart_journal=multipart_journal,
+                    **process_options,
+                )
             update_source_access_artifacts(process_result.get('source_access_bad_keys', []))
         finally:
             activity_logger.close()
+            if multipart_journal is not None:
+                multipart_journal.close()
     except Exception as error:
         print(
             f'Fatal stage4 runtime error: {type(error).__name__}: {error}',
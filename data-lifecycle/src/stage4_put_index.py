@@ -0,0 +1,180 @@
+"""Memory-mapped index of the Stage 4 PUT list.
+
+``load_put_keys`` holds every normalized key of ``puts.txt`` as a Python
+string.  ``PutIndex`` keeps, per line, only the byte range of the key in the
+memory-mapped ``puts.txt``, a 64-bit hash of the normalized key and whether
+it is a retention marker: 25 bytes per PUT in one structured array, saved as
+``puts.txt.index.npy`` and memory-mapped again while ``puts.txt`` is
+unchanged.  Keys are decoded and normalized when they are iterated, and the
+upload-fraction guard counts distinct keys from the hashes.
+"""
+
+import csv
+import hashlib
+import json
+import mmap
+import os
+import sys
+from array import array
+
+import numpy as np
+
+from lifecycle_controls import is_retention_marker
+from stage4_keys import malformed_put_keys_error, normalize_put_key
+
+PUT_INDEX_SCHEMA_VERSION = 1
+PUT_INDEX_DTYPE = np.dtype([('start', '<i8'), ('end', '<i8'), ('hash', '<u8'), ('control', '?')])
+PUT_INDEX_SUFFIX = '.index.npy'
+PUT_INDEX_MANIFEST_SUFFIX = '.index.json'
+
+
+def put_key_hash(key):
+    digest = hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def parse_put_line(line):
+    """Return the raw key on one ``puts.txt`` line, as ``load_put_keys`` reads it; None for a blank line."""
+
+    text = line.decode('utf8').rstrip('\n')
+    if text.endswith('\r'):
+        text = text[:-1]
+    if not text:
+        return None
+    if '"' in text:
+        return ','.join(next(csv.reader([text]))).strip()
+    return text.strip()
+
+
+class PutIndex:
+    def __init__(self, puts_file, entries):
+        self.puts_file = puts_file
+        self.entries = entries
+        self._hash_order = None
+        self._sorted_hashes = None
+        self._file = open(puts_file, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    @classmethod
+    def build(cls, puts_file):
+        """Index ``puts_file``, failing fast on malformed keys like ``load_put_keys``."""
+
+        starts, ends, hashes, control = array('q'), array('q'), array('Q'), array('b')
+        malformed = []
+        with open(puts_file, 'rb') as file_handle:
+            position = 0
+            for line_no, line in enumerate(file_handle, 1):
+                start, position = position, position + len(line)
+                raw_key = parse_put_line(line)
+                if raw_key is None:
+                    continue
+                key = normalize_put_key(raw_key)
+                if key is None:
+                    malformed.append((line_no, raw_key))
+                    continue
+                starts.append(start)
+                ends.append(position)
+                hashes.append(put_key_hash(key))
+                control.append(is_retention_marker(key))
+        if malformed:
+            raise malformed_put_keys_error(puts_file, malformed)
+
+        entries = np.empty(len(starts), dtype=PUT_INDEX_DTYPE)
+        entries['start'] = np.frombuffer(starts, dtype=np.int64)
+        entries['end'] = np.frombuffer(ends, dtype=np.int64)
+        entries['hash'] = np.frombuffer(hashes, dtype=np.uint64)
+        entries['control'] = np.frombuffer(control, dtype=np.int8).astype(bool)
+        return cls(puts_file, entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, position):
+        entry = self.entries[position]
+        return normalize_put_key(parse_put_line(self._map[int(entry['start']):int(entry['end'])]))
+
+    def ordered(self, positions):
+        return PutSequence(self, positions)
+
+    def positions(self, key):
+        """Return the positions holding normalized ``key``."""
+
+        if self._hash_order is None:
+            self._hash_order = np.argsort(self.entries['hash'], kind='stable')
+            self._sorted_hashes = self.entries['hash'][self._hash_order]
+        key_hash = np.uint64(put_key_hash(key))
+        start = np.searchsorted(self._sorted_hashes, key_hash)
+        end = np.searchsorted(self._sorted_hashes, key_hash, side='right')
+        return [int(position) for position in self._hash_order[start:end] if self.key(position) == key]
+
+    def put_counts(self):
+        """Row and distinct-key counts for the upload-fraction guard, overall and per data/control split."""
+
+        hashes = self.entries['hash']
+        control = self.entries['control']
+        data_hashes, control_hashes = hashes[~control], hashes[control]
+        return {
+            'rows': int(len(hashes)),
+            'distinct': int(len(np.unique(hashes))),
+            'data_rows': int(len(data_hashes)),
+            'data_distinct': int(len(np.unique(data_hashes))),
+            'control_rows': int(len(control_hashes)),
+            'control_distinct': int(len(np.unique(control_hashes))),
+        }
+
+    def save(self):
+        index_path = f'{self.puts_file}{PUT_INDEX_SUFFIX}'
+        np.save(index_path, self.entries, allow_pickle=False)
+        with open(f'{self.puts_file}{PUT_INDEX_MANIFEST_SUFFIX}', 'w', encoding='utf8') as manifest_file:
+            json.dump(put_index_fingerprint(self.puts_file), manifest_file, sort_keys=True)
+            manifest_file.write('\n')
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+
+class PutSequence:
+    """PUT keys of ``index`` in ``positions`` order, decoded as they are iterated."""
+
+    def __init__(self, index, positions):
+        self.index = index
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return (self.index.key(position) for position in self.positions)
+
+
+def put_index_fingerprint(puts_file):
+    stat = os.stat(puts_file)
+    return {
+        'schema_version': PUT_INDEX_SCHEMA_VERSION,
+        'source_bytes': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+    }
+
+
+def load_put_index(puts_file):
+    """Return the saved index of ``puts_file`` when it is current, else build and save a new one."""
+
+    try:
+        with open(f'{puts_file}{PUT_INDEX_MANIFEST_SUFFIX}', 'r', encoding='utf8') as manifest_file:
+            saved = json.load(manifest_file)
+        if saved == put_index_fingerprint(puts_file):
+            entries = np.load(f'{puts_file}{PUT_INDEX_SUFFIX}', mmap_mode='r', allow_pickle=False)
+            if entries.dtype == PUT_INDEX_DTYPE:
+                return PutIndex(puts_file, entries)
+    except (OSError, ValueError):
+        pass
+
+    index = PutIndex.build(puts_file)
+    try:
+        index.save()
+    except OSError as error:
+        print(f'WARNING: could not save the PUT index for {puts_file}: {error}', file=sys.stderr, flush=True)
+    return index
@@ -0,0 +1,100 @@
+"""Resuming an interrupted Stage 4 run.
+
+Every run records its ``RunStartedAtUTC`` and the SHA-256 of ``puts.txt``
+in ``activity.log.run.json``.  With ``--resume``, a run against a
+``puts.txt`` with the same content continues that lineage, even when Stage 3
+rewrote the file in between: it keeps the original
+``RunStartedAtUTC`` for new activity rows, streams ``activity.log`` into a
+per-position mask of keys the lineage already uploaded or found present,
+and schedules only the rest.  Multipart uploads the lineage left open are
+found with ``ListMultipartUploads``; those the multipart journal owns resume
+through ``parallel_multipart_upload``, which keeps the parts already stored.
+The others, and uploads left open for keys that have since completed, are
+aborted.
+"""
+
+import csv
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from stage4_keys import normalize_put_key
+
+RUN_STATE_SUFFIX = '.run.json'
+RESUMABLE_RESULTS = frozenset({'uploaded', 'already_present_skipped'})
+HASH_READ_BYTES = 8 * 1024 * 1024
+
+
+def puts_content_sha256(puts_file):
+    digest = hashlib.sha256()
+    with open(puts_file, 'rb') as stream:
+        for block in iter(lambda: stream.read(HASH_READ_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_run_state(activity_log_file, puts_file, run_started_at_utc):
+    with open(f'{activity_log_file}{RUN_STATE_SUFFIX}', 'w', encoding='utf8') as state_file:
+        json.dump(
+            {'run_started_at_utc': run_started_at_utc, 'puts_sha256': puts_content_sha256(puts_file)},
+            state_file,
+            sort_keys=True,
+        )
+        state_file.write('\n')
+
+
+def load_resumable_lineage(activity_log_file, puts_file):
+    """Return the ``RunStartedAtUTC`` of the last run over a ``puts.txt`` with this content, or None."""
+
+    try:
+        with open(f'{activity_log_file}{RUN_STATE_SUFFIX}', 'r', encoding='utf8') as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        return None
+    if state.get('puts_sha256') != puts_content_sha256(puts_file):
+        return None
+    return state.get('run_started_at_utc') or None
+
+
+def completed_put_mask(activity_log_file, run_started_at_utc, put_index):
+    """Return a mask of ``put_index`` positions the lineage already uploaded or found present."""
+
+    completed = np.zeros(len(put_index), dtype=bool)
+    if not os.path.exists(activity_log_file):
+        return completed
+    with open(activity_log_file, 'r', encoding='utf8', newline='') as log_file:
+        for row in csv.DictReader(log_file):
+            if row.get('RunStartedAtUTC') != run_started_at_utc or row.get('Result') not in RESUMABLE_RESULTS:
+                continue
+            key = normalize_put_key(row.get('BucketKey'))
+            if key is not None:
+                completed[put_index.positions(key)] = True
+    return completed
+
+
+def parse_run_started_at(run_started_at_utc):
+    return datetime.strptime(run_started_at_utc, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+
+
+def list_open_multipart_uploads(s3_client, glacier_bucket, initiated_since):
+    """Return ``(key, upload_id)`` for every multipart upload initiated at or after ``initiated_since``."""
+
+    uploads = []
+    for page in s3_client.get_paginator('list_multipart_uploads').paginate(Bucket=glacier_bucket):
+        for upload in page.get('Uploads', ()):
+            if upload['Initiated'] >= initiated_since:
+                uploads.append((upload['Key'], upload['UploadId']))
+    return uploads
+
+
+def list_uploaded_parts(s3_client, glacier_bucket, key, upload_id):
+    """Return ``{part number: {'ETag', 'Size'}}`` for the parts an open multipart upload already stores."""
+
+    parts = {}
+    for page in s3_client.get_paginator('list_parts').paginate(Bucket=glacier_bucket, Key=key, UploadId=upload_id):
+        for part in page.get('Parts', ()):
+            parts[part['PartNumber']] = {'ETag': part['ETag'], 'Size': part['Size']}
+    return parts
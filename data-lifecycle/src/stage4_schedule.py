@@ -0,0 +1,59 @@
+"""Size-aware ordering of the Stage 4 PUT list.
+
+Stage 3 writes ``puts-manifest.csv`` beside ``puts.txt`` with each PUT's
+size, effective ``LastModified`` and atomic group.  With those sizes Stage 4
+starts the largest objects first, so no multi-GB upload is left running alone
+at the end of the run, and follows each large object with the smallest one
+left, so completions (and destination prechecks) keep flowing while the large
+transfers stream.  Objects of equal size keep a random order.
+
+Both files are written from the same PUT rows in the same order, so sizes are
+read into an array aligned with the ``PutIndex`` positions and orders are
+arrays of positions rather than lists of keys.
+"""
+
+import csv
+
+import numpy as np
+
+from stage4_keys import normalize_put_key
+from stage4_put_index import put_key_hash
+
+PUT_ORDERS = ('size', 'shuffle')
+
+
+def load_manifest_sizes(manifest_path, put_index):
+    """Return PUT sizes aligned with ``put_index`` positions.
+
+    Raises ValueError when the manifest does not list the indexed keys in the
+    same order.
+    """
+
+    hashes = put_index.entries['hash']
+    sizes = np.zeros(len(hashes), dtype=np.int64)
+    rows = 0
+    with open(manifest_path, 'r', encoding='utf8', newline='') as manifest_file:
+        for position, row in enumerate(csv.DictReader(manifest_file)):
+            key = normalize_put_key(row.get('BucketKey'))
+            if position >= len(hashes) or key is None or put_key_hash(key) != hashes[position]:
+                raise ValueError(f'manifest row {position + 2} does not match puts.txt line order')
+            try:
+                sizes[position] = int(row.get('Size') or 0)
+            except ValueError:
+                sizes[position] = 0
+            rows += 1
+    if rows != len(hashes):
+        raise ValueError(f'manifest lists {rows} of {len(hashes)} PUT keys')
+    return sizes
+
+
+def order_by_size(sizes, rng):
+    """Return positions largest first, each large object followed by the smallest remaining one."""
+
+    shuffled = rng.permutation(len(sizes))
+    by_size = shuffled[np.argsort(-sizes[shuffled], kind='stable')]
+    ordered = np.empty(len(by_size), dtype=np.int64)
+    half = (len(by_size) + 1) // 2
+    ordered[0::2] = by_size[:half]
+    ordered[1::2] = by_size[half:][::-1]
+    return ordered
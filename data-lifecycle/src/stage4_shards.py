@@ -0,0 +1,132 @@
+"""Process-pool sharding of Stage 4 uploads.
+
+With ``--processes N`` the scheduled PUTs are split by ``PutIndex`` key hash
+modulo ``N``, so a key (and every duplicate row of it) always lands in the
+same shard, in the order Stage 4 scheduled it.  Each shard runs in its own
+spawned process with its own boto3 clients, thread pool and concurrency
+controller.
+
+Shard processes report back over one queue.  The parent is the only writer
+of ``activity.log``, merges the shards' ``ProgressStats`` snapshots into the
+``[STATUS]`` lines, and prints one summary for the run.  Each shard keeps its
+explicit multipart uploads in its own journal file, split from and merged
+back into the main journal by ``split_multipart_journal`` and
+``merge_shard_journals``.
+"""
+
+import glob
+import os
+import threading
+from collections import Counter
+
+import numpy as np
+
+from stage4_multipart_journal import MultipartJournal
+
+SHARD_SNAPSHOT_INTERVAL_SECONDS = 1.0
+SHARD_JOURNAL_INFIX = '.shard-'
+
+
+def shard_indices(key_hashes, processes):
+    """Return, per shard, the indices into ``key_hashes`` it owns, in their original order."""
+
+    shards = np.asarray(key_hashes, dtype=np.uint64) % np.uint64(processes)
+    return [np.flatnonzero(shards == shard) for shard in range(processes)]
+
+
+def shard_journal_path(journal_path, shard):
+    return f'{journal_path}{SHARD_JOURNAL_INFIX}{shard}'
+
+
+def merge_shard_journals(journal_path):
+    """Fold the open uploads of every shard journal into the main journal and delete the shard files."""
+
+    shard_paths = sorted(glob.glob(f'{glob.escape(journal_path)}{SHARD_JOURNAL_INFIX}*'))
+    if not shard_paths:
+        return
+    journal = MultipartJournal(journal_path)
+    try:
+        for shard_path in shard_paths:
+            shard_journal = MultipartJournal(shard_path)
+            for key, entry in shard_journal.open_uploads().items():
+                journal.adopt(key, entry)
+            shard_journal.close()
+            os.unlink(shard_path)
+    finally:
+        journal.close()
+
+
+def split_multipart_journal(journal_path, processes, shard_of_key):
+    """Move the main journal's open uploads into per-shard journals; return the shard journal paths."""
+
+    journal = MultipartJournal(journal_path)
+    open_uploads = journal.open_uploads()
+    shard_paths = [shard_journal_path(journal_path, shard) for shard in range(processes)]
+    shard_journals = [MultipartJournal(path) for path in shard_paths]
+    for key, entry in open_uploads.items():
+        shard_journals[shard_of_key(key)].adopt(key, entry)
+    for shard_journal in shard_journals:
+        shard_journal.close()
+    # A shard journal's entry replaces the main one's when they are merged back, so a crash here loses nothing.
+    journal.clear()
+    journal.close()
+    return shard_paths
+
+
+class QueueActivityLogger:
+    """``ActivityLogger`` stand-in for shard processes: rows go to the parent, which writes them."""
+
+    def __init__(self, queue):
+        self._queue = queue
+
+    def record_event(self, bucket_key, uploaded_bucket_key, bytes_copied, glacier_bucket, result):
+        self._queue.put(('activity', (bucket_key, uploaded_bucket_key, bytes_copied, glacier_bucket, result)))
+
+
+class ShardProgress:
+    """Merges the latest ``ProgressStats`` snapshot of each shard; ``progress_reporter`` reads it like stats.
+
+    Elapsed time counts from the parent's start, so shard start-up shows as time without progress.
+    """
+
+    def __init__(self, total_files, total_bytes, clock):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self._clock = clock
+        self._start_time = clock()
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def update(self, shard, snapshot):
+        with self._lock:
+            self._snapshots[shard] = snapshot
+
+    def snapshot(self):
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+        merged = {
+            'now': self._clock(),
+            'start_time': self._start_time,
+            'last_completion_time': max(
+                (snapshot['last_completion_time'] for snapshot in snapshots), default=self._start_time
+            ),
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'retry_error_counts': Counter(),
+            'active_transfers': {},
+        }
+        for name in (
+            'completed_planned_bytes',
+            'completed',
+            'success_count',
+            'failure_count',
+            'success_bytes',
+            'stream_bytes',
+            'retry_count',
+            'retry_sleep_seconds',
+        ):
+            merged[name] = sum(snapshot[name] for snapshot in snapshots)
+        for snapshot in snapshots:
+            merged['retry_error_counts'].update(snapshot['retry_error_counts'])
+            merged['active_transfers'].update(snapshot['active_transfers'])
+        return merged